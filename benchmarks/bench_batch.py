@@ -0,0 +1,95 @@
+"""
+Benchmark of SceneBatchEvaluator. Run from the repository's folder: python benchmarks/bench_batch.py
+
+A 3-node graph (value -> double -> square) is evaluated over 20000 records:
+- record by record, setting the value node's content and evaluating the graph with SceneEvaluator each time;
+- as one batch, with nodes evaluated row by row (evalImplementation);
+- as one batch, with vectorized nodes (evalBatch).
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from node_node import Node
+from node_edge import Edge
+from node_scene import Scene
+
+
+class ValueNode(Node):
+    eval_cacheable = False
+
+    def evalImplementation(self, input_values):
+        return [self.content_data['value']]
+
+
+class DoubleNode(Node):
+    eval_cacheable = False
+
+    def evalImplementation(self, input_values):
+        return [input_values[0] * 2]
+
+
+class SquareNode(Node):
+    eval_cacheable = False
+
+    def evalImplementation(self, input_values):
+        return [input_values[0] ** 2]
+
+
+class VectorDoubleNode(DoubleNode):
+    eval_vectorized = True
+
+    def evalBatch(self, input_values, size):
+        return [[value * 2 for value in input_values[0]]]
+
+
+class VectorSquareNode(SquareNode):
+    eval_vectorized = True
+
+    def evalBatch(self, input_values, size):
+        return [[value ** 2 for value in input_values[0]]]
+
+
+def makeGraph(double_type, square_type):
+    scene = Scene(headless=True)
+    value = ValueNode(scene, "value", outputs=[1])
+    value.content_data['value'] = 0
+    double = double_type(scene, "double", inputs=[1], outputs=[1])
+    square = square_type(scene, "square", inputs=[1], outputs=[1])
+    Edge(scene, value.outputs[0], double.inputs[0])
+    Edge(scene, double.outputs[0], square.inputs[0])
+    return scene, value, square
+
+
+def benchRecords(records):
+    scene, value, square = makeGraph(DoubleNode, SquareNode)
+    started = time.perf_counter()
+    results = []
+    for record in records:
+        value.content_data['value'] = record
+        value.markDirty()
+        results.append(scene.evaluator.evaluate([square])[0][0])
+    return time.perf_counter() - started, results
+
+
+def benchBatch(records, vectorized):
+    scene, value, square = makeGraph(*((VectorDoubleNode, VectorSquareNode) if vectorized else (DoubleNode, SquareNode)))
+    started = time.perf_counter()
+    results = scene.batch_evaluator.evaluate([square], {value: records})[0][0]
+    return time.perf_counter() - started, results
+
+
+if __name__ == '__main__':
+    records = list(range(20000))
+    by_record, expected = benchRecords(records)
+    by_row, results = benchBatch(records, vectorized=False)
+    assert results == expected
+    vectorized, results = benchBatch(records, vectorized=True)
+    assert results == expected
+
+    print("3-node graph over %d records" % len(records))
+    print("  record by record   %.3f s" % by_record)
+    print("  batch, row by row  %.3f s  (%.1fx)" % (by_row, by_record / by_row))
+    print("  batch, vectorized  %.3f s  (%.1fx)" % (vectorized, by_record / vectorized))
@@ -4,7 +4,13 @@ from node_serializable import Serializable
 
 
 class QDMNodeContentWidget(QWidget, Serializable):
-    """ Widget that goes inside the node and contains elements such as labels, inputs... """
+    """
+    Widget that goes inside the node and contains elements such as labels, inputs...
+    It's only created while the node is in view (see QDMGraphicsNode.showContent), so its state is kept in the node
+    (Node.content_data) through serialize() and deserialize() when the widget is released.
+    """
+
+    default_text = "foo"
     
     def __init__(self, node, parent=None):
         super().__init__(parent)
@@ -21,7 +27,13 @@ class QDMNodeContentWidget(QWidget, Serializable):
 
         self.wdg_label = QLabel("Some Title")
         self.layout.addWidget(self.wdg_label)
-        self.layout.addWidget(QDMTextEdit("foo"))
+        self.wdg_text = QDMTextEdit(self.default_text)
+        self.wdg_text.textChanged.connect(self.onContentChanged)
+        self.layout.addWidget(self.wdg_text)
+
+    def onContentChanged(self):
+        """ The node's content is one of its inputs, so the node has to be evaluated again """
+        self.node.markDirty()
 
     def setEditingFlag(self, value):
         self.node.scene.grScene.views()[0].editingFlag = value
@@ -30,12 +42,19 @@ class QDMNodeContentWidget(QWidget, Serializable):
     def serialize(self):
         """ Returns the node content's properties as a dict for easy serialization """
         return OrderedDict([
-
+            ('text', self.wdg_text.toPlainText()),
         ])
 
 
-    def deserialize(self, data, hashmap={}):
-        return False
+    def deserialize(self, data, hashmap=None):
+        """ Restores the widget's state. Missing values are reset to their defaults, since widgets get reused. """
+        text = data.get('text', self.default_text)
+        if (text != self.wdg_text.toPlainText()):
+            # Restoring the node's own state (or reusing the widget for another node) doesn't change the node
+            self.wdg_text.blockSignals(True)
+            self.wdg_text.setPlainText(text)
+            self.wdg_text.blockSignals(False)
+        return True
 
 
 
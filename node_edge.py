@@ -20,12 +20,15 @@ class Edge(Serializable):
 
         self._start_socket = None
         self._end_socket = None
+        self._edge_type = None
+        self.grEdge = None      # Only if the scene has graphics (see initUI)
 
         self.start_socket = start_socket
         self.end_socket = end_socket
         self.edge_type = edge_type
 
         self.scene.addEdge(self)
+        self.scene.history.recordEdgeAdded(self)
 
 
     def __str__(self):
@@ -74,10 +77,26 @@ class Edge(Serializable):
 
     @edge_type.setter
     def edge_type(self, value):
-        if hasattr(self, 'grEdge') and self.grEdge is not None:
+        old_type = self._edge_type
+        self._edge_type = value
+        if (self.scene.grScene is None): return
+
+        # The graphics item only needs to be replaced if the type changes
+        if (self.grEdge is None or value != old_type):
+            self.initUI()
+
+        if self.start_socket is not None:
+            if self.scene.grScene.bulk_loading:
+                self.scene.grScene.markEdgesDirty([self])   # Positioned once all the nodes are in place
+            else:
+                self.updatePositions()
+
+
+    def initUI(self):
+        """ Creates the graphics item of the edge (or replaces it), depending on the edge's type """
+        if self.grEdge is not None:
             self.scene.grScene.removeItem(self.grEdge)
 
-        self._edge_type = value
         if self.edge_type == EDGE_TYPE_DIRECT:
             self.grEdge = QDMGraphicsEdgeDirect(self)
         elif self.edge_type == EDGE_TYPE_BEZIER:
@@ -87,9 +106,6 @@ class Edge(Serializable):
 
         self.scene.grScene.addItem(self.grEdge)
 
-        if self.start_socket is not None:
-            self.updatePositions()
-
 
     def updatePositions(self):
         
@@ -108,6 +124,16 @@ class Edge(Serializable):
         
         self.grEdge.update()
 
+        # Keep the spatial index up to date, so that the cutline can find the edge
+        self.scene.edge_index.updateEdge(self, self.grEdge.boundingRect())
+
+
+    def markInputDirty(self):
+        """ Marks the node of the input socket of the edge dirty. Edges being dragged don't connect anything yet. """
+        if (self.start_socket is None or self.end_socket is None): return
+        for socket in (self.start_socket, self.end_socket):
+            if socket.isInput(): socket.node.markDirty()
+
 
     def remove_from_sockets(self):
         self.end_socket = None
@@ -117,12 +143,18 @@ class Edge(Serializable):
     def remove(self):
         if DEBUG: print("# Removing Edge", self)
 
+        self.scene.history.recordEdgeRemoved(self)
+
         if DEBUG: print(" - remove edge from all sockets")
         self.remove_from_sockets()
 
+        if DEBUG: print(" - remove edge from the spatial index")
+        self.scene.edge_index.removeEdge(self)
+
         if DEBUG: print(" - remove grEdge")
-        self.scene.grScene.removeItem(self.grEdge)
-        self.grEdge = None
+        if (self.grEdge is not None):
+            self.scene.grScene.removeItem(self.grEdge)
+            self.grEdge = None
 
         if DEBUG: print(" - remove edge from scene")
         try:
@@ -143,9 +175,20 @@ class Edge(Serializable):
         ])
 
 
-    def deserialize(self, data, hashmap={}, restore_id=True):
-        """ Given json-serialized data about the edge, deserialize it and load it """
-        if restore_id: self.id = data['id']
-        self.start_socket = hashmap[data['start']]
-        self.end_socket = hashmap[data['end']]
+    def deserialize(self, data, hashmap=None, restore_id=True):
+        """
+        Given json-serialized data about the edge, deserialize it and load it.
+        Sockets are looked up in the hashmap (ids in the data -> new sockets) if given, or else by id in the scene.
+        """
+        if restore_id:
+            self.scene.removeEdge(self)
+            self.id = data['id']
+            self.scene.addEdge(self)
+
+        if hashmap is not None:
+            self.start_socket = hashmap[data['start']]
+            self.end_socket = hashmap[data['end']]
+        else:
+            self.start_socket = self.scene.getSocketById(data['start'])
+            self.end_socket = self.scene.getSocketById(data['end'])
         self.edge_type = data['edge_type']
\ No newline at end of file
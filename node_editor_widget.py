@@ -46,6 +46,9 @@ class NodeEditorWidget(QWidget):
         edge1 = Edge(self.scene, node1.outputs[0], node2.inputs[0], edge_type=EDGE_TYPE_BEZIER)
         edge2 = Edge(self.scene, node2.outputs[0], node3.inputs[0], edge_type=EDGE_TYPE_BEZIER)
 
+        # Sample nodes are the starting point of the scene, not something that can be undone
+        self.scene.history.clear()
+
 
 
     def loadStylesheet(self, filename):
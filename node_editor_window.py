@@ -16,6 +16,7 @@ class NodeEditorWindow(QMainWindow):
         super().__init__()
 
         self.filename = None # Holds name of the loaded file, for when we want to save it again
+        self.save_future = None # Last save, being written in the background (see SceneSaver.save)
 
         self.initUI()
 
@@ -62,6 +63,9 @@ class NodeEditorWindow(QMainWindow):
         self.status_mouse_pos = QLabel("")
         self.statusBar().addPermanentWidget(self.status_mouse_pos)
         nodeeditor.view.scenePosChanged.connect(self.onScenePosChanged)
+        nodeeditor.scene.saver.saveStarted.connect(self.onSaveStarted)
+        nodeeditor.scene.saver.saveFinished.connect(self.onSaveFinished)
+        nodeeditor.scene.saver.saveFailed.connect(self.onSaveFailed)
 
         # Set window properties
         self.setGeometry(200, 200, 800, 600)
@@ -89,6 +93,8 @@ class NodeEditorWindow(QMainWindow):
         If user clicks cancel, the window does not close.
         """
         if (self.maybeSave()):
+            self.centralWidget().scene.saver.wait()     # Don't quit while a file is half written
+            self.centralWidget().scene.scheduler.shutdown()
             event.accept()
         else:
             event.ignore()
@@ -111,7 +117,8 @@ class NodeEditorWindow(QMainWindow):
                 QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel)
 
         if (res == QMessageBox.Save):
-            return self.onFileSave()
+            # The scene is about to be replaced or closed, so the file has to be written first
+            return self.onFileSave() and self.waitForSave()
         elif (res == QMessageBox.Cancel):
             return False
 
@@ -122,10 +129,24 @@ class NodeEditorWindow(QMainWindow):
         self.status_mouse_pos.setText("Scene Pos: [%d, %d]" % (x, y))
 
 
+    def onSaveStarted(self, filename, autosave):
+        self.statusBar().showMessage("%s %s..." % ("Autosaving" if autosave else "Saving", filename))
+
+
+    def onSaveFinished(self, filename, autosave):
+        self.statusBar().showMessage("Successfully %s %s" % ("autosaved" if autosave else "saved", filename))
+
+
+    def onSaveFailed(self, filename, autosave, error):
+        self.statusBar().showMessage("Could not %s %s: %s" % ("autosave" if autosave else "save", filename, error))
+        self.changeTitle()
+
+
     def onFileNew(self):
         """ Asks to save any unsaved changes, then clears the scene """
         if (self.maybeSave()):
             self.centralWidget().scene.clear()
+            self.centralWidget().scene.saver.filename = None
             self.filename = None
             self.changeTitle()
 
@@ -136,16 +157,36 @@ class NodeEditorWindow(QMainWindow):
             fname, filter = QFileDialog.getOpenFileName(self, 'Open graph from file')
             if (fname == ''): return
             if os.path.isfile(fname):
-                self.centralWidget().scene.loadFromFile(fname)
+                try:
+                    self.centralWidget().scene.loadFromFile(fname)
+                except Exception as e:
+                    # The scene may have been emptied, so it mustn't be saved over the file it was loaded from
+                    QMessageBox.critical(self, "Could not open", "%s could not be opened:\n%s" % (fname, e))
+                    self.centralWidget().scene.saver.filename = None
+                    self.filename = None
+                    self.changeTitle()
+                    return
                 self.filename = fname
                 self.changeTitle()
 
 
     def onFileSave(self):
-        """ Saves scene under the same filename it was opened from, without asking for confirmation """
+        """
+        Saves scene under the same filename it was opened from, without asking for confirmation.
+        The file is written in the background, the status bar shows when it's done.
+        """
         if (self.filename is None): return self.onFileSaveAs()
-        self.centralWidget().scene.saveToFile(self.filename)
-        self.statusBar().showMessage("Successfully saved %s" % self.filename)
+        self.save_future = self.centralWidget().scene.saver.save(self.filename)
+        return True
+
+
+    def waitForSave(self):
+        """ Blocks until the last save is written. If it failed, tells the user and returns False. """
+        try:
+            self.save_future.result()
+        except Exception as e:
+            QMessageBox.critical(self, "Could not save", "The document could not be saved:\n%s" % e)
+            return False
         return True
 
 
@@ -1,9 +1,10 @@
 from PySide6.QtWidgets import QGraphicsPathItem, QGraphicsItem
-from PySide6.QtCore import Qt, QPointF
+from PySide6.QtCore import Qt, QPointF, QLineF
 from PySide6.QtGui import QColor, QPen, QPainterPath
 
 import math
 from node_socket import RIGHT_TOP, RIGHT_BOTTOM, LEFT_BOTTOM, LEFT_TOP
+from node_graphics_scene import DETAIL_LOW
 
 
 EDGE_CP_ROUNDNESS = 100
@@ -36,28 +37,45 @@ class QDMGraphicsEdge(QGraphicsPathItem):
         self.posSource = [0, 0]
         self.posDestination = [200, 100]
 
+        # Geometry is only calculated again when the source or destination change (see getPath)
+        self._path = None
+        self._bounding_rect = None
+
 
     def setSource(self, x, y):
         """ Sets the coordinates of the start point """
+        if (self.posSource == [x, y]): return
+        self.prepareGeometryChange()
         self.posSource = [x, y]
+        self._path = None
 
     def setDestination(self, x, y):
         """ Sets the coordinates of the end point """
+        if (self.posDestination == [x, y]): return
+        self.prepareGeometryChange()
         self.posDestination = [x, y]
+        self._path = None
+
+
+    def getPath(self):
+        """ Returns the edge's QPainterPath, which is only calculated again after the edge has changed """
+        if (self._path is None):
+            self._path = self.calcPath()
+            self._bounding_rect = self._path.boundingRect()
+        return self._path
 
     
     def boundingRect(self):
-        return self.shape().boundingRect()
+        self.getPath()
+        return self._bounding_rect
 
     
     def shape(self):
-        return self.calcPath()
+        return self.getPath()
 
 
     def paint(self, painter, QStyleOptionGraphicsItem, widget=None):
         """ Overrides QGraphicsPathItem.paint(). Called whenever the edge is redrawn. """
-        self.setPath(self.calcPath())
-
         if (self.edge.end_socket is None):  # If edge has no end socket, it means it's being dragged
             painter.setPen(self._pen_dragging)
         elif (self.isSelected()):
@@ -66,14 +84,19 @@ class QDMGraphicsEdge(QGraphicsPathItem):
             painter.setPen(self._pen)
 
         painter.setBrush(Qt.NoBrush)
-        painter.drawPath(self.path())
+
+        # Zoomed out far: just a straight line
+        if (self.scene().detail_level == DETAIL_LOW):
+            painter.drawLine(QLineF(*self.posSource, *self.posDestination))
+            return
+
+        painter.drawPath(self.getPath())
 
 
     def intersectsWith(self, p1, p2):
         cutpath = QPainterPath(p1)
         cutpath.lineTo(p2)
-        path = self.calcPath()
-        return cutpath.intersects(path)
+        return cutpath.intersects(self.getPath())
 
 
     def calcPath(self):
@@ -1,22 +1,28 @@
 from PySide6.QtWidgets import QGraphicsItem, QGraphicsTextItem, QGraphicsProxyWidget
 from PySide6.QtCore import Qt, QRectF
 from PySide6.QtGui import QPen, QBrush, QFont, QColor, QPainterPath
+from node_graphics_scene import DETAIL_LOW, DETAIL_MEDIUM, DETAIL_HIGH
+from node_content_widget import QDMNodeContentWidget
 
 
 class QDMGraphicsNode(QGraphicsItem):
     """ Node that we can place on the scene. Consists of a box with a title, its contents, sockets to connect to other nodes, etc. """
 
+    # Paths of the title, body and outline, shared by all nodes with the same size (see getChromePaths)
+    _chrome_paths_cache = {}
+
+    # Default size of nodes
+    width = 180
+    height = 240
+
     def __init__(self, node, parent=None):
         super().__init__(parent)
 
         self.node = node
-        self.content = self.node.content
 
         self._title_color = Qt.white
         self._title_font = QFont("Ubuntu", 10)
 
-        self.width = 180
-        self.height = 240
         self.edge_size = 10.0
         self.title_height = 24.0
         self._padding = 4.0
@@ -37,6 +43,7 @@ class QDMGraphicsNode(QGraphicsItem):
         # Init content
         self.initContent()
 
+        self.setPos(*self.node._pos)    # Before initUI(), so that it's not recorded as a move
         self.initUI()
         
         self.wasMoved = False
@@ -44,13 +51,8 @@ class QDMGraphicsNode(QGraphicsItem):
 
     def mouseMoveEvent(self, event):
         """ Overrides parent's method. Called whenever the node is dragged. """
+        # Moves all selected nodes. Each one of them marks its edges to be updated (see itemChange).
         super().mouseMoveEvent(event)
-        
-        # Make edges redraw so that they remain connected to their sockets as the node moves around
-        # TODO: optimize me
-        for node in self.scene().scene.nodes:
-            if node.grNode.isSelected():
-                node.updateConnectedEdges()
 
         self.wasMoved = True
 
@@ -61,6 +63,7 @@ class QDMGraphicsNode(QGraphicsItem):
 
         if (self.wasMoved):
             self.wasMoved = False
+            self.scene().updateDirtyEdges()
             self.node.scene.history.storeHistory("Node moved", setModified=True)
 
 
@@ -75,6 +78,38 @@ class QDMGraphicsNode(QGraphicsItem):
         self.title_item.setPlainText(self._title)
 
 
+    def getChromePaths(self):
+        """
+        Returns the (already simplified) paths of the title, the body and the outline of the node.
+        They only depend on the node's size, so they're built once and shared by all nodes with the same size.
+        """
+        key = (self.width, self.height, self.title_height, self.edge_size)
+        paths = QDMGraphicsNode._chrome_paths_cache.get(key)
+        if paths is not None: return paths
+
+        # Title
+        path_title = QPainterPath()
+        path_title.setFillRule(Qt.WindingFill)
+        path_title.addRoundedRect(0,0, self.width, self.title_height, self.edge_size, self.edge_size)
+        path_title.addRect(0, self.title_height - self.edge_size, self.edge_size, self.edge_size)
+        path_title.addRect(self.width - self.edge_size, self.title_height - self.edge_size, self.edge_size, self.edge_size)
+
+        # Content
+        path_content = QPainterPath()
+        path_content.setFillRule(Qt.WindingFill)
+        path_content.addRoundedRect(0, self.title_height, self.width, self.height - self.title_height, self.edge_size, self.edge_size)
+        path_content.addRect(0, self.title_height, self.edge_size, self.edge_size)
+        path_content.addRect(self.width - self.edge_size, self.title_height, self.edge_size, self.edge_size)
+
+        # Outline
+        path_outline = QPainterPath()
+        path_outline.addRoundedRect(0, 0, self.width, self.height, self.edge_size, self.edge_size)
+
+        paths = (path_title.simplified(), path_content.simplified(), path_outline.simplified())
+        QDMGraphicsNode._chrome_paths_cache[key] = paths
+        return paths
+
+
     def boundingRect(self):
         """ Reimplementation of QGraphicsItem.boundingRect(). Needed by Qt to know when to redraw the node. """
         return QRectF(0, 0, self.width, self.height).normalized()
@@ -83,6 +118,31 @@ class QDMGraphicsNode(QGraphicsItem):
     def initUI(self):
         self.setFlag(QGraphicsItem.ItemIsSelectable)
         self.setFlag(QGraphicsItem.ItemIsMovable)
+        self.setFlag(QGraphicsItem.ItemSendsGeometryChanges)    # So that itemChange() gets called when the node moves
+
+
+    def itemChange(self, change, value):
+        """
+        Overrides parent's method. Lets the undo/redo history know the position of a node before it moves,
+        and marks the node's edges to be redrawn once it has moved, so that they remain connected to its sockets.
+        """
+        if (change == QGraphicsItem.ItemPositionChange):
+            self.node.scene.history.recordNodeMoved(self.node)
+        elif (change == QGraphicsItem.ItemPositionHasChanged):
+            self.node._pos = (value.x(), value.y())
+            if (self.scene() is not None): self.scene().markEdgesDirty(self.node.getConnectedEdges())
+        elif (change == QGraphicsItem.ItemSceneHasChanged and self.scene() is not None):
+            self.updateDetailLevel()
+        return super().itemChange(change, value)
+
+
+    def updateDetailLevel(self):
+        """ Shows or hides the title, sockets and contents depending on the scene's level of detail """
+        level = self.scene().detail_level
+        self.title_item.setVisible(level > DETAIL_LOW)
+        if (self.grContent is not None): self.grContent.setVisible(level > DETAIL_MEDIUM)
+        for socket in (self.node.inputs + self.node.outputs):
+            socket.grSocket.setVisible(level > DETAIL_LOW)
 
 
     def initTitle(self):
@@ -95,10 +155,50 @@ class QDMGraphicsNode(QGraphicsItem):
 
 
     def initContent(self):
-        self.grContent = QGraphicsProxyWidget(self)
-        self.content.setGeometry(self.edge_size, self.title_height + self.edge_size,
-                                 self.width - 2*self.edge_size, self.height - 2*self.edge_size-self.title_height)
-        self.grContent.setWidget(self.content)
+        """ The content widget is only created when the node is in view at a readable zoom (see showContent) """
+        self.grContent = None
+
+
+    def showContent(self, grContent=None):
+        """
+        Embeds a content widget in the node, with the state stored in the node.
+        grContent can be a proxy (with its content widget) that was released by another node, to be reused.
+        """
+        if (self.grContent is not None): return
+
+        if (grContent is None):
+            grContent = QGraphicsProxyWidget()
+            grContent.setWidget(QDMNodeContentWidget(self.node))
+
+        content = grContent.widget()
+        content.node = self.node
+        content.deserialize(self.node.content_data)
+
+        self.grContent = grContent
+        self.node.content = content
+        self.updateContentGeometry()
+        grContent.setParentItem(self)
+        grContent.setVisible(True)
+
+
+    def releaseContent(self):
+        """ Stores the content widget's state in the node and takes the widget out of the node. Returns its proxy. """
+        grContent = self.grContent
+        if (grContent is None): return None
+
+        self.node.content_data = self.node.content.serialize()
+        self.node.content = None
+        self.grContent = None
+
+        grContent.setParentItem(None)
+        if (grContent.scene() is not None): grContent.scene().removeItem(grContent)
+        return grContent
+
+
+    def updateContentGeometry(self):
+        if (self.grContent is None): return
+        self.grContent.widget().setGeometry(self.edge_size, self.title_height + self.edge_size,
+                                            self.width - 2*self.edge_size, self.height - 2*self.edge_size-self.title_height)
 
 
     def initSockets(self):
@@ -107,30 +207,29 @@ class QDMGraphicsNode(QGraphicsItem):
 
     def paint(self, painter, QStyleOptionGraphicsItem, widget=None):
         """ Reimplements QGraphicsItem.paint(). Called whenever the node is re-painted. """
-        
+        # Zoomed out far: just a flat rectangle
+        if (self.scene().detail_level == DETAIL_LOW):
+            painter.setPen(Qt.NoPen if not self.isSelected() else self._pen_selected)
+            painter.setBrush(self._brush_title)
+            painter.drawRect(self.boundingRect())
+            return
+
+        # Node came into view (or was just created) without its content widget
+        if (self.grContent is None and self.scene().detail_level == DETAIL_HIGH):
+            self.scene().scheduleNodeContentsUpdate()
+
+        path_title, path_content, path_outline = self.getChromePaths()
+
         # Title
-        path_title = QPainterPath()
-        path_title.setFillRule(Qt.WindingFill)
-        path_title.addRoundedRect(0,0, self.width, self.title_height, self.edge_size, self.edge_size)
-        path_title.addRect(0, self.title_height - self.edge_size, self.edge_size, self.edge_size)
-        path_title.addRect(self.width - self.edge_size, self.title_height - self.edge_size, self.edge_size, self.edge_size)
         painter.setPen(Qt.NoPen)
         painter.setBrush(self._brush_title)
-        painter.drawPath(path_title.simplified())
+        painter.drawPath(path_title)
 
         # Content
-        path_content = QPainterPath()
-        path_content.setFillRule(Qt.WindingFill)
-        path_content.addRoundedRect(0, self.title_height, self.width, self.height - self.title_height, self.edge_size, self.edge_size)
-        path_content.addRect(0, self.title_height, self.edge_size, self.edge_size)
-        path_content.addRect(self.width - self.edge_size, self.title_height, self.edge_size, self.edge_size)
-        painter.setPen(Qt.NoPen)
         painter.setBrush(self._brush_background)
-        painter.drawPath(path_content.simplified())
+        painter.drawPath(path_content)
 
         # Outline
-        path_outline = QPainterPath()
-        path_outline.addRoundedRect(0, 0, self.width, self.height, self.edge_size, self.edge_size)
         painter.setPen(self._pen_default if not self.isSelected() else self._pen_selected)
         painter.setBrush(Qt.NoBrush)
-        painter.drawPath(path_outline.simplified())
+        painter.drawPath(path_outline)
@@ -1,8 +1,12 @@
 from PySide6.QtWidgets import QGraphicsScene
-from PySide6.QtGui import QColor, QPen
-from PySide6.QtCore import QLine
+from PySide6.QtGui import QColor, QPen, QBrush, QPixmap, QPainter, QTransform
+from PySide6.QtCore import Qt, QLineF, QRectF, QTimer
 
-import math
+
+# Levels of detail, depending on how far the view is zoomed out (see QDMGraphicsView.updateDetailLevel)
+DETAIL_LOW = 0      # Nodes are drawn as flat rectangles and edges as straight lines. No titles, sockets or contents.
+DETAIL_MEDIUM = 1   # Nodes with their titles and sockets, but without their contents (too small to be read)
+DETAIL_HIGH = 2     # Everything
 
 
 class QDMGraphicsScene(QGraphicsScene):
@@ -19,6 +23,7 @@ class QDMGraphicsScene(QGraphicsScene):
         # Settings
         self.gridSize = 20
         self.gridSquares = 5
+        self.gridMinSpacing = 5     # Minimum space (in pixels) between grid lines. Closer lines are not drawn.
 
         # Background colors
         self._color_background = QColor("#393939")
@@ -30,8 +35,32 @@ class QDMGraphicsScene(QGraphicsScene):
         self._pen_dark = QPen(self._color_dark)
         self._pen_dark.setWidth(2)
 
+        # Areas of the scene that are not loaded yet (see ScenePartialLoader)
+        self._brush_unloaded = QBrush(QColor("#40aaaaaa"), Qt.BDiagPattern)
+
         self.setBackgroundBrush(self._color_background)
 
+        self.detail_level = DETAIL_HIGH
+
+        # Content widgets are only kept by the nodes in (or near) view. Released ones are kept here to be reused.
+        self.contentPoolSize = 32
+        self._content_pool = []
+        self._content_nodes = set()     # Graphic nodes that currently have a content widget
+        self._contents_timer = QTimer()
+        self._contents_timer.setSingleShot(True)
+        self._contents_timer.timeout.connect(self.updateNodeContents)
+
+        # One brush with a tile of the grid for each zoom level, see getGridBrush()
+        self._grid_brushes = {}
+
+        # Edges whose nodes have moved, waiting to be updated
+        self._dirty_edges = set()
+        self._dirty_edges_timer = QTimer()
+        self._dirty_edges_timer.setSingleShot(True)
+        self._dirty_edges_timer.timeout.connect(self.updateDirtyEdges)
+
+        self.bulk_loading = 0       # Nesting level of beginBulkLoad() calls
+
 
 
     def setGrScene(self, width: int, height:int ) -> None:
@@ -40,40 +69,181 @@ class QDMGraphicsScene(QGraphicsScene):
 
 
    
-    def drawBackground(self, painter, rect):
-        """ 
-        Overrides QGraphicsScene's drawBackground and gets called every time the scene is redrawn.
-        We use it to draw a custom background with a grid.
+    def beginBulkLoad(self):
         """
-        super().drawBackground(painter, rect)
+        Starts creating (or removing) many items at once. Until endBulkLoad() is called, items are not indexed, the
+        views are not repainted, and edges are not positioned as they're created (they're marked dirty instead).
+        Calls can be nested. Each call must be paired with a call to endBulkLoad(), even if something fails.
+        """
+        self.bulk_loading += 1
+        if (self.bulk_loading > 1): return
+
+        self.setItemIndexMethod(QGraphicsScene.NoIndex)
+        for view in self.views():
+            view.viewport().setUpdatesEnabled(False)
+
+
+    def endBulkLoad(self):
+        """ Positions the edges created during the bulk load, rebuilds the index of items, and repaints once """
+        self.bulk_loading -= 1
+        if (self.bulk_loading > 0): return
+
+        self.updateDirtyEdges()
+        self.setItemIndexMethod(QGraphicsScene.BspTreeIndex)    # Rebuilds the index with all the items at once
+        for view in self.views():
+            view.viewport().setUpdatesEnabled(True)
+        self.update()
+        self.scheduleNodeContentsUpdate()
+
+
+    def setDetailLevel(self, level):
+        """ Changes how much detail nodes and edges are drawn with. Called by the view when zooming. """
+        if (level == self.detail_level): return
+        self.detail_level = level
+
+        for node in self.scene.iterNodes():
+            node.grNode.updateDetailLevel()
+        self.update()
+        self.scheduleNodeContentsUpdate()
+
+
+    def scheduleNodeContentsUpdate(self):
+        """ Asks for updateNodeContents() to run once control returns to the event loop. Called when the view changes. """
+        if not self._contents_timer.isActive():
+            self._contents_timer.start(0)
+
+
+    def updateNodeContents(self):
+        """
+        Gives a content widget to the nodes in view, if the zoom is close enough to read them, and releases the
+        content widgets of the nodes that are far from view. Released widgets are reused by the next nodes to show up.
+        If the scene is partially loaded, the parts of it in view are loaded too.
+        """
+        self._contents_timer.stop()
+
+        views_rect = QRectF()
+        for view in self.views():
+            views_rect = views_rect.united(view.mapToScene(view.viewport().rect()).boundingRect())
+
+        # Parts of a partially loaded scene that come into view are loaded first, a few at a time
+        if (self.scene.partial_loader is not None and self.scene.partial_loader.loadRect(views_rect)):
+            self.scheduleNodeContentsUpdate()
+
+        visible_rect = views_rect if (self.detail_level == DETAIL_HIGH) else QRectF()
+
+        # Nodes that are just outside of the view keep their contents, so that panning back and forth doesn't recreate them
+        margin_x, margin_y = visible_rect.width() / 2, visible_rect.height() / 2
+        keep_rect = visible_rect.adjusted(-margin_x, -margin_y, margin_x, margin_y)
 
-        # Preparations
-        left   = int(math.floor(rect.left()))
-        right  = int(math.ceil(rect.right()))
-        top    = int(math.floor(rect.top()))
-        bottom = int(math.ceil(rect.bottom()))
+        for grNode in list(self._content_nodes):
+            if (keep_rect.isEmpty() or not keep_rect.intersects(grNode.sceneBoundingRect())):
+                if not grNode.grContent.hasFocus():     # Don't take the widget away while its text is being edited
+                    self.releaseNodeContent(grNode)
 
-        first_left = left - (left % self.gridSize)
-        first_top = top - (top % self.gridSize)
+        if visible_rect.isEmpty(): return
 
-        # Compute lines to be drawn
-        lines_light = []
-        lines_dark = []
+        for item in self.items(visible_rect, Qt.IntersectsItemBoundingRect):
+            if (hasattr(item, 'node') and item.grContent is None):
+                item.showContent(self._content_pool.pop() if self._content_pool else None)
+                self._content_nodes.add(item)
 
-        darkLinesOffset = self.gridSize * self.gridSquares
 
-        for x in range(first_left, right, self.gridSize):   # Vertical lines
-            if (x % darkLinesOffset == 0):  lines_dark.append(QLine(x, top, x, bottom))
-            else:                           lines_light.append(QLine(x, top, x, bottom))
+    def releaseNodeContent(self, grNode):
+        """ Takes the content widget out of the node, and keeps it for reuse if the pool isn't full """
+        if grNode not in self._content_nodes: return
+        self._content_nodes.discard(grNode)
+
+        grContent = grNode.releaseContent()
+        if (len(self._content_pool) < self.contentPoolSize):
+            self._content_pool.append(grContent)
+        else:
+            grContent.deleteLater()
+
+
+    def markEdgesDirty(self, edges):
+        """
+        Marks edges to be updated. Edges are updated all at once when control returns to the event loop, before the
+        next frame is rendered, so an edge is only updated once no matter how many of its nodes (or how many times) moved.
+        """
+        self._dirty_edges.update(edges)
+        if self.bulk_loading: return    # They're updated by endBulkLoad()
+        if (self._dirty_edges and not self._dirty_edges_timer.isActive()):
+            self._dirty_edges_timer.start(0)
+
 
-        for y in range(first_top, bottom, self.gridSize):   # Horizontal lines
-            if (y % darkLinesOffset == 0):  lines_dark.append(QLine(left, y, right, y))
-            else:                           lines_light.append(QLine(left, y, right, y))
+    def updateDirtyEdges(self):
+        """ Updates the position of the edges marked as dirty """
+        self._dirty_edges_timer.stop()
+        dirty_edges = self._dirty_edges
+        self._dirty_edges = set()
 
-        # Draw the lines
-        painter.setPen(self._pen_light)
-        painter.drawLines(lines_light)
+        for edge in dirty_edges:
+            if (edge.grEdge is not None):   # Edge may have been removed in the meantime
+                edge.updatePositions()
+
+
+    def getGridBrush(self, scale, pixel_ratio=1.0):
+        """
+        Returns a brush that paints the grid when used to fill the background, or None if even the dark lines
+        would be too close together. The brush has a pixmap with one tile of the grid (one dark square, with
+        its light lines) drawn at the resolution of the given zoom, so it's only drawn once per zoom level.
+        """
+        key = (round(scale, 4), pixel_ratio)
+        if key in self._grid_brushes: return self._grid_brushes[key]
+
+        tile_scene_size = self.gridSize * self.gridSquares
+        tile_size = round(tile_scene_size * scale * pixel_ratio)   # In device pixels
+
+        if (tile_scene_size * scale < self.gridMinSpacing):
+            brush = None
+        else:
+            pixmap = QPixmap(tile_size, tile_size)
+            pixmap.fill(Qt.transparent)
+
+            # Draw the tile in its own coordinates (one unit = one device pixel)
+            painter = QPainter(pixmap)
+            painter.setRenderHint(QPainter.Antialiasing)
+            to_pixels = tile_size / tile_scene_size
+
+            if (self.gridSize * scale >= self.gridMinSpacing):
+                pen = QPen(self._pen_light)
+                pen.setWidthF(self._pen_light.widthF() * to_pixels)
+                painter.setPen(pen)
+                for i in range(1, self.gridSquares):
+                    pos = i * self.gridSize * to_pixels
+                    painter.drawLine(QLineF(pos, 0, pos, tile_size))
+                    painter.drawLine(QLineF(0, pos, tile_size, pos))
+
+            # Dark lines are in the edges of the tile. Half of each line is drawn on each side.
+            pen = QPen(self._pen_dark)
+            pen.setWidthF(self._pen_dark.widthF() * to_pixels)
+            painter.setPen(pen)
+            for pos in (0, tile_size):
+                painter.drawLine(QLineF(pos, 0, pos, tile_size))
+                painter.drawLine(QLineF(0, pos, tile_size, pos))
+            painter.end()
+
+            # Map the tile back to scene coordinates, so that the pattern is aligned with the scene's origin
+            brush = QBrush(pixmap)
+            brush.setTransform(QTransform.fromScale(1 / to_pixels, 1 / to_pixels))
+
+        self._grid_brushes[key] = brush
+        return brush
+
+
+    def drawBackground(self, painter, rect):
+        """ 
+        Overrides QGraphicsScene's drawBackground and gets called every time the scene is redrawn.
+        We use it to draw a custom background with a grid, by filling the exposed area with a tiled brush.
+        Areas of the scene that are not loaded yet are hatched.
+        """
+        super().drawBackground(painter, rect)
 
-        painter.setPen(self._pen_dark)
-        painter.drawLines(lines_dark)
+        scale = painter.worldTransform().m11()
+        brush = self.getGridBrush(scale, painter.device().devicePixelRatioF())
+        if brush is not None:
+            painter.fillRect(rect, brush)
 
+        if (self.scene.partial_loader is not None):
+            for left, top, right, bottom in self.scene.partial_loader.unloadedChunksBounds(rect):
+                painter.fillRect(QRectF(left, top, right - left, bottom - top), self._brush_unloaded)
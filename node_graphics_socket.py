@@ -1,6 +1,7 @@
 from PySide6.QtWidgets import QGraphicsItem
 from PySide6.QtGui import QColor, QPen, QBrush
 from PySide6.QtCore import QRectF
+from node_graphics_scene import DETAIL_LOW
 
 
 class QDMGraphicsSocket(QGraphicsItem):
@@ -29,6 +30,10 @@ class QDMGraphicsSocket(QGraphicsItem):
         self._pen.setWidthF(self.outline_width)
         self._brush = QBrush(self._color_background)
 
+        # Sockets are hidden when zoomed out far (see QDMGraphicsNode.updateDetailLevel)
+        if (self.scene() is not None):
+            self.setVisible(self.scene().detail_level > DETAIL_LOW)
+
 
     def paint(self, painter, QStyleOptionGraphicsItem, widget=None):
         # Paint circle
@@ -6,6 +6,7 @@ from node_graphics_socket import QDMGraphicsSocket
 from node_graphics_edge import QDMGraphicsEdge
 from node_edge import Edge, EDGE_TYPE_BEZIER
 from node_graphics_cutline import QDMCutLine
+from node_graphics_scene import DETAIL_LOW, DETAIL_MEDIUM, DETAIL_HIGH
 
 
 MODE_NOOP = 1
@@ -38,6 +39,8 @@ class QDMGraphicsView(QGraphicsView):
         self.zoom = 10  # Current zoom
         self.zoomInFactor = 1.25
         self.zoomRange = [0, 20]    # To limit how many times we can scroll up or down
+        self.detailMediumScale = 0.5    # Below this scale, contents of the nodes are hidden
+        self.detailLowScale = 0.25      # Below this scale, nodes and edges are drawn in a simplified way
 
         # Cutline
         self.cutline = QDMCutLine()
@@ -55,6 +58,17 @@ class QDMGraphicsView(QGraphicsView):
 
 
 
+    def scrollContentsBy(self, dx, dy):
+        """ Overrides parent's method. Nodes that come into view get their contents (see QDMGraphicsScene.updateNodeContents) """
+        super().scrollContentsBy(dx, dy)
+        self.grScene.scheduleNodeContentsUpdate()
+
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.grScene.scheduleNodeContentsUpdate()
+
+
     def mousePressEvent(self, event):
         if (event.button() == Qt.MouseButton.MiddleButton):  self.middleMouseButtonPressed(event)
         elif (event.button() == Qt.MouseButton.LeftButton):  self.leftMouseButtonPress(event)
@@ -238,11 +252,14 @@ class QDMGraphicsView(QGraphicsView):
 
     def cutIntersectingEdges(self):
         """ Calculates intersections between cutline and edges, and deletes intersected edges """
+        edge_index = self.grScene.scene.edge_index
+
         for ix in range(len(self.cutline.line_points) - 1):
             p1 = self.cutline.line_points[ix]
             p2 = self.cutline.line_points[ix + 1]
 
-            for edge in self.grScene.scene.edges:
+            # Only the edges whose bounding box overlaps the segment can intersect it
+            for edge in edge_index.edgesInRect(p1.x(), p1.y(), p2.x(), p2.y()):
                 if edge.grEdge.intersectsWith(p1, p2):
                     edge.remove()
             
@@ -251,10 +268,14 @@ class QDMGraphicsView(QGraphicsView):
 
     def deleteSelected(self):
         """ Deletes all selected nodes and edges """
-        for item in self.grScene.selectedItems():
+        selected = self.grScene.selectedItems()
+
+        # Edges go first, otherwise removing a node would already remove its selected edges
+        for item in selected:
             if isinstance(item, QDMGraphicsEdge):
                 item.edge.remove()
-            elif hasattr(item, 'node'):
+        for item in selected:
+            if hasattr(item, 'node'):
                 item.node.remove()
         
         self.grScene.scene.history.storeHistory("Delete selected", setModified=True)
@@ -347,3 +368,16 @@ class QDMGraphicsView(QGraphicsView):
         # Set scene scale (same for both axes)
         if (not clamped):
             self.scale(zoomFactor, zoomFactor)
+            self.updateDetailLevel()
+            self.grScene.scheduleNodeContentsUpdate()
+
+
+    def updateDetailLevel(self):
+        """ Chooses how much detail to draw the scene with, depending on the current scale """
+        scale = self.transform().m11()
+
+        if (scale < self.detailLowScale):       level = DETAIL_LOW
+        elif (scale < self.detailMediumScale):  level = DETAIL_MEDIUM
+        else:                                   level = DETAIL_HIGH
+
+        self.grScene.setDetailLevel(level)
@@ -1,34 +1,66 @@
+import copy
+from PySide6.QtCore import QPointF
 from node_graphics_node import QDMGraphicsNode
-from node_content_widget import QDMNodeContentWidget
 from node_socket import *
 from collections import OrderedDict
 from node_serializable import Serializable
+from node_scene_stream import NodeStream
+from node_scene_shared import SharedPayload
 
 
 DEBUG = False
 
 
 class Node(Serializable):
+    # Where SceneScheduler evaluates nodes of this type: 'thread' (thread pool), 'process' (process pool, see
+    # evalStatic), 'distributed' (worker processes, with evalStatic too) or 'main' (the thread that asked for the
+    # evaluation, for nodes that aren't thread-safe)
+    eval_pool = 'thread'
+    # For nodes whose evalImplementation is a coroutine (see SceneAsyncLoop): how many seconds they can run (None for
+    # no limit), and how many nodes of this type can run at once (None for no limit)
+    eval_timeout = None
+    eval_concurrency = None
+    # Whether the results can be reused for the same inputs and content (see SceneResultCache), and the version of
+    # the implementation, to bump when it changes so that results cached by the previous one aren't used
+    eval_cacheable = True
+    eval_cache_version = 0
+    # How many items of a stream output can be buffered ahead of the slowest node reading it (see NodeStream)
+    eval_stream_buffer = 64
+    # Scheduling (see SceneScheduler): nodes with a higher priority start first. The cost is how long a node is
+    # expected to take (until nodes of its type were timed), for the critical path. At most eval_max_running nodes
+    # of the type run at once (None for no limit), and each one is expected to use eval_memory bytes.
+    eval_priority = 0
+    eval_cost = 1.0
+    eval_max_running = None
+    eval_memory = 0
+    # Whether evalBatch computes a whole batch at once (see SceneBatchEvaluator). Other nodes are evaluated row by row.
+    eval_vectorized = False
 
     def __init__(self, scene, title="New node", inputs=[], outputs=[]):
             
         super().__init__()
 
         self._title = title
+        self._pos = (0.0, 0.0)
         self.scene = scene
 
-        self.content = QDMNodeContentWidget(self)
-        self.grNode = QDMGraphicsNode(self)
-
-        self.scene.addNode(self)
-        self.scene.grScene.addItem(self.grNode)
-
         self.socket_spacing = 22
-
-        # Create sockets for inputs and outputs
         self.inputs = []
         self.outputs = []
 
+        # Values of the outputs, computed by the scene's evaluator (see SceneEvaluator). Dirty if they must be computed again.
+        self.output_values = None
+        self._is_dirty = True
+
+        self.content = None                 # QDMNodeContentWidget, only while the node is in view (see QDMGraphicsNode.showContent)
+        self.content_data = OrderedDict()   # State of the content, kept while there's no content widget
+        self.grNode = None                  # Only if the scene has graphics (see initUI)
+
+        self.scene.addNode(self)
+        if (self.scene.grScene is not None): self.initUI()
+        self.scene.history.recordNodeAdded(self)
+
+        # Create sockets for inputs and outputs
         counter = 0
         for item in inputs:
             socket = Socket(node=self, index=counter, position=LEFT_BOTTOM, socket_type=item, multi_edges=False)
@@ -46,12 +78,24 @@ class Node(Serializable):
         return "<Node %s..%s>" % (hex(id(self))[2:5], hex(id(self))[-3:])
 
 
+    def initUI(self):
+        """ Creates the graphics of the node and its sockets. Called when the scene gets its graphics scene. """
+        self.grNode = QDMGraphicsNode(self)
+        for socket in (self.inputs + self.outputs):
+            socket.initUI()
+        self.scene.grScene.addItem(self.grNode)
+
+
     @property
     def pos(self):
-        return self.grNode.pos()  # QPointF
+        return QPointF(*self._pos)
     
     def setPos(self, x, y):
-        self.grNode.setPos(x, y)
+        if (self.grNode is not None):
+            self.grNode.setPos(x, y)    # Which records the move and updates self._pos (see QDMGraphicsNode.itemChange)
+        else:
+            self.scene.history.recordNodeMoved(self)
+            self._pos = (float(x), float(y))     # As QGraphicsItem keeps it, so both serialize the same
 
 
     @property
@@ -60,8 +104,10 @@ class Node(Serializable):
 
     @title.setter
     def title(self, value):
+        old_title = self._title
         self._title = value
-        self.grNode.title = self._title
+        if (self.grNode is not None): self.grNode.title = self._title
+        self.scene.history.recordTitleChanged(self, old_title)
 
 
     def getSocketPosition(self, index, position):
@@ -77,14 +123,109 @@ class Node(Serializable):
         return [x, y]
 
 
+    def isDirty(self):
+        """
+        Dirty nodes have to be evaluated. So do nodes whose streams were already read, or whose shared memory outputs
+        were already freed, to produce them again.
+        """
+        if self._is_dirty: return True
+        return any(isinstance(value, (NodeStream, SharedPayload)) and value.isSpent() for value in self.output_values)
+
+
+    def markDirty(self):
+        """
+        Marks the node to be evaluated again, because its inputs or its content changed, and so every node that
+        depends on it. Dirty nodes only have dirty nodes after them, so there's no need to go past those.
+        Changes to the content of a node have to be followed by this, even if the node is already dirty.
+        """
+        self.scene.changes += 1
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._is_dirty: continue
+            node._is_dirty = True
+            stack.extend(node.getOutputNodes())
+
+
+    def markClean(self, output_values):
+        """ Stores the values of the outputs, computed by the evaluator """
+        self.output_values = output_values
+        self._is_dirty = False
+
+
+    def evalImplementation(self, input_values):
+        """
+        Computes the values of the node's outputs, given the values of its inputs (one per input socket, or a list of
+        values for inputs with multiple edges). Returns a list with one value per output socket.
+        Input values are shared with other nodes (and the scene's cache), so they must not be changed in place.
+        Outputs can be iterators, or async iterators, to stream their items to the next nodes (see NodeStream), which
+        get them as iterators too.
+        It can be a coroutine (async def), for nodes that wait on I/O. It then runs in the asyncio loop's thread.
+        Node types override this (or evalStatic, for nodes evaluated in a process pool). Plain nodes don't compute anything.
+        """
+        if (self.eval_pool in ('process', 'distributed')): return self.evalStatic(input_values, self.getEvalParams())
+        return [None] * len(self.outputs)
+
+
+    @classmethod
+    def evalStatic(cls, input_values, params):
+        """
+        Same as evalImplementation, for nodes evaluated in a process pool: the node itself can't be sent to another
+        process, so this gets the picklable state returned by getEvalParams instead. Node types with
+        eval_pool = 'process' or 'distributed' override this (and the node type has to be importable from its module).
+        """
+        raise NotImplementedError("%s has eval_pool = 'process' but doesn't implement evalStatic" % cls.__name__)
+
+
+    def evalBatch(self, input_values, size):
+        """
+        Same as evalImplementation, for a batch of size rows, for node types with eval_vectorized = True. Each input
+        value is a column with one value per row (a list, or a NumPy array if the batch gave one). Inputs that don't
+        depend on the batch get their single value repeated for every row. Returns a list with one column per output socket.
+        """
+        raise NotImplementedError("%s has eval_vectorized = True but doesn't implement evalBatch" % type(self).__name__)
+
+
+    def getEvalParams(self):
+        """ Returns what evalStatic needs besides the input values. By default, the state of the node's content. """
+        return self.getContentData()
+
+
+    def getInputNodes(self):
+        """ Yields the nodes connected to the inputs of this node (the ones it depends on) """
+        for socket in self.inputs:
+            for output in socket.getConnectedSockets():
+                yield output.node
+
+
+    def getOutputNodes(self):
+        """ Yields the nodes connected to the outputs of this node (the ones that depend on it) """
+        for socket in self.outputs:
+            for input in socket.getConnectedSockets():
+                yield input.node
+
+
+    def getConnectedEdges(self):
+        """ Yields the edges connected to each input and output socket """
+        for socket in self.inputs:
+            yield from socket.edges
+        for socket in self.outputs:
+            yield from socket.edges
+
+
     def updateConnectedEdges(self):
         """
         Check each inpt and output socket to see if they have a connected edge. If so, update the positions of that edge.
-        Useful for when we drag the node around and want the edges to follow.
+        Useful for when we move the node and want the edges to follow right away.
         """
-        for socket in (self.inputs + self.outputs):
-            for edge in socket.edges:
-                edge.updatePositions()
+        if (self.grNode is None): return
+
+        if self.scene.grScene.bulk_loading:
+            self.scene.grScene.markEdgesDirty(self.getConnectedEdges())
+            return
+
+        for edge in self.getConnectedEdges():
+            edge.updatePositions()
 
 
     def remove(self):
@@ -92,46 +233,102 @@ class Node(Serializable):
 
         if DEBUG: print(" - remove all edges from sockets")
         for socket in (self.inputs+self.outputs):
-            for edge in socket.edges:
+            for edge in socket.edges.copy():    # Copy, since removing the edge also removes it from socket.edges
                 if DEBUG: print("    - removing from socket:", socket, "edge:", edge)
                 edge.remove()
 
+        self.scene.history.recordNodeRemoved(self)
+
+        if DEBUG: print(" - remove sockets from the scene")
+        for socket in (self.inputs+self.outputs):
+            self.scene.removeSocket(socket)
+
         if DEBUG: print(" - remove grNode")
-        self.scene.grScene.removeItem(self.grNode)
-        self.grNode = None
+        if (self.grNode is not None):
+            self.scene.grScene.releaseNodeContent(self.grNode)
+            self.scene.grScene.removeItem(self.grNode)
+            self.grNode = None
 
         if DEBUG: print(" - remove node from the scene")
         self.scene.removeNode(self)
+        self.scene.cache.forgetNode(self)
+        self.scene.evaluator.freeOutputValues(self)
         
         if DEBUG: print(" - everything was done.")
 
 
     def serialize(self):
-        """ Returns the node's properties as a dict for easy serialization """
+        """
+        Returns the node's properties as a dict for easy serialization. The content is a copy, so the data stays the
+        same if the node changes it later on (while it's written in the background, or kept by the history).
+        """
         return OrderedDict([
             ('id', self.id),
             ('title', self.title),
-            ('pos_x', self.grNode.scenePos().x()),
-            ('pos_y', self.grNode.scenePos().y()),
+            ('pos_x', self._pos[0]),
+            ('pos_y', self._pos[1]),
             ('inputs', [socket.serialize() for socket in self.inputs]),
             ('outputs', [socket.serialize() for socket in self.outputs]),
-            ('content', self.content.serialize()),
+            ('content', copy.deepcopy(self.getContentData())),
         ])
 
 
-    def deserialize(self, data, hashmap={}, restore_id=True):
+    def getContentData(self):
+        """ Returns the state of the node's content, taken from the content widget if the node has one """
+        if (self.content is not None):
+            self.content_data = self.content.serialize()
+        return self.content_data
+
+
+    def hasSameSockets(self, data):
+        """ Returns True if the node's sockets are the same ones described in the node's serialized data """
+        def signature(sockets_data):
+            return sorted((s['id'], s['index'], s['position'], s['socket_type'], s['multi_edges']) for s in sockets_data)
+
+        return (signature(data['inputs']) == signature(socket.serialize() for socket in self.inputs) and
+                signature(data['outputs']) == signature(socket.serialize() for socket in self.outputs))
+
+
+    def updateFromData(self, data):
+        """
+        Updates an existing node in place with its serialized data, without recreating its sockets or widgets.
+        Only the properties that differ are changed. The node's sockets must be the same ones described in the data.
+        """
+        pos = self.pos
+        if (pos.x() != data['pos_x'] or pos.y() != data['pos_y']):
+            self.setPos(data['pos_x'], data['pos_y'])
+            self.updateConnectedEdges()
+
+        if (self.title != data['title']):
+            self.title = data['title']
+
+        if (data['content'] != self.getContentData()): self.markDirty()
+        self.content_data = data['content']
+        if (self.content is not None): self.content.deserialize(self.content_data)
+
+
+    def deserialize(self, data, hashmap=None, restore_id=True):
         """ Given json-serialized data about the node, deserialize it and load it """
-        if restore_id: self.id = data['id']
+        if restore_id:
+            self.scene.removeNode(self)
+            self.id = data['id']
+            self.scene.addNode(self)
 
-        hashmap[data['id']] = self
+        if hashmap is not None: hashmap[data['id']] = self
 
         self.setPos(data['pos_x'], data['pos_y'])
         self.title = data['title']
 
+        self.content_data = data['content']
+        if (self.content is not None): self.content.deserialize(self.content_data)
+
         data['inputs'].sort(key=lambda socket: socket['index'] + socket['position'] * 10000 )
         data['outputs'].sort(key=lambda socket: socket['index'] + socket['position'] * 10000 )
 
         # Deserialize data about the input and output sockets, and include it in the node data
+        for socket in (self.inputs + self.outputs):
+            self.scene.removeSocket(socket)
+
         self.inputs = []
         for socket_data in data['inputs']:
             new_socket = Socket(node=self, index=socket_data['index'], position=socket_data['position'], socket_type=socket_data['socket_type'])
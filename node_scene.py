@@ -1,31 +1,66 @@
+import itertools
 from node_graphics_scene import QDMGraphicsScene
-import json
 from collections import OrderedDict
 from node_serializable import Serializable
 from node_node import Node
 from node_edge import Edge
 from node_scene_history import SceneHistory
 from node_scene_clipboard import SceneClipboard
+from node_scene_edge_index import SceneEdgeIndex
+from node_scene_json import SceneJsonReader
+from node_scene_binary import readSceneBinary, isSceneBinaryFile, isSceneChunkedFile
+from node_scene_partial import ScenePartialLoader
+from node_scene_evaluator import SceneEvaluator
+from node_scene_scheduler import SceneScheduler
+from node_scene_cache import SceneResultCache
+from node_scene_batch import SceneBatchEvaluator
+from node_scene_saver import SceneSaver, writeSceneFile
+
+
+# Bulk loads rebuild the index of the whole graphics scene at the end, which only pays off when many items change
+BULK_LOAD_MIN_ITEMS = 64
 
 
 class Scene(Serializable):
-    """ Wrapper around QDMGraphicsScene """
+    """
+    Wrapper around QDMGraphicsScene.
+    A headless scene has no graphics at all (no QDMGraphicsScene, graphics items or widgets), so it can be loaded,
+    edited and saved without a QApplication. Graphics can be attached to it later on with initUI().
+    """
 
-    def __init__(self):
+    def __init__(self, headless=False):
         super().__init__()
 
-        self.nodes = []
-        self.edges = []
+        # Index of every node, socket and edge in the scene by id. Nodes, sockets and edges
+        # register themselves here when created, and leave when removed.
+        self._nodes = {}
+        self._sockets = {}
+        self._edges = {}
 
         self.scene_width = 16000
         self.scene_height = 16000
 
+        self.partial_loader = None      # ScenePartialLoader, while the scene is partially loaded from a chunked file
+
+        # Counts the changes that matter to the evaluation (nodes and edges added or removed, nodes marked dirty), to
+        # know if the graph changed since some point
+        self.changes = 0
+
         self._has_been_modified = False
         self._has_been_modified_listeners = []
 
-        self.initUI()
+        self.grScene = None
+        self.saver = None       # SceneSaver, only with graphics since it needs an event loop
+        self._bulk_loads = []   # Whether each beginBulkLoad() call that wasn't ended yet suspended the graphics scene
+
         self.history = SceneHistory(self)
         self.clipboard = SceneClipboard(self)
+        self.edge_index = SceneEdgeIndex(self)
+        self.cache = SceneResultCache(self)
+        self.evaluator = SceneEvaluator(self)
+        self.scheduler = SceneScheduler(self)
+        self.batch_evaluator = SceneBatchEvaluator(self)
+        if not headless: self.initUI()
 
 
     @property
@@ -50,73 +85,311 @@ class Scene(Serializable):
 
 
     def initUI(self):
+        """ Creates the graphics scene, and the graphics of the nodes and edges that are already in the scene """
+        if (self.grScene is not None): return
+
         self.grScene = QDMGraphicsScene(self)
         self.grScene.setGrScene(self.scene_width, self.scene_height)
 
+        self.saver = SceneSaver(self)
+        self.history.addHistoryStoredListener(self.saver.scheduleAutosave)
+
+        self.beginBulkLoad()
+        try:
+            for node in self.iterNodes():
+                node.initUI()
+            for edge in self.iterEdges():
+                edge.initUI()
+            self.grScene.markEdgesDirty(self.iterEdges())
+        finally:
+            self.endBulkLoad()
+
+
+    def isHeadless(self):
+        return (self.grScene is None)
+
+
+    def beginBulkLoad(self, items=None):
+        """
+        See QDMGraphicsScene.beginBulkLoad. Headless scenes have nothing to suspend.
+        items is how many nodes and edges are about to be created or removed, if it's known. Fewer than
+        BULK_LOAD_MIN_ITEMS are cheaper to index one by one, so the graphics scene is only suspended for more.
+        """
+        bulk = (self.grScene is not None and (items is None or items >= BULK_LOAD_MIN_ITEMS))
+        self._bulk_loads.append(bulk)
+        if bulk: self.grScene.beginBulkLoad()
+
+    def endBulkLoad(self):
+        if self._bulk_loads.pop(): self.grScene.endBulkLoad()
+
+
+    @property
+    def nodes(self):
+        """ List of the nodes in the scene. It's a copy, so it can be iterated while nodes are removed. """
+        return list(self._nodes.values())
+
+    @property
+    def edges(self):
+        """ List of the edges in the scene. It's a copy, so it can be iterated while edges are removed. """
+        return list(self._edges.values())
+
+    def iterNodes(self):
+        """ View of the nodes in the scene, without copying them. Nodes can't be added or removed while it's iterated. """
+        return self._nodes.values()
+
+    def iterEdges(self):
+        """ View of the edges in the scene, without copying them. Edges can't be added or removed while it's iterated. """
+        return self._edges.values()
+
 
     def addNode(self, node):
-        self.nodes.append(node)
+        self._nodes[self.uniqueId(self._nodes, node)] = node
+        self.changes += 1
+
+    def addSocket(self, socket):
+        self._sockets[self.uniqueId(self._sockets, socket)] = socket
 
     def addEdge(self, edge):
-        self.edges.append(edge)
+        self._edges[self.uniqueId(self._edges, edge)] = edge
+        self.changes += 1
+
+    def uniqueId(self, index, obj):
+        """
+        Ids are memory addresses, so an id restored from a file or from the history can be the same as the id of an
+        object that is created later on. If the object's id is already in use by another object, it gets a new one.
+        Memory addresses are aligned, so adding 1 gives an id that no new object will have.
+        Ids of the parts of the scene that are not loaded yet are also taken.
+        """
+        while ((obj.id in index and index[obj.id] is not obj) or
+               (self.partial_loader is not None and self.partial_loader.isReservedId(obj.id))):
+            obj.id += 1
+        return obj.id
 
     def removeNode(self, node):
-        if node in self.nodes: self.nodes.remove(node)
+        if self._nodes.get(node.id) is node:
+            del self._nodes[node.id]
+            self.changes += 1
         else: print("!W:", "Scene::removeNode", "wanna remove node", node, "from self.nodes but it's not in the list!")
 
+    def removeSocket(self, socket):
+        if self._sockets.get(socket.id) is socket: del self._sockets[socket.id]
+        else: print("!W:", "Scene::removeSocket", "wanna remove socket", socket, "from the scene but it's not registered!")
+
     def removeEdge(self, edge):
-        if edge in self.edges: self.edges.remove(edge)
+        if self._edges.get(edge.id) is edge:
+            del self._edges[edge.id]
+            self.changes += 1
         else: print("!W:", "Scene::removeEdge", "wanna remove edge", edge, "from self.edges but it's not in the list!")
 
 
+    def getNodeById(self, node_id):
+        return self._nodes.get(node_id)
+
+    def getSocketById(self, socket_id):
+        return self._sockets.get(socket_id)
+
+    def getEdgeById(self, edge_id):
+        return self._edges.get(edge_id)
+
+    def socketIds(self):
+        """ Set of the ids of the sockets in the scene. It's a copy. """
+        return set(self._sockets)
+
+
+    def restoreNode(self, node_data):
+        """
+        Makes the scene contain the node described by node_data, keeping its original ids.
+        If a node with that id already exists it's updated in place (so its widgets keep their state),
+        and it's only rebuilt if its sockets are different.
+        """
+        node = self.getNodeById(node_data['id'])
+        if (node is not None and node.hasSameSockets(node_data)):
+            node.updateFromData(node_data)
+            return node
+
+        if (node is not None): node.remove()
+        node = Node(self)
+        node.deserialize(node_data, restore_id=True)
+        return node
+
+    def restoreEdge(self, edge_data):
+        """
+        Makes the scene contain the edge described by edge_data, keeping its original id.
+        An existing edge with that id is kept as it is if it connects the same sockets.
+        """
+        edge = self.getEdgeById(edge_data['id'])
+        if (edge is not None):
+            if (edge.start_socket.id == edge_data['start'] and edge.end_socket.id == edge_data['end']):
+                if (edge.edge_type != edge_data['edge_type']): edge.edge_type = edge_data['edge_type']
+                return edge
+            edge.remove()
+
+        edge = Edge(self, edge_type=edge_data['edge_type'])     # So that its graphics item is only created once
+        edge.deserialize(edge_data, restore_id=True)
+        return edge
+
+
     def clear(self):
         """ Delete all nodes, one by one, with their remove() method so that they also delete any connected edge """
-        while len(self.nodes) > 0:
-            self.nodes[0].remove()
+        self.history.recording = False
+        self.beginBulkLoad(len(self._nodes) + len(self._edges))
+        try:
+            for node in self.nodes:
+                node.remove()
+        finally:
+            self.endBulkLoad()
+        self.history.recording = True
+        self.history.clear()
+        self.closePartialLoader()
 
         self.has_been_modified = False
 
 
-    def saveToFile(self, filename):
-        """ Save scene data in a json file """
-        with open(filename, "w") as file:
-            file.write( json.dumps( self.serialize(), indent=4 ) )
-            print("Saving to", filename, "was successfull.")
-            self.has_been_modified = False
+    def closePartialLoader(self):
+        """ Forgets the file the scene was partially loaded from, for when its contents are replaced """
+        if (self.partial_loader is not None):
+            self.partial_loader.close()
+            self.partial_loader = None
+
+
+    def saveToFile(self, filename, compact=False, binary=None, chunk_size=None):
+        """
+        Save scene data in a json file. Nodes and edges are serialized and written one by one.
+        If binary (by default, if the filename has the binary extension), the compact binary format is used instead.
+        With chunk_size (by default, the one of the file the scene is partially loaded from), it's chunked.
+        This blocks until the file is written. To save in the background, use self.saver.save().
+        """
+        writeSceneFile(filename, self.serialize(lazy=True), binary, compact, chunk_size or self.defaultChunkSize())
+        print("Saving to", filename, "was successfull.")
+        if (self.saver is not None): self.saver.filename = filename
+        self.has_been_modified = False
+
+
+    def defaultChunkSize(self):
+        return self.partial_loader.chunk_size if (self.partial_loader is not None) else None
 
 
-    def loadFromFile(self, filename):
-        """ Reads scene data stored in a json file, and deserializes it to recreate all the elements in the scene """
-        with open(filename, "r") as file:
-            raw_data = file.read()
-            data = json.loads(raw_data)
+    def loadFromFile(self, filename, partial=True):
+        """
+        Reads scene data stored in a json (or binary) file, and deserializes it to recreate all the elements in the scene.
+        The format of the file is detected from its first bytes.
+        Chunked files are loaded partially (unless partial is False or the scene is headless): only the parts of the
+        scene in view are created.
+        The file is read as the scene is built, so if it's invalid, the scene is left empty (see deserialize).
+        """
+        if (partial and self.grScene is not None and isSceneChunkedFile(filename)):
+            self.loadPartiallyFromFile(filename)
+            return
+
+        binary = isSceneBinaryFile(filename)
+        with open(filename, "rb" if binary else "r") as file:
+            # Nodes and edges are read from the file one by one, as they are deserialized
+            data = readSceneBinary(file) if binary else SceneJsonReader(file).read()
             self.deserialize(data)
+            if (self.saver is not None): self.saver.filename = filename
             self.has_been_modified = False
 
 
-    def serialize(self):
-        """ Returns the scene's properties as a dict for easy serialization """
+    def loadPartiallyFromFile(self, filename):
+        """
+        Opens a chunked file, without creating any node yet. The chunks of the file are loaded as the views get
+        near them (see QDMGraphicsScene.updateNodeContents).
+        """
+        self.clear()
+        self.partial_loader = ScenePartialLoader(self, filename)
+        self.id = self.partial_loader.chunked.scene_id
+
+        if (self.saver is not None): self.saver.filename = filename
+        self.has_been_modified = False
+        self.grScene.scheduleNodeContentsUpdate()
+        self.grScene.update()
+
+
+    def serialize(self, lazy=False, unloaded=True):
+        """
+        Returns the scene's properties as a dict for easy serialization.
+        If lazy, nodes and edges are generators that serialize each one of them when iterated.
+        Parts of the scene that are not loaded yet are read from their file, unless unloaded is False: then they're
+        left out (see ScenePartialLoader.snapshot to get them).
+        """
+        nodes = (node.serialize() for node in self.iterNodes())
+        edges = (edge.serialize() for edge in self.iterEdges())
+
+        if (self.partial_loader is not None and unloaded):
+            nodes = itertools.chain(nodes, self.partial_loader.iterUnloadedNodes())
+            edges = itertools.chain(edges, self.partial_loader.iterUnloadedEdges())
+
         return OrderedDict([
             ('id', self.id),
             ('scene_width', self.scene_width),
             ('scene_height', self.scene_height),
-            ('nodes', [node.serialize() for node in self.nodes]),
-            ('edges', [edge.serialize() for edge in self.edges]),
+            ('nodes', nodes if lazy else list(nodes)),
+            ('edges', edges if lazy else list(edges)),
         ])
 
 
     def deserialize(self, data, restore_id=True):
-        """ Given json-serialized data about the scene and its contents, deserialize it and load it """
+        """
+        Given json-serialized data about the scene and its contents, deserialize it and load it.
+        When ids are restored and the data comes from this same scene (an earlier save of it, or its graph sent to a
+        worker), the data is compared by id against what's already in the scene, and only the nodes and edges that
+        differ are created, removed or updated. Otherwise, the scene is rebuilt from scratch.
+        data['nodes'] and data['edges'] are only iterated once, in this order, so they can be generators.
+        If the data turns out to be invalid while it's read, the scene is left empty (not half loaded) and the error
+        is raised.
+        """
         print("Deserializing data")
-        self.clear()
-        hashmap = {}
+
+        # Everything is created at once, and only indexed and painted at the end
+        self.beginBulkLoad()
+        try:
+            self._deserialize(data, restore_id)
+        except Exception:
+            self.clear()
+            raise
+        finally:
+            self.endBulkLoad()
+            self.history.recording = True
+            self.history.clear()
+
+
+    def _deserialize(self, data, restore_id):
+        # Ids are memory addresses, so they only identify the same objects within the same scene. In data from
+        # another scene, a node can have the id of an unrelated node of this one.
+        update = (restore_id and data['id'] == self.id)
+        if not update: self.clear()
+        # The data has the whole scene, including the parts that were still in the file
+        self.closePartialLoader()
 
         if restore_id: self.id = data['id']
 
-        # Create nodes
-        for node_data in data['nodes']:
-            Node(self).deserialize(node_data, hashmap, restore_id)
+        # The whole scene is replaced, so there is nothing to undo
+        self.history.recording = False
+
+        if update:
+            # Create or update nodes, and then remove the ones that are not in the data
+            node_ids = set()
+            for node_data in data['nodes']:
+                node_ids.add(self.restoreNode(node_data).id)
+
+            for node in self.nodes:
+                if node.id not in node_ids: node.remove()
+
+            # Same with edges
+            edge_ids = set()
+            for edge_data in data['edges']:
+                edge_ids.add(self.restoreEdge(edge_data).id)
+
+            for edge in self.edges:
+                if edge.id not in edge_ids: edge.remove()
+
+        else:
+            hashmap = {}    # Maps the ids in the data to the newly created objects, which may get new ids
+
+            # Create nodes
+            for node_data in data['nodes']:
+                Node(self).deserialize(node_data, hashmap, restore_id)
 
-        # Create edges
-        for edge_data in data['edges']:
-            Edge(self).deserialize(edge_data, hashmap, restore_id)
\ No newline at end of file
+            # Create edges
+            for edge_data in data['edges']:
+                Edge(self, edge_type=edge_data['edge_type']).deserialize(edge_data, hashmap, restore_id)
@@ -0,0 +1,112 @@
+import asyncio
+import contextlib
+import threading
+
+
+DEBUG = False
+
+
+class SceneAsyncLoop():
+    """
+    asyncio event loop for nodes whose evalImplementation is a coroutine (async def), typically nodes that wait on
+    files, subprocesses or sockets. Every async node of the scene runs on this one loop, in its own thread, so any
+    number of them can be waiting at the same time without a thread each, and without blocking the Qt event loop.
+    The results come back as concurrent futures (see SceneScheduler, which hands them to the GUI thread).
+
+    At most max_concurrent nodes run at once, and at most Node.eval_concurrency nodes of each type. A node that runs
+    for longer than its Node.eval_timeout (in seconds) is cancelled.
+    """
+
+    def __init__(self, max_concurrent=1000):
+        self.max_concurrent = max_concurrent
+
+        self.loop = None            # Started the first time it's needed
+        self._thread = None
+        self._semaphores = {}       # None (all nodes) or node type -> asyncio.Semaphore, only used in the loop's thread
+        self._lock = threading.Lock()
+
+
+    def isRunning(self):
+        return (self.loop is not None)
+
+
+    def start(self):
+        with self._lock:
+            if self.isRunning(): return
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self.loop.run_forever, name="SceneAsyncLoop", daemon=True)
+            self._thread.start()
+
+
+    def stop(self):
+        """ Cancels the nodes still running and stops the loop. It's started again if it's used afterwards. """
+        with self._lock:
+            if not self.isRunning(): return
+            loop, thread = self.loop, self._thread
+            self.loop = None
+            self._thread = None
+
+        asyncio.run_coroutine_threadsafe(self._cancelAll(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        self._semaphores = {}
+
+
+    async def _cancelAll(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+    def submit(self, node, input_values):
+        """
+        Starts evaluating an async node with the given input values. Returns a concurrent.futures.Future with its
+        output values. Cancelling the future cancels the node.
+        """
+        self.start()
+        if DEBUG: print("SceneAsyncLoop::submit ~", node)
+        return asyncio.run_coroutine_threadsafe(self._evaluate(node, input_values), self.loop)
+
+
+    def run(self, node, input_values):
+        """ Evaluates an async node, blocking until it's done """
+        return self.submit(node, input_values).result()
+
+
+    def runRows(self, node, rows):
+        """
+        Evaluates an async node once for each list of input values in rows, concurrently (within the node's limits),
+        blocking until they're all done. Returns the output values, or the exception, of each row.
+        """
+        async def gather():
+            return await asyncio.gather(*(self._evaluate(node, input_values) for input_values in rows), return_exceptions=True)
+        return self.runCoroutine(gather())
+
+
+    def runCoroutine(self, coroutine):
+        """ Runs a coroutine on the loop, blocking until it's done. It can't be called from the loop's thread. """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+    def getSemaphore(self, key, limit):
+        semaphore = self._semaphores.get(key)
+        if (semaphore is None):
+            semaphore = self._semaphores[key] = asyncio.Semaphore(limit)
+        return semaphore
+
+
+    async def _evaluate(self, node, input_values):
+        async with self.getSemaphore(None, self.max_concurrent):
+            if (node.eval_concurrency is not None):
+                limit = self.getSemaphore(type(node), node.eval_concurrency)
+            else:
+                limit = contextlib.nullcontext()
+
+            async with limit:
+                try:
+                    return await asyncio.wait_for(node.evalImplementation(input_values), node.eval_timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError("%s took more than %s seconds" % (node, node.eval_timeout)) from None
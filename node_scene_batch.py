@@ -0,0 +1,176 @@
+import inspect
+from node_scene_evaluator import EvaluationError
+from node_scene_shared import resolvePayloads
+
+
+DEBUG = False
+
+# How an input of a node gets its value for each row
+SCALAR = 0      # The same value for every row
+COLUMN = 1      # A column of the batch
+MULTI = 2       # A list of values (input with multiple edges)
+
+
+def recordsToColumns(records):
+    """
+    Turns a list of records (dicts with the same keys) into a batch of columns: a dict with the same keys, and the
+    list of the records' values for each one
+    """
+    records = list(records)
+    if not records: return {}
+    return {key: [record[key] for record in records] for key in records[0]}
+
+
+class SceneBatchEvaluator():
+    """
+    Evaluates the graph once over a batch of records, instead of once per record. The batch gives columns for some
+    outputs (each with one value per record), and the nodes that depend on them compute a column for each of their
+    outputs in turn. So the graph is walked once, and each node is called once for the whole batch if its type is
+    vectorized (Node.eval_vectorized, see Node.evalBatch). Other nodes fall back to a loop over the rows with
+    Node.evalImplementation; async ones run all their rows at once, on the scheduler's asyncio loop.
+
+    Nodes that don't depend on the batch are evaluated as usual (see SceneEvaluator), once, and their values are
+    shared by every row. Batch evaluations don't change the output values of the nodes, and aren't cached.
+    """
+
+    def __init__(self, scene):
+        self.scene = scene
+
+        self.last_evaluated = []    # Nodes evaluated over the batch by the last call to evaluate(), in order
+
+
+    def getColumns(self, batch):
+        """
+        Returns the size of the batch and its columns, by node: a list with the column of each output of the node, or
+        None for the outputs that the batch doesn't give. The batch is a dict (or a list of records, see
+        recordsToColumns) whose keys are output sockets, or nodes for their first output.
+        """
+        if not isinstance(batch, dict): batch = recordsToColumns(batch)
+
+        size = None
+        columns = {}
+        for key, column in batch.items():
+            socket = key.outputs[0] if hasattr(key, 'outputs') else key
+            if (size is None): size = len(column)
+            if (len(column) != size):
+                raise ValueError("The columns of the batch have different sizes (%d and %d for %s)" % (size, len(column), socket.node))
+
+            node_columns = columns.get(socket.node)
+            if (node_columns is None): node_columns = columns[socket.node] = [None] * len(socket.node.outputs)
+            node_columns[socket.index] = column
+        return (size or 0), columns
+
+
+    def evaluate(self, nodes, batch):
+        """
+        Evaluates the given nodes over a batch (see getColumns). Returns the columns of the outputs of each node, in a
+        list. Nodes that don't depend on the batch give their usual values, repeated for every row.
+        If a node fails, EvaluationError is raised, with the row that failed if it was evaluated row by row.
+        """
+        nodes = list(nodes)
+        size, columns = self.getColumns(batch)
+        self.last_evaluated = []
+
+        # Nodes of the batch are not evaluated, so the search stops there
+        order = self.scene.evaluator.getEvaluationOrder(nodes, lambda node: node not in columns)
+        batched = set(columns)
+        scalar_nodes = [node for node, node_columns in columns.items() if None in node_columns]
+        for node in order:
+            if any(input_node in batched for input_node in node.getInputNodes()):
+                batched.add(node)
+            else:
+                scalar_nodes.append(node)
+
+        # The values shared by every row
+        self.scene.evaluator.evaluate(scalar_nodes)
+
+        for node in order:
+            if (node not in batched): continue
+            columns[node] = self.evaluateNode(node, columns, size)
+            self.last_evaluated.append(node)
+
+        return [self.getOutputColumns(node, columns, size) for node in nodes]
+
+
+    def getOutputColumns(self, node, columns, size):
+        """ Returns the columns of the node's outputs, repeating the usual values of the ones that aren't batched """
+        node_columns = columns.get(node)
+        if (node_columns is not None and None not in node_columns): return node_columns
+
+        output_values = self.scene.evaluator.evaluate([node])[0]
+        if (node_columns is None): node_columns = [None] * len(output_values)
+        return [[value] * size if (column is None) else column for column, value in zip(node_columns, output_values)]
+
+
+    def getInputs(self, node, columns):
+        """ Returns how each input of the node gets its value for each row: (SCALAR, value), (COLUMN, column) or (MULTI, inputs) """
+        inputs = []
+        for socket in node.inputs:
+            values = []
+            for output in socket.getConnectedSockets():
+                node_columns = columns.get(output.node)
+                column = None if node_columns is None else node_columns[output.index]
+                if (column is not None):
+                    values.append((COLUMN, column))
+                else:
+                    values.append((SCALAR, resolvePayloads([output.node.output_values[output.index]])[0]))
+
+            if socket.is_multi_edges:
+                inputs.append((MULTI, values))
+            else:
+                inputs.append(values[0] if values else (SCALAR, None))
+        return inputs
+
+
+    def evaluateNode(self, node, columns, size):
+        """ Computes the columns of a node's outputs, given the columns of the nodes it depends on """
+        if DEBUG: print("SceneBatchEvaluator::evaluateNode ~", node, "over", size, "rows")
+        inputs = self.getInputs(node, columns)
+
+        if node.eval_vectorized:
+            input_values = [[self.getColumn(item_kind, value, size) for item_kind, value in values] if (kind == MULTI) else
+                            self.getColumn(kind, values, size)
+                            for kind, values in inputs]
+            try:
+                output_columns = node.evalBatch(input_values, size)
+                if (output_columns is None or len(output_columns) != len(node.outputs)):
+                    raise ValueError("%s returned %s for %d outputs" % (node, output_columns, len(node.outputs)))
+                for column in output_columns:
+                    if (len(column) != size): raise ValueError("%s returned a column of %d rows for %d" % (node, len(column), size))
+            except Exception as e:
+                raise EvaluationError(node, e) from e
+            return list(output_columns)
+
+        if inspect.iscoroutinefunction(node.evalImplementation):
+            results = self.scene.scheduler.async_loop.runRows(node, [self.getRow(inputs, i) for i in range(size)])
+        else:
+            results = None
+
+        output_rows = []
+        for i in range(size):
+            try:
+                if (results is None):
+                    output_values = node.evalImplementation(self.getRow(inputs, i))
+                else:
+                    output_values = results[i]
+                    if isinstance(output_values, BaseException): raise output_values
+                self.scene.evaluator.checkOutputValues(node, output_values)
+            except Exception as e:
+                raise EvaluationError(node, e, i) from e
+            output_rows.append(output_values)
+
+        if not output_rows: return [[] for socket in node.outputs]
+        return [list(column) for column in zip(*output_rows)]
+
+
+    def getRow(self, inputs, i):
+        """ Returns the input values of row i """
+        return [value if (kind == SCALAR) else
+                value[i] if (kind == COLUMN) else
+                self.getRow(value, i)
+                for kind, value in inputs]
+
+
+    def getColumn(self, kind, value, size):
+        """ Returns the column of an input: the batch's column, or its single value repeated for every row """
+        return value if (kind == COLUMN) else [value] * size
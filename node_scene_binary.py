@@ -0,0 +1,403 @@
+import os
+import sys
+import copy
+import math
+import json
+import bisect
+import struct
+from array import array
+from collections import OrderedDict
+from node_scene_json import writeSceneJson, SceneJsonReader
+
+
+DEBUG = False
+
+# Compact binary file format for scenes. It holds the same data as the JSON files (see Scene.serialize), so that files
+# can be converted from one format to the other and back without losing anything:
+#
+#     header          HEADER
+#     string table    for each string: its length in bytes (uint32) + the string in utf-8.
+#                     Holds the titles and the contents of the nodes (as JSON), each different string only once.
+#     node columns    NODE_COLUMNS, one array per column. title and content are indexes in the string table,
+#                     inputs and outputs are the number of sockets of each kind.
+#     socket columns  SOCKET_COLUMNS, for the inputs and then the outputs of each node, in the same order as the nodes.
+#     edge columns    EDGE_COLUMNS
+#
+# Chunked files (version 2, with FLAG_CHUNKED) group the nodes by their position in square chunks of the scene, so
+# that the nodes in one area can be read without reading the rest of the file (see SceneChunkedFile):
+#
+#     header          HEADER
+#     string table    Same as above
+#     chunk header    CHUNK_HEADER
+#     chunk columns   CHUNK_COLUMNS, with the bounds of the positions of the nodes in each chunk, and where they are
+#     edge columns    CHUNK_EDGE_COLUMNS, the chunks of the nodes at both ends of the edges
+#     id columns      ID_COLUMNS, every id in the file (nodes, sockets and edges) sorted, and the chunk where it is.
+#                     Edges are in the chunk of their start socket.
+#     chunks          For each chunk, its node columns and socket columns, as above
+#
+# All numbers are little endian.
+
+SCENE_BINARY_EXTENSION = ".qdmg"
+SCENE_BINARY_MAGIC = b"QDMG"
+SCENE_BINARY_VERSION = 2    # Latest version that can be read. Files that aren't chunked are written as version 1.
+
+FLAG_CHUNKED = 1
+
+# Magic, version, flags, number of nodes, sockets, edges and strings, scene id, width and height
+HEADER = struct.Struct("<4sHHIIIIqqq")
+# Size of the chunks, number of chunks
+CHUNK_HEADER = struct.Struct("<dI")
+
+# Typecodes of the columns (array module) for each kind of record. Columns are stored one after another.
+NODE_COLUMNS = (('id', 'q'), ('pos_x', 'd'), ('pos_y', 'd'), ('title', 'I'), ('content', 'I'), ('inputs', 'I'), ('outputs', 'I'))
+SOCKET_COLUMNS = (('id', 'q'), ('index', 'i'), ('multi_edges', 'B'), ('position', 'B'), ('socket_type', 'i'))
+EDGE_COLUMNS = (('id', 'q'), ('edge_type', 'i'), ('start', 'q'), ('end', 'q'))
+CHUNK_COLUMNS = (('left', 'd'), ('top', 'd'), ('right', 'd'), ('bottom', 'd'), ('offset', 'q'), ('nodes', 'I'), ('sockets', 'I'))
+CHUNK_EDGE_COLUMNS = EDGE_COLUMNS + (('start_chunk', 'I'), ('end_chunk', 'I'))
+ID_COLUMNS = (('id', 'q'), ('chunk', 'I'))
+
+
+def isSceneBinaryFile(filename):
+    """ Returns True if the file is a scene saved in the binary format, by looking at its first bytes """
+    with open(filename, "rb") as file:
+        return (file.read(len(SCENE_BINARY_MAGIC)) == SCENE_BINARY_MAGIC)
+
+
+def isSceneChunkedFile(filename):
+    """ Returns True if the file is a scene saved in the chunked binary format """
+    with open(filename, "rb") as file:
+        header = file.read(HEADER.size)
+    if (len(header) < HEADER.size): return False
+    magic, version, flags = HEADER.unpack(header)[:3]
+    return (magic == SCENE_BINARY_MAGIC and bool(flags & FLAG_CHUNKED))
+
+
+def _newColumns(layout):
+    return {name: array(typecode) for name, typecode in layout}
+
+
+def _columnsSize(layout, count):
+    """ Returns the number of bytes that the columns of count records take in the file """
+    return sum(array(typecode).itemsize for name, typecode in layout) * count
+
+
+def _writeColumns(file, columns, layout):
+    for name, typecode in layout:
+        values = columns[name]
+        if (sys.byteorder != 'little'): values.byteswap()
+        values.tofile(file)
+
+
+def _readColumns(file, layout, count):
+    columns = {}
+    for name, typecode in layout:
+        values = array(typecode)
+        values.fromfile(file, count)
+        if (sys.byteorder != 'little'): values.byteswap()
+        columns[name] = values
+    return columns
+
+
+def _readHeader(file):
+    header = HEADER.unpack(file.read(HEADER.size))
+    magic, version = header[:2]
+
+    if (magic != SCENE_BINARY_MAGIC):
+        raise ValueError("Invalid scene file: not a binary scene file")
+    if (version > SCENE_BINARY_VERSION):
+        raise ValueError("Invalid scene file: version %d is not supported" % version)
+
+    return header
+
+
+def _readStrings(file, count):
+    strings = []
+    for i in range(count):
+        length, = struct.unpack("<I", file.read(4))
+        strings.append(file.read(length).decode('utf-8'))
+    return strings
+
+
+def writeSceneBinary(file, data, chunk_size=None):
+    """
+    Writes the scene's data (as returned by Scene.serialize) to a file opened in binary mode.
+    data['nodes'] and data['edges'] can be generators: their records are stored in compact columns as they are read.
+    If chunk_size is given, the file is chunked: nodes are grouped in square chunks of that size (in scene units).
+    """
+    strings = {}    # String -> its index in the string table
+
+    def stringIndex(string):
+        if string not in strings: strings[string] = len(strings)
+        return strings[string]
+
+    chunks = {}         # (column, row) of the chunk (or None if not chunked) -> its node columns and socket columns
+    socket_chunks = {}  # Socket id -> (column, row) of its chunk, to know the chunks of the edges
+
+    for node_data in data['nodes']:
+        key = None
+        if chunk_size is not None:
+            key = (math.floor(node_data['pos_x'] / chunk_size), math.floor(node_data['pos_y'] / chunk_size))
+        if key not in chunks:
+            chunks[key] = (_newColumns(NODE_COLUMNS), _newColumns(SOCKET_COLUMNS))
+        nodes, sockets = chunks[key]
+
+        nodes['id'].append(node_data['id'])
+        nodes['pos_x'].append(node_data['pos_x'])
+        nodes['pos_y'].append(node_data['pos_y'])
+        nodes['title'].append(stringIndex(node_data['title']))
+        nodes['content'].append(stringIndex(json.dumps(node_data['content'])))
+        nodes['inputs'].append(len(node_data['inputs']))
+        nodes['outputs'].append(len(node_data['outputs']))
+
+        for socket_data in (node_data['inputs'] + node_data['outputs']):
+            for name, typecode in SOCKET_COLUMNS:
+                sockets[name].append(socket_data[name])
+            if chunk_size is not None: socket_chunks[socket_data['id']] = key
+
+    chunk_index = {key: i for i, key in enumerate(chunks)}
+
+    edges = _newColumns(CHUNK_EDGE_COLUMNS if chunk_size is not None else EDGE_COLUMNS)
+    for edge_data in data['edges']:
+        for name, typecode in EDGE_COLUMNS:
+            edges[name].append(edge_data[name])
+        if chunk_size is not None:
+            edges['start_chunk'].append(chunk_index[socket_chunks[edge_data['start']]])
+            edges['end_chunk'].append(chunk_index[socket_chunks[edge_data['end']]])
+
+    n_nodes = sum(len(nodes['id']) for nodes, sockets in chunks.values())
+    n_sockets = sum(len(sockets['id']) for nodes, sockets in chunks.values())
+    n_edges = len(edges['id'])
+
+    file.write(HEADER.pack(SCENE_BINARY_MAGIC, 1 if chunk_size is None else 2, 0 if chunk_size is None else FLAG_CHUNKED,
+                           n_nodes, n_sockets, n_edges, len(strings), data['id'], data['scene_width'], data['scene_height']))
+
+    for string in strings:      # Dicts keep insertion order, which is the order of the indexes
+        encoded = string.encode('utf-8')
+        file.write(struct.pack("<I", len(encoded)))
+        file.write(encoded)
+
+    if chunk_size is None:
+        nodes, sockets = chunks[None] if chunks else (_newColumns(NODE_COLUMNS), _newColumns(SOCKET_COLUMNS))
+        _writeColumns(file, nodes, NODE_COLUMNS)
+        _writeColumns(file, sockets, SOCKET_COLUMNS)
+        _writeColumns(file, edges, EDGE_COLUMNS)
+
+    else:
+        # Table of chunks. The chunks themselves go after the edges and ids.
+        table = _newColumns(CHUNK_COLUMNS)
+        ids = []
+        offset = (file.tell() + CHUNK_HEADER.size + _columnsSize(CHUNK_COLUMNS, len(chunks)) +
+                  _columnsSize(CHUNK_EDGE_COLUMNS, n_edges) + _columnsSize(ID_COLUMNS, n_nodes + n_sockets + n_edges))
+
+        for i, (nodes, sockets) in enumerate(chunks.values()):
+            table['left'].append(min(nodes['pos_x']))
+            table['top'].append(min(nodes['pos_y']))
+            table['right'].append(max(nodes['pos_x']))
+            table['bottom'].append(max(nodes['pos_y']))
+            table['offset'].append(offset)
+            table['nodes'].append(len(nodes['id']))
+            table['sockets'].append(len(sockets['id']))
+            offset += _columnsSize(NODE_COLUMNS, len(nodes['id'])) + _columnsSize(SOCKET_COLUMNS, len(sockets['id']))
+
+            ids.extend((node_id, i) for node_id in nodes['id'])
+            ids.extend((socket_id, i) for socket_id in sockets['id'])
+        ids.extend(zip(edges['id'], edges['start_chunk']))
+        ids.sort()
+
+        file.write(CHUNK_HEADER.pack(chunk_size, len(chunks)))
+        _writeColumns(file, table, CHUNK_COLUMNS)
+        _writeColumns(file, edges, CHUNK_EDGE_COLUMNS)
+        _writeColumns(file, {'id': array('q', (i[0] for i in ids)), 'chunk': array('I', (i[1] for i in ids))}, ID_COLUMNS)
+
+        for nodes, sockets in chunks.values():
+            _writeColumns(file, nodes, NODE_COLUMNS)
+            _writeColumns(file, sockets, SOCKET_COLUMNS)
+
+    if DEBUG: print("writeSceneBinary ~", n_nodes, "nodes,", n_edges, "edges,", len(strings), "strings,", len(chunks), "chunks")
+
+
+def _iterNodeRecords(strings, nodes, sockets):
+    """ Yields the data of each node (with its sockets) stored in the columns """
+    def socketData(i):
+        return OrderedDict([
+            ('id', sockets['id'][i]),
+            ('index', sockets['index'][i]),
+            ('multi_edges', bool(sockets['multi_edges'][i])),
+            ('position', sockets['position'][i]),
+            ('socket_type', sockets['socket_type'][i]),
+        ])
+
+    socket_i = 0
+    for i in range(len(nodes['id'])):
+        n_inputs, n_outputs = nodes['inputs'][i], nodes['outputs'][i]
+        inputs = [socketData(j) for j in range(socket_i, socket_i + n_inputs)]
+        outputs = [socketData(j) for j in range(socket_i + n_inputs, socket_i + n_inputs + n_outputs)]
+        socket_i += n_inputs + n_outputs
+
+        yield OrderedDict([
+            ('id', nodes['id'][i]),
+            ('title', strings[nodes['title'][i]]),
+            ('pos_x', nodes['pos_x'][i]),
+            ('pos_y', nodes['pos_y'][i]),
+            ('inputs', inputs),
+            ('outputs', outputs),
+            ('content', json.loads(strings[nodes['content'][i]], object_pairs_hook=OrderedDict)),
+        ])
+
+
+def _edgeRecord(edges, i):
+    return OrderedDict([
+        ('id', edges['id'][i]),
+        ('edge_type', edges['edge_type'][i]),
+        ('start', edges['start'][i]),
+        ('end', edges['end'][i]),
+    ])
+
+
+def readSceneBinary(file):
+    """
+    Reads a scene from a file opened in binary mode, and returns its data in the same form as Scene.serialize.
+    The columns are kept in compact arrays, and data['nodes'] and data['edges'] are generators that build the
+    dict of each record when iterated. Chunked files are read one chunk at a time.
+    """
+    magic, version, flags, n_nodes, n_sockets, n_edges, n_strings, scene_id, scene_width, scene_height = _readHeader(file)
+
+    if (flags & FLAG_CHUNKED):
+        file.seek(0)
+        chunked = SceneChunkedFile(file)
+        nodes = (node_data for i in range(chunked.n_chunks) for node_data in chunked.readChunk(i))
+        edges = (chunked.edgeData(i) for i in range(n_edges))
+
+    else:
+        strings = _readStrings(file, n_strings)
+        nodes = _iterNodeRecords(strings, _readColumns(file, NODE_COLUMNS, n_nodes), _readColumns(file, SOCKET_COLUMNS, n_sockets))
+        edge_columns = _readColumns(file, EDGE_COLUMNS, n_edges)
+        edges = (_edgeRecord(edge_columns, i) for i in range(n_edges))
+
+    return OrderedDict([
+        ('id', scene_id),
+        ('scene_width', scene_width),
+        ('scene_height', scene_height),
+        ('nodes', nodes),
+        ('edges', edges),
+    ])
+
+
+
+class SceneChunkedFile():
+    """
+    Reads a chunked binary file (see writeSceneBinary) on demand. Only the tables of chunks, edges and ids are read
+    when it's opened. The nodes of each chunk are read from the file when asked for, so the file must stay open.
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+        magic, version, flags, n_nodes, n_sockets, n_edges, n_strings, self.scene_id, self.scene_width, self.scene_height = \
+            _readHeader(file)
+        if not (flags & FLAG_CHUNKED):
+            raise ValueError("Invalid scene file: the file is not chunked")
+
+        self.n_edges = n_edges
+        self.strings = _readStrings(file, n_strings)
+        self.chunk_size, self.n_chunks = CHUNK_HEADER.unpack(file.read(CHUNK_HEADER.size))
+        self.chunks = _readColumns(file, CHUNK_COLUMNS, self.n_chunks)
+        self.edges = _readColumns(file, CHUNK_EDGE_COLUMNS, n_edges)
+        self.ids = _readColumns(file, ID_COLUMNS, n_nodes + n_sockets + n_edges)
+
+
+    def chunkBounds(self, i):
+        """ Returns (left, top, right, bottom) of the positions of the nodes in the chunk """
+        return (self.chunks['left'][i], self.chunks['top'][i], self.chunks['right'][i], self.chunks['bottom'][i])
+
+
+    def readChunk(self, i):
+        """ Reads the nodes of a chunk from the file, and returns a list with the data of each one """
+        self.file.seek(self.chunks['offset'][i])
+        nodes = _readColumns(self.file, NODE_COLUMNS, self.chunks['nodes'][i])
+        sockets = _readColumns(self.file, SOCKET_COLUMNS, self.chunks['sockets'][i])
+        return list(_iterNodeRecords(self.strings, nodes, sockets))
+
+
+    def edgeData(self, i):
+        return _edgeRecord(self.edges, i)
+
+
+    def reopen(self):
+        """
+        Returns a reader of the same file with a handle of its own, so that it can read chunks from another thread
+        while this one is used. The tables are shared, since they never change. It has to be closed once done.
+        """
+        reader = copy.copy(self)
+        reader.file = _reopenFile(self.file)
+        return reader
+
+
+    def close(self):
+        self.file.close()
+
+
+    def chunkOfId(self, obj_id):
+        """ Returns the chunk that holds the node, socket or edge with the given id, or None if it's not in the file """
+        ids = self.ids['id']
+        i = bisect.bisect_left(ids, obj_id)
+        if (i < len(ids) and ids[i] == obj_id): return self.ids['chunk'][i]
+        return None
+
+
+class _PositionalFile():
+    """ Reads a file descriptor with os.pread, from a position of its own, so other handles on it don't move it """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.position = 0
+
+    def seek(self, position):
+        self.position = position
+
+    def read(self, size):
+        data = os.pread(self.fd, size, self.position)
+        self.position += len(data)
+        return data
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _reopenFile(file):
+    """
+    Returns a new handle on an open file, with its own position. It reads the same file even if another one was moved
+    to its path since it was opened (such as by saving over it). Where there's no os.pread (Windows), the file is
+    opened again by its name: open files can't be replaced there.
+    """
+    if hasattr(os, 'pread'):
+        return _PositionalFile(os.dup(file.fileno()))
+    return open(file.name, "rb")
+
+
+def convertSceneFile(source, destination, binary=None, compact=False, chunk_size=None):
+    """
+    Converts a scene file from JSON to binary or the other way around, without loading it into a scene.
+    By default, the format of the destination is the opposite of the format of the source.
+    With chunk_size, the binary file is chunked (see writeSceneBinary).
+    """
+    source_is_binary = isSceneBinaryFile(source)
+    if binary is None: binary = not source_is_binary
+
+    with open(source, "rb" if source_is_binary else "r") as src:
+        data = readSceneBinary(src) if source_is_binary else SceneJsonReader(src).read()
+
+        with open(destination, "wb" if binary else "w") as dst:
+            if binary: writeSceneBinary(dst, data, chunk_size)
+            else:      writeSceneJson(dst, data, indent=None if compact else 4)
+
+
+
+if __name__ == '__main__':
+    if (len(sys.argv) not in (3, 4)):
+        print("Usage: python node_scene_binary.py SOURCE DESTINATION [CHUNK_SIZE]")
+        print("Converts a scene file from JSON to binary (%s), or from binary to JSON" % SCENE_BINARY_EXTENSION)
+        print("With CHUNK_SIZE, the binary file is chunked so that it can be loaded partially")
+        sys.exit(1)
+
+    convertSceneFile(sys.argv[1], sys.argv[2], chunk_size=float(sys.argv[3]) if len(sys.argv) == 4 else None)
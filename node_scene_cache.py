@@ -0,0 +1,394 @@
+import os
+import sys
+import struct
+import pickle
+import hashlib
+import tempfile
+from collections import OrderedDict
+from node_scene_stream import isStreamValue
+from node_scene_shared import SharedPayload, iterPayloads
+
+
+DEBUG = False
+
+CACHE_FILE_SUFFIX = ".pickle"
+
+CACHE_MAX_PAYLOAD_SIZE = 16 * 1024 * 1024   # Larger outputs in shared memory aren't cached (see SceneResultCache.store)
+
+
+class UnhashableValue(Exception):
+    pass
+
+
+def estimateSize(value):
+    """
+    Returns roughly how many bytes a value takes in memory, without copying it: the size of each object, plus the
+    size of the items of lists, tuples, sets and dicts. Arrays (anything with nbytes, like NumPy arrays) count their
+    data. Other objects are measured by their pickle, or by sys.getsizeof if they can't be pickled.
+    """
+    size = 0
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if (value is None or isinstance(value, (bool, int, float, complex, str, bytes, bytearray))):
+            size += sys.getsizeof(value)
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            size += sys.getsizeof(value)
+            stack.extend(value)
+        elif isinstance(value, dict):
+            size += sys.getsizeof(value)
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(getattr(value, 'nbytes', None), int):
+            size += sys.getsizeof(value, 0) + value.nbytes
+        else:
+            try:
+                size += len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+            except Exception:
+                size += sys.getsizeof(value, 0)
+    return size
+
+
+class SceneResultCache():
+    """
+    Remembers the output values of the nodes, so that a node that is evaluated again with the same inputs and content
+    doesn't compute them again. Results are keyed by a hash of the node's type, the state of its content
+    (Node.getContentData) and its input values, so the same key gives the same result in any scene and session.
+
+    It has two tiers: recently used results are kept in memory, up to memory_budget bytes (as estimated by
+    estimateSize), and if a directory is set, every result is also written there, in a file named after its key,
+    so it can be found again in later sessions. The directory is limited to disk_budget bytes (if given) by removing
+    the files that were used least recently.
+
+    Node types whose results can change with the same inputs (they read files, the clock...) set Node.eval_cacheable
+    to False. Node types bump Node.eval_cache_version when their implementation changes, so old results aren't used.
+
+    Results found in memory are the same objects that were stored, not copies, just like the nodes reading an output
+    all get the same object. So output and input values must be treated as immutable: nodes must not change them.
+    """
+
+    def __init__(self, scene, memory_budget=256 * 1024 * 1024, directory=None, disk_budget=None):
+        self.scene = scene
+        self.enabled = True
+
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.max_payload_size = CACHE_MAX_PAYLOAD_SIZE
+        self.directory = None
+        self.disk_size = 0
+
+        self._memory = OrderedDict()    # Key -> (output values, size), least recently used first
+        self.memory_size = 0
+        self._node_keys = {}            # Node -> key of its last result, to invalidate it
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        if (directory is not None): self.setDirectory(directory)
+
+
+    def setDirectory(self, directory):
+        """ Sets the folder of the disk tier (None to only cache in memory) """
+        self.directory = directory
+        self.disk_size = 0
+        if (directory is None): return
+
+        os.makedirs(directory, exist_ok=True)
+        for path in self._iterFiles():
+            self.disk_size += os.path.getsize(path)
+
+
+    def getStats(self):
+        """ Returns the counters of the cache, as a dict """
+        lookups = self.hits + self.disk_hits + self.misses
+        return OrderedDict([
+            ('hits', self.hits),
+            ('disk_hits', self.disk_hits),
+            ('misses', self.misses),
+            ('hit_rate', (self.hits + self.disk_hits) / lookups if lookups else 0.0),
+            ('evictions', self.evictions),
+            ('disk_evictions', self.disk_evictions),
+            ('memory_entries', len(self._memory)),
+            ('memory_size', self.memory_size),
+            ('disk_size', self.disk_size),
+        ])
+
+
+    def resetStats(self):
+        self.hits = self.disk_hits = self.misses = self.evictions = self.disk_evictions = 0
+
+
+    # Keys
+
+    def getKey(self, node, input_values):
+        """ Returns the key of the node's result for the given input values, or None if it can't be cached """
+        if not (self.enabled and node.eval_cacheable): return None
+
+        node_type = type(node)
+        h = hashlib.sha256()
+        h.update(("%s.%s:%s" % (node_type.__module__, node_type.__qualname__, node.eval_cache_version)).encode())
+        # Nodes of the same type can have different sockets, which change the shape of their inputs and outputs
+        h.update(("%s:%d;" % ("".join("m" if socket.is_multi_edges else "s" for socket in node.inputs),
+                              len(node.outputs))).encode())
+        try:
+            self._hashValue(h, node.getContentData())
+            self._hashValue(h, input_values)
+        except UnhashableValue as e:
+            if DEBUG: print("SceneResultCache::getKey ~", node, "can't be cached:", e)
+            return None
+        return h.hexdigest()
+
+
+    def _hashValue(self, h, value):
+        """
+        Feeds a value to the hash. Common types are hashed by their content, so that equal values give the same
+        hash in any session (unlike hash(), or pickle for dicts and sets). Other objects are hashed by their pickle.
+        """
+        if isStreamValue(value):
+            raise UnhashableValue("streams are read once")
+        elif (value is None or isinstance(value, bool)):
+            h.update(b"N" if value is None else (b"T" if value else b"F"))
+        elif isinstance(value, int):
+            h.update(b"i%d;" % value)
+        elif isinstance(value, float):
+            h.update(b"f" + struct.pack("<d", value))
+        elif isinstance(value, str):
+            data = value.encode("utf-8", "surrogatepass")
+            h.update(b"s%d:" % len(data))
+            h.update(data)
+        elif isinstance(value, (bytes, bytearray)):
+            h.update(b"b%d:" % len(value))
+            h.update(value)
+        elif isinstance(value, SharedPayload):
+            # By its data, since its name changes every time it's produced
+            h.update(b"m%d:%s:" % (value.size, repr((value.dtype, value.shape)).encode()))
+            h.update(value.view())
+        elif isinstance(value, (list, tuple)):
+            h.update(b"l%d:" % len(value))
+            for item in value:
+                self._hashValue(h, item)
+        elif isinstance(value, dict):
+            h.update(b"d%d:" % len(value))
+            for item_hash, item_key in sorted((self._valueDigest(k), k) for k in value):
+                h.update(item_hash)
+                self._hashValue(h, value[item_key])
+        elif isinstance(value, (set, frozenset)):
+            h.update(b"e%d:" % len(value))
+            for item_hash in sorted(self._valueDigest(item) for item in value):
+                h.update(item_hash)
+        else:
+            try:
+                data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                raise UnhashableValue(repr(e)) from e
+            h.update(b"p%d:" % len(data))
+            h.update(data)
+
+
+    def _valueDigest(self, value):
+        h = hashlib.sha256()
+        self._hashValue(h, value)
+        return h.digest()
+
+
+    # Lookups
+
+    def get(self, key):
+        """ Returns the output values stored with the key, or None. Results found on disk are moved to memory. """
+        if (key is None): return None
+
+        entry = self._memory.get(key)
+        if (entry is not None):
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        if (self.directory is not None):
+            path = self._getPath(key)
+            try:
+                with open(path, "rb") as file:
+                    data = file.read()
+                output_values = pickle.loads(data)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print("!W:", "SceneResultCache::get", "could not read", path, ":", e)
+            else:
+                os.utime(path)     # So that it's the last one removed when the disk is over its budget
+                self.disk_hits += 1
+                self._remember(key, output_values, estimateSize(output_values))
+                return output_values
+
+        self.misses += 1
+        return None
+
+
+    def lookup(self, node, input_values):
+        """ Returns the key for the node with the given inputs, and the values cached for it (or None) """
+        key = self.getKey(node, input_values)
+        output_values = self.get(key)
+        if (output_values is None): return key, None
+
+        try:
+            self.scene.evaluator.checkOutputValues(node, output_values)
+        except ValueError as e:
+            # Stored by a different implementation of the node type, which didn't bump its eval_cache_version
+            print("!W:", "SceneResultCache::lookup", "dropping the cached result of", node, ":", e)
+            self.remove(key)
+            return key, None
+
+        self._node_keys[node] = key
+        return key, output_values
+
+
+    def store(self, node, key, output_values):
+        """ Stores the output values of the node, computed for the given key """
+        if (key is None): return
+        self._node_keys[node] = key
+        if any(isStreamValue(value) for value in output_values): return     # Streams are read once
+        # Shared memory is freed once read, so the cache keeps a copy of the data. Copying large outputs would cost
+        # more than computing them again.
+        if any(value.size > self.max_payload_size for value in iterPayloads(output_values)): return
+        output_values = [value.toValue() if isinstance(value, SharedPayload) else value for value in output_values]
+
+        self._remember(key, output_values, estimateSize(output_values))
+        if (self.directory is None): return
+
+        try:
+            data = pickle.dumps(output_values, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            if DEBUG: print("SceneResultCache::store ~", node, "results can't be written to disk:", e)
+            return
+        self._write(key, data)
+
+
+    def _remember(self, key, output_values, size):
+        """ Puts a result in the memory tier, evicting the least recently used ones to keep it under its budget """
+        if (size > self.memory_budget): return
+
+        previous = self._memory.pop(key, None)
+        if (previous is not None): self.memory_size -= previous[1]
+        self._memory[key] = (output_values, size)
+        self.memory_size += size
+
+        while (self.memory_size > self.memory_budget):
+            evicted_key, (evicted_values, evicted_size) = self._memory.popitem(last=False)
+            self.memory_size -= evicted_size
+            self.evictions += 1
+
+
+    # Disk tier
+
+    def _getPath(self, key):
+        return os.path.join(self.directory, key[:2], key + CACHE_FILE_SUFFIX)
+
+
+    def _iterFiles(self):
+        for folder, subfolders, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith(CACHE_FILE_SUFFIX): yield os.path.join(folder, filename)
+
+
+    def _write(self, key, data):
+        """ Writes a result to the disk tier. It's written to a temporary file first, so it's never left half written. """
+        path = self._getPath(key)
+        if os.path.exists(path): return     # Same key, same content
+
+        folder = os.path.dirname(path)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=folder)
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(data)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        except OSError as e:
+            print("!W:", "SceneResultCache::_write", "could not write", path, ":", e)
+            return
+
+        self.disk_size += len(data)
+        if (self.disk_budget is not None and self.disk_size > self.disk_budget): self.pruneDisk()
+
+
+    def pruneDisk(self):
+        """ Removes the files used least recently until the disk tier is back under its budget """
+        files = []
+        for path in self._iterFiles():
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        self.disk_size = sum(size for mtime, size, path in files)
+        for mtime, size, path in files:
+            if (self.disk_size <= self.disk_budget): break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.disk_size -= size
+            self.disk_evictions += 1
+
+
+    # Invalidation
+
+    def remove(self, key):
+        """ Forgets the result stored with the key, in memory and on disk """
+        entry = self._memory.pop(key, None)
+        if (entry is not None): self.memory_size -= entry[1]
+
+        if (self.directory is not None):
+            path = self._getPath(key)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self.disk_size -= size
+            except OSError:
+                pass
+
+
+    def invalidate(self, node, downstream=True):
+        """
+        Forgets the last result of the node, and of every node that depends on it if downstream, and marks them dirty
+        so that they're computed again.
+        """
+        nodes = [node]
+        if downstream:
+            stack = [node]
+            seen = set(nodes)
+            while stack:
+                for output_node in stack.pop().getOutputNodes():
+                    if output_node not in seen:
+                        seen.add(output_node)
+                        nodes.append(output_node)
+                        stack.append(output_node)
+
+        for invalid_node in nodes:
+            key = self._node_keys.pop(invalid_node, None)
+            if (key is not None): self.remove(key)
+            invalid_node.markDirty()
+
+
+    def forgetNode(self, node):
+        """ Called when a node is removed from the scene. Its results stay cached, for other nodes with the same key. """
+        self._node_keys.pop(node, None)
+
+
+    def clear(self, disk=False):
+        """ Forgets the results in memory, and also the ones on disk if disk """
+        self._memory = OrderedDict()
+        self.memory_size = 0
+        self._node_keys = {}
+
+        if (disk and self.directory is not None):
+            for path in list(self._iterFiles()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.disk_size = 0
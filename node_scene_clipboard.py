@@ -95,20 +95,24 @@ class SceneClipboard():
         offset_x = mouse_scene_pos.x() - bbox_center_x
         offset_y = mouse_scene_pos.y() - bbox_center_y
 
-        # Create each node
-        for node_data in data['nodes']:
-            new_node = Node(self.scene)
-            new_node.deserialize(node_data, hashmap, restore_id=False)
-
-            # Read just the new node's position
-            pos = new_node.pos
-            new_node.setPos(pos.x() + offset_x, pos.y() + offset_y)
-
-        # Create each edge
-        if 'edges' in data:
-            for edge_data in data['edges']:
-                new_edge = Edge(self.scene)
-                new_edge.deserialize(edge_data, hashmap, restore_id=False)
+        self.scene.beginBulkLoad(len(data['nodes']) + len(data.get('edges', ())))
+        try:
+            # Create each node
+            for node_data in data['nodes']:
+                new_node = Node(self.scene)
+                new_node.deserialize(node_data, hashmap, restore_id=False)
+
+                # Read just the new node's position
+                pos = new_node.pos
+                new_node.setPos(pos.x() + offset_x, pos.y() + offset_y)
+
+            # Create each edge
+            if 'edges' in data:
+                for edge_data in data['edges']:
+                    new_edge = Edge(self.scene, edge_type=edge_data['edge_type'])
+                    new_edge.deserialize(edge_data, hashmap, restore_id=False)
+        finally:
+            self.scene.endBulkLoad()
 
         # Store history
         self.scene.history.storeHistory("Pasted elements in scene", setModified=True)
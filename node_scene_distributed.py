@@ -0,0 +1,372 @@
+import os
+import sys
+import time
+import queue
+import threading
+import itertools
+import traceback
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import Listener, Client, wait as waitConnections
+
+
+DEBUG = False
+
+HEARTBEAT_INTERVAL = 1.0        # Seconds between the heartbeats of the workers
+HEARTBEAT_TIMEOUT = 5.0         # A worker that wasn't heard from for this long is considered dead
+AUTHKEY_ENV = "NODE_EDITOR_AUTHKEY"
+
+
+class WorkerError(Exception):
+    """ A node failed in a worker (its traceback is the message), or it couldn't be evaluated by any worker """
+    pass
+
+
+class _Task():
+    """ A node to evaluate, waiting for a worker or being evaluated by one """
+
+    def __init__(self, task_id, node_id, node_type, input_values):
+        self.id = task_id
+        self.node_id = node_id
+        self.node_type = node_type
+        self.input_values = input_values
+        self.future = Future()
+        self.started = False    # Given to a worker at least once, so it can't be cancelled anymore
+        self.attempts = 0       # Workers that died while evaluating it
+
+
+    def start(self):
+        """ Returns False if the task was cancelled before it was started """
+        if not self.started:
+            if not self.future.set_running_or_notify_cancel(): return False
+            self.started = True
+        return True
+
+
+class _Worker():
+    """ A worker connected to the coordinator """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.pid = None
+        self.graph_version = 0      # Version of the graph the worker has
+        self.tasks = {}             # Id -> task being evaluated
+        self.last_seen = time.monotonic()
+
+    def __repr__(self):
+        return "<Worker %s>" % self.pid
+
+
+
+class SceneCoordinator():
+    """
+    Spreads the evaluation of nodes across worker processes, which connect to it over a local socket (TCP, or Unix
+    if address is a path). It's the 'distributed' pool of SceneScheduler: the scheduler finds the nodes that are
+    ready, and the coordinator assigns each one to an idle worker, and gives back its result as a future.
+
+    Workers get the graph in the form of Scene.serialize, and rebuild it as a headless scene. Each task is then just
+    the id of a node, its type, and its input values, and the worker evaluates it with Node.evalStatic (with
+    Node.getEvalParams of the node in its graph).
+    Workers send heartbeats. A worker that stops sending them, or whose connection is lost, is considered dead, and
+    the nodes it was evaluating are given to other workers, up to max_retries times each.
+
+    The coordinator starts workers processes itself (and starts new ones when they die), but more workers can connect,
+    from other terminals: python node_scene_distributed.py ADDRESS, with its authkey (hex) in NODE_EDITOR_AUTHKEY.
+    """
+
+    def __init__(self, workers=None, address=None, max_retries=2, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        self.workers = os.cpu_count() if workers is None else workers     # Worker processes started by the coordinator
+        self.max_retries = max_retries
+        self.heartbeat_timeout = heartbeat_timeout
+
+        self.requested_address = address
+        self.address = None         # Address it listens on, once started
+        self.authkey = os.urandom(32)
+
+        self._listener = None
+        self._running = False
+        self._lock = threading.Lock()
+        self._queue = deque()       # Tasks waiting for a worker
+        self._workers = []          # Connected workers. Only used by the coordinator's thread.
+        self._processes = {}        # Pid -> process started by the coordinator
+        self._new_connections = queue.Queue()
+        self._wakeup_receiver, self._wakeup_sender = multiprocessing.Pipe(duplex=False)
+
+        self._task_ids = itertools.count(1)
+        self._graph = None
+        self._graph_version = 0
+
+
+    def isRunning(self):
+        return self._running
+
+
+    def getWorkerCount(self):
+        """
+        Returns how many workers can take tasks: the ones connected (started by the coordinator or not), or the ones
+        it started if more of them are still connecting
+        """
+        return max(len(self._workers) + self._new_connections.qsize(), len(self._processes))
+
+
+    def start(self):
+        if self._running: return
+        family = 'AF_UNIX' if isinstance(self.requested_address, str) else 'AF_INET'
+        self._listener = Listener(self.requested_address or ('127.0.0.1', 0), family, authkey=self.authkey)
+        self.address = self._listener.address
+        self._running = True
+
+        threading.Thread(target=self._acceptLoop, name="SceneCoordinator accept", daemon=True).start()
+        self._thread = threading.Thread(target=self._loop, name="SceneCoordinator", daemon=True)
+        self._thread.start()
+
+        for i in range(self.workers):
+            self.spawnWorker()
+        if DEBUG: print("SceneCoordinator::start ~ listening on", self.address, "with", self.workers, "workers")
+
+
+    def stop(self):
+        """ Stops the workers. Tasks that were not done fail with WorkerError. """
+        if not self._running: return
+        self._running = False
+
+        # accept() isn't interrupted by closing the listener, so it's woken up by a last connection
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+        self._wake()
+        self._thread.join()
+        self._listener.close()
+
+        # Connections accepted after the loop ended never got 'stop'. Closing them stops their workers.
+        while not self._new_connections.empty():
+            self._new_connections.get().close()
+
+        # Every worker was told to stop (or can't connect anymore), so they're all given the same time to exit
+        deadline = time.monotonic() + self.heartbeat_timeout
+        for process in self._processes.values():
+            process.join(timeout=max(0.0, deadline - time.monotonic()))
+        for process in self._processes.values():
+            if process.is_alive(): process.kill()
+        self._processes = {}
+
+
+    def spawnWorker(self):
+        """ Starts a worker process on this machine """
+        process = multiprocessing.get_context('spawn').Process(target=runWorker, args=(self.address, self.authkey), daemon=True)
+        process.start()
+        self._processes[process.pid] = process
+
+
+    def setGraph(self, data):
+        """ Sets the graph (Scene.serialize) that the next tasks refer to. Workers get it before their next task. """
+        with self._lock:
+            self._graph = data
+            self._graph_version += 1
+
+
+    def submit(self, node, input_values):
+        """ Queues a node to be evaluated by a worker. Returns a concurrent.futures.Future with its output values. """
+        self.start()
+        task = _Task(next(self._task_ids), node.id, type(node), input_values)
+        with self._lock:
+            self._queue.append(task)
+        self._wake()
+        return task.future
+
+
+    def _wake(self):
+        self._wakeup_sender.send_bytes(b"")
+
+
+    def _acceptLoop(self):
+        while self._running:
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                if not self._running: break
+                continue
+            except multiprocessing.AuthenticationError:
+                continue
+            self._new_connections.put(connection)
+            self._wake()
+
+
+    def _loop(self):
+        """ Receives the messages of the workers, watches their heartbeats and assigns them tasks """
+        while self._running:
+            connections = [worker.connection for worker in self._workers]
+            for connection in waitConnections(connections + [self._wakeup_receiver], timeout=HEARTBEAT_INTERVAL):
+                if connection is self._wakeup_receiver:
+                    while self._wakeup_receiver.poll(): self._wakeup_receiver.recv_bytes()
+                    continue
+
+                worker = next(worker for worker in self._workers if worker.connection is connection)
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    self._lose(worker, "its connection was closed")
+                    continue
+                self._handle(worker, message)
+
+            while not self._new_connections.empty():
+                self._workers.append(_Worker(self._new_connections.get()))
+
+            now = time.monotonic()
+            for worker in list(self._workers):
+                if (now - worker.last_seen > self.heartbeat_timeout):
+                    self._lose(worker, "it stopped sending heartbeats")
+
+            self._assign()
+
+        # Stopping
+        for worker in self._workers:
+            try:
+                worker.connection.send(('stop',))
+            except OSError:
+                pass
+            worker.connection.close()
+            self._fail(worker.tasks.values(), "The coordinator was stopped")
+        self._workers = []
+        with self._lock:
+            self._fail(self._queue, "The coordinator was stopped")
+            self._queue.clear()
+
+
+    def _handle(self, worker, message):
+        worker.last_seen = time.monotonic()
+        kind = message[0]
+
+        if (kind == 'hello'):
+            worker.pid = message[1]
+        elif (kind == 'result'):
+            task = worker.tasks.pop(message[1], None)
+            if (task is not None): task.future.set_result(message[2])
+        elif (kind == 'error'):
+            task = worker.tasks.pop(message[1], None)
+            if (task is not None): task.future.set_exception(WorkerError(message[2]))
+
+
+    def _assign(self):
+        """ Gives the waiting tasks to the idle workers """
+        for worker in self._workers:
+            if worker.tasks: continue
+
+            with self._lock:
+                task = None
+                while (self._queue and task is None):
+                    task = self._queue.popleft()
+                    if not task.start(): task = None    # Cancelled while waiting
+                graph, graph_version = self._graph, self._graph_version
+            if (task is None): return
+
+            worker.tasks[task.id] = task
+            try:
+                if (worker.graph_version != graph_version):
+                    worker.connection.send(('graph', graph_version, graph))
+                    worker.graph_version = graph_version
+                worker.connection.send(('task', task.id, task.node_id, task.node_type, task.input_values))
+            except OSError:
+                self._lose(worker, "its connection was closed")
+                return
+            except Exception as e:
+                # The task can't be sent (its input values can't be pickled...)
+                del worker.tasks[task.id]
+                task.future.set_exception(WorkerError("Could not send %s to %s: %r" % (task.node_type.__name__, worker, e)))
+            if DEBUG: print("SceneCoordinator::_assign ~ task", task.id, "to", worker)
+
+
+    def _lose(self, worker, reason):
+        """ A worker died: its tasks go back to the queue (or fail, if they were tried too many times) """
+        if DEBUG: print("SceneCoordinator::_lose ~", worker, "because", reason)
+        self._workers.remove(worker)
+        worker.connection.close()
+
+        retry = []
+        for task in worker.tasks.values():
+            task.attempts += 1
+            if (task.attempts > self.max_retries):
+                self._fail([task], "The workers evaluating it died %d times, the last one because %s" % (task.attempts, reason))
+            else:
+                retry.append(task)
+        with self._lock:
+            self._queue.extendleft(reversed(retry))
+
+        process = self._processes.pop(worker.pid, None)
+        if (process is not None):
+            if process.is_alive(): process.kill()
+            if self._running: self.spawnWorker()
+
+
+    def _fail(self, tasks, reason):
+        for task in tasks:
+            if (task.start() and not task.future.done()):
+                task.future.set_exception(WorkerError(reason))
+
+
+
+def runWorker(address, authkey):
+    """ Connects to a coordinator and evaluates the nodes it sends, until it's stopped """
+    from node_scene import Scene
+
+    try:
+        connection = Client(address, authkey=authkey)
+    except (OSError, EOFError, multiprocessing.AuthenticationError):
+        return      # The coordinator was stopped before this worker could connect
+    send_lock = threading.Lock()
+    def send(message):
+        with send_lock:
+            connection.send(message)
+
+    # Heartbeats are sent from another thread, so that they keep going while a node is being evaluated
+    stopped = threading.Event()
+    def sendHeartbeats():
+        while not stopped.wait(HEARTBEAT_INTERVAL):
+            try:
+                send(('heartbeat',))
+            except OSError:
+                break
+
+    send(('hello', os.getpid()))
+    threading.Thread(target=sendHeartbeats, name="heartbeat", daemon=True).start()
+
+    scene = Scene(headless=True)
+    try:
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+
+            if (message[0] == 'graph'):
+                # Only the nodes that changed since the previous graph are updated
+                scene.deserialize(message[2])
+
+            elif (message[0] == 'task'):
+                kind, task_id, node_id, node_type, input_values = message
+                try:
+                    node = scene.getNodeById(node_id)
+                    if (node is None): raise KeyError("Node %s is not in the graph" % node_id)
+                    output_values = node_type.evalStatic(input_values, node_type.getEvalParams(node))
+                    send(('result', task_id, output_values))
+                except Exception:
+                    send(('error', task_id, traceback.format_exc()))
+
+            elif (message[0] == 'stop'):
+                break
+    finally:
+        stopped.set()
+        connection.close()
+
+
+
+if __name__ == '__main__':
+    if (len(sys.argv) != 2 or AUTHKEY_ENV not in os.environ):
+        print("Usage: %s=AUTHKEY python node_scene_distributed.py HOST:PORT|SOCKET_PATH" % AUTHKEY_ENV)
+        print("Starts a worker that evaluates nodes for a SceneCoordinator (see SceneCoordinator.authkey)")
+        sys.exit(1)
+
+    host, separator, port = sys.argv[1].rpartition(":")
+    runWorker((host, int(port)) if separator else sys.argv[1], bytes.fromhex(os.environ[AUTHKEY_ENV]))
@@ -0,0 +1,89 @@
+import math
+
+
+DEBUG = False
+
+
+class SceneEdgeIndex():
+    """
+    Spatial index of the bounding boxes of the edges in the scene, implemented as a uniform grid.
+    Each cell of the grid knows which edges have a bounding box that overlaps it, so we can quickly get the edges
+    that are near some area (e.g. a segment of the cutline) without checking every edge in the scene.
+    """
+
+    def __init__(self, scene, cell_size=200):
+        self.scene = scene
+        self.cell_size = cell_size
+
+        self.cells = {}         # (column, row) -> set of edges whose bounding box overlaps that cell
+        self.edge_boxes = {}    # edge -> its bounding box as (left, top, right, bottom)
+
+
+    def clear(self):
+        self.cells = {}
+        self.edge_boxes = {}
+
+
+    def cellRange(self, left, top, right, bottom):
+        """ Returns the columns and rows of the cells that overlap a box """
+        return (range(math.floor(left / self.cell_size), math.floor(right / self.cell_size) + 1),
+                range(math.floor(top / self.cell_size), math.floor(bottom / self.cell_size) + 1))
+
+
+    def updateEdge(self, edge, rect):
+        """ Stores (or moves) the edge in the index, given its bounding rect (QRectF) in scene coordinates """
+        box = (rect.left(), rect.top(), rect.right(), rect.bottom())
+        old_box = self.edge_boxes.get(edge)
+        if (old_box == box): return
+
+        old_columns, old_rows = self.cellRange(*old_box) if old_box is not None else (range(0), range(0))
+        columns, rows = self.cellRange(*box)
+        self.edge_boxes[edge] = box
+
+        # Only touch the cells that the edge leaves or enters
+        if (old_columns != columns or old_rows != rows):
+            for cell in self._cells(old_columns, old_rows):
+                if (cell[0] not in columns or cell[1] not in rows):
+                    self._removeFromCell(cell, edge)
+            for cell in self._cells(columns, rows):
+                if (cell[0] not in old_columns or cell[1] not in old_rows):
+                    self.cells.setdefault(cell, set()).add(edge)
+
+
+    def removeEdge(self, edge):
+        box = self.edge_boxes.pop(edge, None)
+        if box is None: return
+        for cell in self._cells(*self.cellRange(*box)):
+            self._removeFromCell(cell, edge)
+
+
+    def edgesInRect(self, left, top, right, bottom):
+        """ Returns the edges whose bounding box overlaps the given box """
+        if (right < left): left, right = right, left
+        if (bottom < top): top, bottom = bottom, top
+
+        candidates = set()
+        for cell in self._cells(*self.cellRange(left, top, right, bottom)):
+            candidates.update(self.cells.get(cell, ()))
+
+        found = []
+        for edge in candidates:
+            e_left, e_top, e_right, e_bottom = self.edge_boxes[edge]
+            if (e_left <= right and left <= e_right and e_top <= bottom and top <= e_bottom):
+                found.append(edge)
+
+        if DEBUG: print("SceneEdgeIndex::edgesInRect ~", len(found), "of", len(self.edge_boxes), "edges")
+        return found
+
+
+    def _cells(self, columns, rows):
+        for column in columns:
+            for row in rows:
+                yield (column, row)
+
+
+    def _removeFromCell(self, cell, edge):
+        edges = self.cells.get(cell)
+        if edges is None: return
+        edges.discard(edge)
+        if not edges: del self.cells[cell]
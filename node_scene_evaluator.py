@@ -0,0 +1,185 @@
+import inspect
+from node_scene_stream import NodeStream, isStreamValue
+from node_scene_shared import SharedPayload, iterPayloads, resolvePayloads
+
+
+DEBUG = False
+
+# States of the nodes while looking for the evaluation order
+VISITING = 1
+DONE = 2
+
+
+class EvaluationError(Exception):
+    """ A node failed to evaluate. The original exception is its __cause__. """
+
+    def __init__(self, node, error, row=None):
+        super().__init__("Evaluation of %s failed%s: %s" % (node, "" if row is None else " at row %d" % row, error))
+        self.node = node
+        self.error = error
+        self.row = row      # Row of the batch, for batch evaluations (see SceneBatchEvaluator)
+
+
+class EvaluationCancelled(Exception):
+    pass
+
+
+class SceneEvaluator():
+    """
+    Evaluates the nodes of the scene. The values of a node's outputs (Node.output_values) are computed by
+    Node.evalImplementation from the values of its inputs, which are the outputs of the nodes connected to them.
+    Evaluation is lazy and pull-based: asking for some nodes only evaluates the dirty nodes they depend on (and
+    themselves), in topological order. Nodes that are clean keep their values, and nodes that the requested nodes
+    don't depend on are not even visited.
+    """
+
+    def __init__(self, scene):
+        self.scene = scene
+
+        self.last_evaluated = []    # Nodes evaluated by the last call to evaluate(), in order
+
+
+    def getEvaluationOrder(self, nodes, is_needed=None):
+        """
+        Returns the dirty nodes that have to be evaluated to get the values of the given nodes, in topological order
+        (each node after the nodes it depends on). A clean node only depends on clean nodes, so the search stops there.
+        is_needed can tell which nodes have to be evaluated instead of isDirty: the search also stops at the others.
+        Raises ValueError if the nodes depend on a cycle.
+        """
+        if (is_needed is None): is_needed = lambda node: node.isDirty()
+        order = []
+        state = {}      # Node -> VISITING while its inputs are being visited, DONE after
+
+        for root in nodes:
+            if (root in state or not is_needed(root)): continue
+
+            state[root] = VISITING
+            stack = [(root, root.getInputNodes())]
+            while stack:
+                node, inputs = stack[-1]
+                for input_node in inputs:
+                    if (state.get(input_node) == VISITING):
+                        raise ValueError("Cannot evaluate %s: it depends on a cycle through %s" % (root, input_node))
+                    if (input_node not in state and is_needed(input_node)):
+                        state[input_node] = VISITING
+                        stack.append((input_node, input_node.getInputNodes()))
+                        break
+                else:
+                    # Every input is done
+                    stack.pop()
+                    state[node] = DONE
+                    order.append(node)
+
+        return order
+
+
+    def getInputValues(self, node):
+        """
+        Returns the values of the node's inputs, from the outputs connected to them: one value per input socket
+        (None if it's not connected), or a list of values for sockets with multiple edges.
+        Outputs that are streams (NodeStream) give each input its own StreamReader. Outputs in shared memory are
+        given as their SharedPayload, which has to be released once the node is done (see releaseInputValues).
+        """
+        input_values = []
+        for socket in node.inputs:
+            values = [output.node.output_values[output.index] for output in socket.getConnectedSockets()]
+            values = [value.openReader() if isinstance(value, NodeStream) else value for value in values]
+            if socket.is_multi_edges:
+                input_values.append(values)
+            else:
+                input_values.append(values[0] if values else None)
+        return input_values
+
+
+    def checkOutputValues(self, node, output_values):
+        if (output_values is None or len(output_values) != len(node.outputs)):
+            raise ValueError("%s returned %s for %d outputs" % (node, output_values, len(node.outputs)))
+
+
+    def releaseInputValues(self, input_values):
+        """ Releases the shared memory payloads that a node was given, once it's done with them """
+        for payload in iterPayloads(input_values):
+            payload.release()
+
+
+    def freeOutputValues(self, node):
+        """ Frees the shared memory of the node's outputs """
+        for payload in iterPayloads(node.output_values or ()):
+            payload.free()
+
+
+    def setOutputValues(self, node, output_values, to_evaluate=None):
+        """
+        Stores the values of a node's outputs, making the ones that are iterators streams (see NodeStream), read by
+        the nodes connected to them that are in to_evaluate (by default, all of them).
+        Outputs in shared memory (SharedPayload) are kept until those nodes release them.
+        """
+        self.freeOutputValues(node)
+
+        output_values = list(output_values)
+        for i, value in enumerate(output_values):
+            if (isStreamValue(value) or isinstance(value, SharedPayload)):
+                readers = sum(1 for input in node.outputs[i].getConnectedSockets()
+                              if (to_evaluate is None or input.node in to_evaluate))
+                if isinstance(value, SharedPayload):
+                    value.acquire(readers)
+                else:
+                    output_values[i] = NodeStream(value, readers, node.eval_stream_buffer, self.scene.scheduler.async_loop)
+        node.markClean(output_values)
+
+
+    def evaluateNode(self, node, to_evaluate=None):
+        """
+        Computes the values of a node's outputs, assuming the nodes it depends on are clean.
+        If the scene's cache has them for the same inputs and content, they're taken from there instead.
+        to_evaluate are the nodes being evaluated with it, which are the ones that read its streams.
+        """
+        if DEBUG: print("SceneEvaluator::evaluateNode ~", node)
+        input_values = self.getInputValues(node)
+        try:
+            key, output_values = self.scene.cache.lookup(node, input_values)
+            if (output_values is not None):
+                self.setOutputValues(node, output_values, to_evaluate)
+                return
+
+            try:
+                if inspect.iscoroutinefunction(node.evalImplementation):
+                    output_values = self.scene.scheduler.async_loop.run(node, resolvePayloads(input_values))
+                else:
+                    output_values = node.evalImplementation(resolvePayloads(input_values))
+                self.checkOutputValues(node, output_values)
+            except Exception as e:
+                raise EvaluationError(node, e) from e
+        finally:
+            self.releaseInputValues(input_values)
+
+        self.scene.cache.store(node, key, output_values)
+        self.setOutputValues(node, output_values, to_evaluate)
+
+
+    def evaluate(self, nodes):
+        """
+        Makes sure the given nodes are up to date, evaluating them and the nodes they depend on only if they're dirty.
+        Returns the values of the outputs of each node, in a list. If a node fails, EvaluationError is raised and that
+        node (and the ones after it) stay dirty.
+        """
+        nodes = list(nodes)
+        self.last_evaluated = []
+
+        order = self.getEvaluationOrder(nodes)
+        to_evaluate = set(order)
+        for node in order:
+            self.evaluateNode(node, to_evaluate)
+            self.last_evaluated.append(node)
+
+        return [node.output_values for node in nodes]
+
+
+    def getOutputValue(self, socket):
+        """ Returns the value of an output socket, evaluating its node if needed """
+        return self.evaluate([socket.node])[0][socket.index]
+
+
+    def evaluateAll(self):
+        """ Evaluates every dirty node in the scene """
+        return self.evaluate(self.scene.iterNodes())
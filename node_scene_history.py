@@ -5,7 +5,12 @@ DEBUG = False
 
 
 class SceneHistory():
-    """ History of changes for undo/redo feature. Implemented as a stack. """
+    """
+    History of changes for undo/redo feature. Implemented as a stack.
+    Instead of storing a snapshot of the whole scene, each step stores the operations (add/remove node,
+    add/remove edge, move, title change...) that were recorded since the previous step, so that they
+    can be applied backwards (undo) or forwards (redo).
+    """
 
     def __init__(self, scene):
         self.scene = scene
@@ -14,12 +19,40 @@ class SceneHistory():
         self.history_current_step = -1  # Index of most recent action in history_stack
         self.history_limit = 32
 
+        self.recording = True           # Set to False while we're applying operations, so that they don't get recorded again
+
+        self._pending_operations = []   # Operations recorded since the last history stamp
+        self._pending_added = {}        # Objects added since the last history stamp -> their 'add' operation
+        self._pending_moves = {}        # Nodes moved since the last history stamp -> their 'move' operation
+        self._last_selection = {'nodes': [], 'edges': []}
+
+        self._history_stored_listeners = []
+
+
+    def addHistoryStoredListener(self, callback):
+        """ The callback is called each time a step with changes is stored in the history """
+        self._history_stored_listeners.append(callback)
+
+
+    def clear(self):
+        """ Forgets all history. Used when the whole scene is replaced (new file, file loaded...) """
+        self.history_stack = []
+        self.history_current_step = -1
+        self._pending_operations = []
+        self._pending_added = {}
+        self._pending_moves = {}
+        self._last_selection = {'nodes': [], 'edges': []}
+
 
     def undo(self):
-        if (self.history_current_step > 0):
+        # Changes that were not stored yet have to be undone first
+        if (self._pending_operations):
+            self.storeHistory("Unstored changes")
+
+        if (self.history_current_step >= 0):
             if DEBUG: print("UNDO")
+            self.restoreHistoryStamp(self.history_stack[self.history_current_step], undo=True)
             self.history_current_step -= 1
-            self.restoreHistory()
         else:
             if DEBUG: print("Nothing to undo")
 
@@ -28,24 +61,24 @@ class SceneHistory():
         if (self.history_current_step + 1 < len(self.history_stack)):
             if DEBUG: print("REDO")
             self.history_current_step += 1
-            self.restoreHistory()
+            self.restoreHistoryStamp(self.history_stack[self.history_current_step], undo=False)
         else:
             if DEBUG: print("Nothing to redo")
 
 
-    def restoreHistory(self):
-        """  """
-        if DEBUG: print(f"Restoring history .... current_step: {self.history_current_step} ({len(self.history_stack)})")
-        self.restoreHistoryStamp(self.history_stack[self.history_current_step])
-
-
     def storeHistory(self, desc, setModified=False):
-        """  """
+        """ Packs all the operations recorded since the last call into a new step of the history stack """
         if setModified:
             self.scene.has_been_modified = True
 
         if DEBUG: print(f"Storing history '{desc}' .... current_step: @{self.history_current_step} ({len(self.history_stack)})")
 
+        hs = self.createHistoryStamp(desc)
+
+        # Nothing changed since the last stamp, so there is nothing to undo
+        if (not hs['operations'] and hs['selection_before'] == hs['selection_after']):
+            return
+
         # If the pointer (history_current_step) is not at the end of history_stack
         if (self.history_current_step+1 < len(self.history_stack)):
             self.history_stack = self.history_stack[0:self.history_current_step+1]
@@ -55,19 +88,120 @@ class SceneHistory():
             self.history_stack = self.history_stack[1:]
             self.history_current_step -= 1
 
-        hs = self.createHistoryStamp(desc)
-
         self.history_stack.append(hs)
         self.history_current_step += 1
         if DEBUG: print("  -- setting step to:", self.history_current_step)
 
+        if hs['operations']:
+            for callback in self._history_stored_listeners:
+                callback()
+
+
+    # Recording of operations. These are called by Node and Edge whenever they change.
+
+    def recordNodeAdded(self, node):
+        """ The node is serialized when the stamp is created, once its sockets, position and title have been set """
+        if not self.recording: return
+        op = ['add_node', node]
+        self._pending_operations.append(op)
+        self._pending_added[node] = op
+
+
+    def recordNodeRemoved(self, node):
+        if not self.recording: return
+        if self._cancelPendingAdd(node): return
+        self._closePendingMove(node)
+        self._pending_operations.append(('remove_node', node.serialize()))
+
+
+    def recordEdgeAdded(self, edge):
+        if not self.recording: return
+        op = ['add_edge', edge]
+        self._pending_operations.append(op)
+        self._pending_added[edge] = op
+
+
+    def recordEdgeRemoved(self, edge):
+        if not self.recording: return
+        if self._cancelPendingAdd(edge): return
+        if (edge.start_socket is None or edge.end_socket is None): return     # Edge being dragged, was never stored
+        self._pending_operations.append(('remove_edge', edge.serialize()))
+
+
+    def recordNodeMoved(self, node):
+        """ Called before the node changes position. Only the first position of each step is kept. """
+        if not self.recording: return
+        if (node in self._pending_added or node in self._pending_moves): return
+        pos = node.pos
+        op = ['move', node.id, (pos.x(), pos.y()), None]
+        self._pending_operations.append(op)
+        self._pending_moves[node] = op
+
+
+    def recordTitleChanged(self, node, old_title):
+        if not self.recording: return
+        if (node in self._pending_added or old_title == node.title): return
+        self._pending_operations.append(('title', node.id, old_title, node.title))
+
+
+    def _cancelPendingAdd(self, obj):
+        """ If an object is removed in the same step it was added in, both operations cancel each other out """
+        op = self._pending_added.pop(obj, None)
+        if op is None: return False
+        op[0] = None
+        return True
+
+
+    def _closePendingMove(self, node):
+        """ Stores the node's current position as the final position of its 'move' operation """
+        op = self._pending_moves.pop(node, None)
+        if op is None: return
+        pos = node.pos
+        op[3] = (pos.x(), pos.y())
+
 
     def createHistoryStamp(self, desc):
-        """ Returns a serialized snapshot of all nodes and edges in the scene """
+        """ Returns the operations recorded since the last stamp, together with the selection before and after them """
+        for node in list(self._pending_moves):
+            self._closePendingMove(node)
+
+        operations = []
+        for op in self._pending_operations:
+            if (op[0] == 'add_node'):
+                operations.append(('add_node', op[1].serialize()))
+            elif (op[0] == 'add_edge'):
+                if (op[1].end_socket is None): continue     # Edge being dragged, not a real part of the scene
+                operations.append(('add_edge', op[1].serialize()))
+            elif (op[0] == 'move'):
+                if (op[2] == op[3]): continue
+                operations.append(tuple(op))
+            elif (op[0] is not None):
+                operations.append(op)
+
+        self._pending_operations = []
+        self._pending_added = {}
+
+        sel_obj = self.createSelectionStamp()
+
+        history_stamp = {
+            'desc': desc,
+            'operations': operations,
+            'selection_before': self._last_selection,
+            'selection_after': sel_obj,
+        }
+
+        self._last_selection = sel_obj
+
+        return history_stamp
+
+
+    def createSelectionStamp(self):
+        """ Returns the ids of the selected nodes and edges """
         sel_obj = {
             'nodes': [],
             'edges': [],
         }
+        if (self.scene.grScene is None): return sel_obj
 
         for item in self.scene.grScene.selectedItems():
             if hasattr(item, 'node'):
@@ -75,30 +209,60 @@ class SceneHistory():
             elif isinstance(item, QDMGraphicsEdge):
                 sel_obj['edges'].append(item.edge.id)
 
-        history_stamp = {
-            'desc': desc,
-            'snapshot': self.scene.serialize(),
-            'selection': sel_obj,
-        }
+        return sel_obj
 
-        return history_stamp
 
+    def restoreHistoryStamp(self, history_stamp, undo=True):
+        """ Applies the operations of a stamp backwards (undo) or forwards (redo) """
+        if DEBUG: print("Restore history stamp: ", history_stamp['desc'], "(undo)" if undo else "(redo)")
+
+        self.recording = False
+        self.scene.beginBulkLoad(len(history_stamp['operations']))
+        try:
+            operations = reversed(history_stamp['operations']) if undo else history_stamp['operations']
+            for op in operations:
+                self.applyOperation(op, undo)
+
+            selection = history_stamp['selection_before'] if undo else history_stamp['selection_after']
+            self.restoreSelection(selection)
+        finally:
+            self.scene.endBulkLoad()
+            self.recording = True
+
+        self._last_selection = selection
+
+
+    def applyOperation(self, op, undo):
+        """ Applies a single recorded operation, or its inverse if undo is True """
+        kind = op[0]
+
+        if (kind == 'add_node' and not undo) or (kind == 'remove_node' and undo):
+            self.scene.restoreNode(op[1])
+        elif (kind == 'add_node' and undo) or (kind == 'remove_node' and not undo):
+            self.scene.getNodeById(op[1]['id']).remove()
+
+        elif (kind == 'add_edge' and not undo) or (kind == 'remove_edge' and undo):
+            self.scene.restoreEdge(op[1])
+        elif (kind == 'add_edge' and undo) or (kind == 'remove_edge' and not undo):
+            self.scene.getEdgeById(op[1]['id']).remove()
+
+        elif (kind == 'move'):
+            node = self.scene.getNodeById(op[1])
+            node.setPos(*(op[2] if undo else op[3]))
+            node.updateConnectedEdges()
+
+        elif (kind == 'title'):
+            self.scene.getNodeById(op[1]).title = op[2] if undo else op[3]
 
-    def restoreHistoryStamp(self, history_stamp):
-        """  """
-        if DEBUG: print("Restore history stamp: ", history_stamp['desc'])
 
-        self.scene.deserialize(history_stamp['snapshot'])
+    def restoreSelection(self, selection):
+        if (self.scene.grScene is None): return
+        self.scene.grScene.clearSelection()
 
-        # Restore selection
-        for edge_id in history_stamp['selection']['edges']:
-            for edge in self.scene.edges:
-                if (edge.id == edge_id):
-                    edge.grEdge.setSelected(True)
-                    break
+        for edge_id in selection['edges']:
+            edge = self.scene.getEdgeById(edge_id)
+            if edge is not None: edge.grEdge.setSelected(True)
 
-        for node_id in history_stamp['selection']['nodes']:
-            for node in self.scene.nodes:
-                if (node.id == node_id):
-                    node.grNode.setSelected(True)
-                    break
+        for node_id in selection['nodes']:
+            node = self.scene.getNodeById(node_id)
+            if node is not None: node.grNode.setSelected(True)
@@ -0,0 +1,167 @@
+import json
+from collections import OrderedDict
+
+
+DEBUG = False
+
+# Keys of the scene's data that hold one record per node/edge, in the order in which they have to be read
+RECORD_LISTS = ('nodes', 'edges')
+
+
+def writeSceneJson(file, data, indent=4):
+    """
+    Writes the scene's data to a file as JSON, one record at a time.
+    data['nodes'] and data['edges'] can be iterators (e.g. generators that serialize each node as they go),
+    so the whole serialized scene doesn't need to be in memory at once.
+    With indent=None the JSON is written in compact form, without any whitespace.
+    The output is the same as json.dumps(data, indent=indent) (or with compact separators if indent is None).
+    """
+    if indent is None:
+        separators = (',', ':')
+        newline = ''
+        pad1, pad2 = '', ''
+    else:
+        separators = (',', ': ')
+        newline = '\n'
+        pad1, pad2 = ' ' * indent, ' ' * (2 * indent)
+
+    file.write('{')
+    first_member = True
+    for key, value in data.items():
+        file.write(('' if first_member else separators[0]) + newline + pad1 + json.dumps(key) + separators[1])
+        first_member = False
+
+        if (key not in RECORD_LISTS):
+            file.write(json.dumps(value, indent=indent, separators=separators))
+            continue
+
+        file.write('[')
+        first_record = True
+        for record in value:
+            record_json = json.dumps(record, indent=indent, separators=separators)
+            if newline: record_json = record_json.replace('\n', '\n' + pad2)
+            file.write(('' if first_record else separators[0]) + newline + pad2 + record_json)
+            first_record = False
+        file.write(']' if first_record else newline + pad1 + ']')
+
+    file.write(newline + '}' if not first_member else '}')
+
+
+
+class SceneJsonReader():
+    """
+    Reads the scene's data from a JSON file little by little, so that the whole file (or the whole parsed data)
+    doesn't need to be in memory at once. read() returns the scene's data, where data['nodes'] and data['edges'] are
+    generators that read one record at a time from the file. They have to be used in order, before closing the file.
+    """
+
+    def __init__(self, file, chunk_size=65536):
+        self.file = file
+        self.chunk_size = chunk_size
+
+        self.buffer = ''
+        self.pos = 0        # Position in the buffer of the next character to be read
+        self.eof = False
+
+        self.decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+
+
+    def read(self):
+        """ Reads the data of the scene up to the first list of records, which is returned as a generator """
+        data = OrderedDict()
+        self._expect('{')
+        self._readMembers(data)
+        return data
+
+
+    def _readMembers(self, data):
+        """
+        Reads members of the top level object into data, until a list of records that can be streamed is found.
+        That list is stored as a generator, which continues reading the following members once it's exhausted.
+        """
+        if (self._peek() == '}'):
+            self.pos += 1
+            return
+
+        while True:
+            key = self._value()
+            self._expect(':')
+
+            # Records can only be streamed if the lists that go before them have already been read
+            streamable = (key in RECORD_LISTS and all(k in data for k in RECORD_LISTS[:RECORD_LISTS.index(key)]))
+            if (streamable and self._peek() == '['):
+                self.pos += 1
+                data[key] = self._iterRecords(data)
+                return
+
+            data[key] = self._value()
+            if DEBUG: print("SceneJsonReader::_readMembers ~ read", key)
+
+            if (self._peek() == ','):
+                self.pos += 1
+            else:
+                self._expect('}')
+                return
+
+
+    def _iterRecords(self, data):
+        """ Yields each record of a list, and then reads the rest of the members of the object """
+        if (self._peek() == ']'):
+            self.pos += 1
+        else:
+            while True:
+                yield self._value()
+                if (self._peek() == ','):
+                    self.pos += 1
+                else:
+                    self._expect(']')
+                    break
+
+        if (self._peek() == ','):
+            self.pos += 1
+            self._readMembers(data)
+        else:
+            self._expect('}')
+
+
+    def _fill(self):
+        """ Reads the next chunk of the file into the buffer, dropping the part of the buffer that was already read """
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+
+    def _peek(self):
+        """ Returns the next character that is not whitespace, without consuming it ('' at the end of the file) """
+        while True:
+            while (self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r'):
+                self.pos += 1
+            if (self.pos < len(self.buffer) or self.eof): break
+            self._fill()
+
+        return self.buffer[self.pos] if self.pos < len(self.buffer) else ''
+
+
+    def _expect(self, char):
+        found = self._peek()
+        if (found != char):
+            raise ValueError("Invalid scene file: expected '%s' but found '%s'" % (char, found))
+        self.pos += 1
+
+
+    def _value(self):
+        """ Decodes the next JSON value, reading more of the file if the value is not complete in the buffer """
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A value that reaches the end of the buffer may continue in the next chunk (e.g. a number)
+                if (end < len(self.buffer) or self.eof):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof: raise
+            self._fill()
@@ -0,0 +1,234 @@
+import math
+from array import array
+from node_node import Node
+from node_edge import Edge
+from node_scene_binary import SceneChunkedFile
+from node_graphics_scene import DETAIL_LOW
+from node_graphics_node import QDMGraphicsNode
+
+
+DEBUG = False
+
+
+class ScenePartialLoader():
+    """
+    Keeps a scene loaded from a chunked file (see SceneChunkedFile) partially loaded. Only the chunks near the views
+    are turned into nodes. The rest stay in the file until the views get near them, and their records are read from
+    the file again when the scene is serialized. Once a chunk is loaded, it stays loaded.
+    Edges are created once the chunks of both of their nodes are loaded.
+    The areas of the chunks that aren't loaded are kept in a uniform grid with cells of the chunks' size, so that
+    finding the ones in view doesn't go through every chunk of the file.
+    """
+
+    def __init__(self, scene, filename):
+        self.scene = scene
+        self.filename = filename
+
+        # How far a node can reach from its position (its size), to know if it's in view
+        self.node_margin_x = QDMGraphicsNode.width
+        self.node_margin_y = QDMGraphicsNode.height
+        self.chunks_per_update = 4  # Chunks loaded each time, so that panning over many of them doesn't freeze the GUI
+
+        self.file = open(filename, "rb")
+        self.chunked = SceneChunkedFile(self.file)
+
+        self.loaded_chunks = array('B', bytes(self.chunked.n_chunks))
+        self.created_edges = array('B', bytes(self.chunked.n_edges))
+        self.unloaded_count = self.chunked.n_chunks
+
+        # Chunk -> indexes of the edges that start or end in it
+        self.chunk_edges = {}
+        for i in range(self.chunked.n_edges):
+            start_chunk, end_chunk = self.chunked.edges['start_chunk'][i], self.chunked.edges['end_chunk'][i]
+            self.chunk_edges.setdefault(start_chunk, array('I')).append(i)
+            if (end_chunk != start_chunk): self.chunk_edges.setdefault(end_chunk, array('I')).append(i)
+
+        # (column, row) -> indexes of the unloaded chunks whose area overlaps that cell
+        self.cells = {}
+        for i in range(self.chunked.n_chunks):
+            for cell in self._cells(*self.chunkArea(i)):
+                self.cells.setdefault(cell, set()).add(i)
+
+
+    @property
+    def chunk_size(self):
+        return self.chunked.chunk_size
+
+
+    def close(self):
+        self.file.close()
+
+
+    def isComplete(self):
+        return (self.unloaded_count == 0)
+
+
+    def isReservedId(self, obj_id):
+        """ Returns True if the id belongs to a node, socket or edge that is still in the file, waiting to be loaded """
+        chunk = self.chunked.chunkOfId(obj_id)
+        return (chunk is not None and not self.loaded_chunks[chunk])
+
+
+    def chunkArea(self, i):
+        """ Returns (left, top, right, bottom) of the area covered by the nodes of the chunk """
+        left, top, right, bottom = self.chunked.chunkBounds(i)
+        return (left, top, right + self.node_margin_x, bottom + self.node_margin_y)
+
+
+    def cellRange(self, left, top, right, bottom):
+        """ Returns the columns and rows of the cells that overlap a box """
+        cell_size = self.chunk_size
+        return (range(math.floor(left / cell_size), math.floor(right / cell_size) + 1),
+                range(math.floor(top / cell_size), math.floor(bottom / cell_size) + 1))
+
+
+    def _cells(self, left, top, right, bottom):
+        columns, rows = self.cellRange(left, top, right, bottom)
+        for column in columns:
+            for row in rows:
+                yield (column, row)
+
+
+    def unloadedChunksInRect(self, left, top, right, bottom):
+        """ Returns the indexes of the chunks that aren't loaded and whose area overlaps the given box """
+        candidates = set()
+        for cell in self._cells(left, top, right, bottom):
+            candidates.update(self.cells.get(cell, ()))
+
+        found = []
+        for i in sorted(candidates):
+            c_left, c_top, c_right, c_bottom = self.chunkArea(i)
+            if (c_left <= right and left <= c_right and c_top <= bottom and top <= c_bottom):
+                found.append(i)
+        return found
+
+
+    def unloadedChunksBounds(self, rect):
+        """ Yields (left, top, right, bottom) of the area of each chunk that isn't loaded and overlaps the rect (QRectF) """
+        for i in self.unloadedChunksInRect(rect.left(), rect.top(), rect.right(), rect.bottom()):
+            yield self.chunkArea(i)
+
+
+    def loadRect(self, rect):
+        """
+        Loads the chunks with nodes in the rect (QRectF in scene coordinates), closest to its center first.
+        Returns True if there are more chunks in the rect left to load. When zoomed out far, nothing is loaded.
+        """
+        if (self.isComplete() or rect.isEmpty() or self.scene.grScene.detail_level == DETAIL_LOW): return False
+
+        center = rect.center()
+        candidates = []
+        for i in self.unloadedChunksInRect(rect.left(), rect.top(), rect.right(), rect.bottom()):
+            left, top, right, bottom = self.chunkArea(i)
+            distance = abs((left + right) / 2 - center.x()) + abs((top + bottom) / 2 - center.y())
+            candidates.append((distance, i))
+
+        candidates.sort()
+        for distance, i in candidates[:self.chunks_per_update]:
+            self.loadChunk(i)
+
+        return (len(candidates) > self.chunks_per_update)
+
+
+    def loadChunk(self, i):
+        """ Creates the nodes of the chunk, and the edges between them and the nodes of chunks already loaded """
+        if self.loaded_chunks[i]: return
+        if DEBUG: print("ScenePartialLoader::loadChunk ~", i, "with", self.chunked.chunks['nodes'][i], "nodes")
+
+        # Its ids aren't reserved anymore, so that the nodes can be created with them
+        self.loaded_chunks[i] = 1
+        self.unloaded_count -= 1
+        for cell in self._cells(*self.chunkArea(i)):
+            self.cells[cell].discard(i)
+            if not self.cells[cell]: del self.cells[cell]
+
+        # Loading a chunk is not something that can be undone
+        self.scene.history.recording = False
+        self.scene.beginBulkLoad(self.chunked.chunks['nodes'][i] + len(self.chunk_edges.get(i, ())))
+        try:
+            for node_data in self.chunked.readChunk(i):
+                Node(self.scene).deserialize(node_data, restore_id=True)
+
+            for e in self.chunk_edges.get(i, ()):
+                if self.created_edges[e] or not self.edgeHasBothEnds(e): continue
+                edge_data = self.chunked.edgeData(e)
+                Edge(self.scene, edge_type=edge_data['edge_type']).deserialize(edge_data, restore_id=True)
+                self.created_edges[e] = 1
+        finally:
+            self.scene.endBulkLoad()
+            self.scene.history.recording = True
+
+
+    def edgeHasBothEnds(self, e):
+        """ Returns True if both sockets of the edge are in the scene """
+        edge = self.chunked.edges
+        return (self.scene.getSocketById(edge['start'][e]) is not None and
+                self.scene.getSocketById(edge['end'][e]) is not None)
+
+
+    def iterUnloadedNodes(self):
+        """ Yields the data of the nodes that are still in the file """
+        return _iterUnloadedNodes(self.chunked, self.loaded_chunks)
+
+
+    def iterUnloadedEdges(self):
+        """
+        Yields the data of the edges that were not created yet, as long as their sockets still exist:
+        each of their ends has to be either in a chunk that is not loaded, or in the scene (its node wasn't removed).
+        """
+        return _iterUnloadedEdges(self.chunked, self.loaded_chunks, self.created_edges,
+                                  lambda socket_id: self.scene.getSocketById(socket_id) is not None)
+
+
+    def snapshot(self):
+        """
+        Returns the parts of the scene that are still in the file as they are now (see ScenePartialSnapshot), to
+        serialize them on another thread. It only copies which chunks and edges are loaded, nothing is read yet.
+        """
+        return ScenePartialSnapshot(self.chunked.reopen(), self.loaded_chunks, self.created_edges, self.scene.socketIds())
+
+
+
+class ScenePartialSnapshot():
+    """
+    The parts of a partially loaded scene that were still in its file at some point (see ScenePartialLoader.snapshot).
+    Their records are read from the file with a handle of its own, so it can be done on another thread (by SceneSaver)
+    while the scene keeps loading chunks. It has to be closed once done.
+    """
+
+    def __init__(self, chunked, loaded_chunks, created_edges, socket_ids):
+        self.chunked = chunked
+        self.loaded_chunks = array('B', loaded_chunks)
+        self.created_edges = array('B', created_edges)
+        self.socket_ids = socket_ids    # Sockets that were in the scene, for the edges that end in loaded chunks
+
+
+    def iterNodes(self):
+        return _iterUnloadedNodes(self.chunked, self.loaded_chunks)
+
+
+    def iterEdges(self):
+        return _iterUnloadedEdges(self.chunked, self.loaded_chunks, self.created_edges, self.socket_ids.__contains__)
+
+
+    def close(self):
+        self.chunked.close()
+
+
+
+def _iterUnloadedNodes(chunked, loaded_chunks):
+    for i in range(chunked.n_chunks):
+        if not loaded_chunks[i]:
+            yield from chunked.readChunk(i)
+
+
+def _iterUnloadedEdges(chunked, loaded_chunks, created_edges, has_socket):
+    edge = chunked.edges
+    for e in range(chunked.n_edges):
+        if created_edges[e]: continue
+
+        ends_exist = True
+        for chunk_column, socket_column in (('start_chunk', 'start'), ('end_chunk', 'end')):
+            if (loaded_chunks[edge[chunk_column][e]] and not has_socket(edge[socket_column][e])):
+                ends_exist = False
+        if ends_exist: yield chunked.edgeData(e)
@@ -0,0 +1,167 @@
+import os
+import shutil
+import itertools
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtCore import QObject, QTimer, Signal
+from node_scene_json import writeSceneJson
+from node_scene_binary import writeSceneBinary, SCENE_BINARY_EXTENSION
+
+
+DEBUG = False
+
+AUTOSAVE_SUFFIX = ".autosave"
+
+
+def writeSceneFile(filename, data, binary=None, compact=False, chunk_size=None):
+    """
+    Writes the scene's data to a file, in the binary format if binary (by default, if the filename has the binary
+    extension) or as JSON otherwise. Binary files are chunked if chunk_size is given.
+    The data is first written to a temporary file in the same folder, which then replaces the file, so that the file
+    is never left half written if something goes wrong. The file keeps its permissions, and a new file gets the
+    usual ones (as open() would create it, with the umask).
+    """
+    if binary is None: binary = filename.endswith(SCENE_BINARY_EXTENSION)
+
+    folder, basename = os.path.split(os.path.abspath(filename))
+    while True:
+        temp_filename = os.path.join(folder, ".%s.%s.tmp" % (basename, os.urandom(4).hex()))
+        try:
+            fd = os.open(temp_filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(fd, "wb" if binary else "w") as file:
+            if binary:
+                writeSceneBinary(file, data, chunk_size)
+            else:
+                writeSceneJson(file, data, indent=None if compact else 4)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(filename):
+            shutil.copymode(filename, temp_filename)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.remove(temp_filename)
+        raise
+
+
+
+class SceneSaver(QObject):
+    """
+    Saves the scene without blocking the GUI. The scene is serialized on the GUI thread (which only builds the
+    dicts of its data), and then encoded and written to the file on a worker thread. The parts of a partially loaded
+    scene that are still in its file are read by the worker thread (see ScenePartialSnapshot). Saves are written one at a time,
+    in the order they were asked for. It also autosaves the scene a few seconds after each change, to a separate file.
+    """
+
+    saveStarted = Signal(str, bool)         # filename, autosave
+    saveFinished = Signal(str, bool)        # filename, autosave
+    saveFailed = Signal(str, bool, str)     # filename, autosave, error
+
+    # Results are sent from the worker thread, so the GUI thread receives them through this (queued) signal
+    _finished = Signal(str, bool, str)      # filename, autosave, error ('' if it succeeded)
+
+    def __init__(self, scene, autosave_delay=3000):
+        super().__init__()
+        self.scene = scene
+
+        self.filename = None        # File the scene was last loaded from or saved to. Autosaves go next to it.
+        self.autosave_enabled = True
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = 0           # Saves that are waiting or being written
+
+        # Bursts of changes only produce one autosave, once they stop for autosave_delay milliseconds
+        self._autosave_timer = QTimer()
+        self._autosave_timer.setSingleShot(True)
+        self._autosave_timer.setInterval(autosave_delay)
+        self._autosave_timer.timeout.connect(self.autosave)
+
+        self._finished.connect(self._onFinished)
+
+
+    def isSaving(self):
+        return (self._pending > 0)
+
+
+    def autosaveFilename(self):
+        """
+        Returns the file where the scene is autosaved: next to its file, or in the temp folder if it has none (one
+        per process, so that several editors don't overwrite each other's autosaves)
+        """
+        if self.filename is None:
+            return os.path.join(tempfile.gettempdir(), "node_editor.%d%s.json" % (os.getpid(), AUTOSAVE_SUFFIX))
+        base, ext = os.path.splitext(self.filename)
+        return base + AUTOSAVE_SUFFIX + ext
+
+
+    def scheduleAutosave(self):
+        """ Called after each change in the scene. Restarts the countdown to the next autosave. """
+        if self.autosave_enabled:
+            self._autosave_timer.start()
+
+
+    def autosave(self):
+        self._autosave_timer.stop()
+        self.save(self.autosaveFilename(), autosave=True)
+
+
+    def save(self, filename, binary=None, compact=False, autosave=False):
+        """
+        Takes a snapshot of the scene and writes it to the file in the background. Returns a Future.
+        Unless it's an autosave, the scene counts as not modified from now on, and later changes will be autosaved
+        next to this file.
+        """
+        data = self.scene.serialize(unloaded=False)
+        unloaded = self.scene.partial_loader.snapshot() if (self.scene.partial_loader is not None) else None
+        chunk_size = self.scene.defaultChunkSize()
+
+        if not autosave:
+            self.filename = filename
+            self._autosave_timer.stop()     # This save already has the latest changes
+            self.scene.has_been_modified = False
+
+        if DEBUG: print("SceneSaver::save ~", "autosaving" if autosave else "saving", "to", filename)
+        self._pending += 1
+        self.saveStarted.emit(filename, autosave)
+        return self._executor.submit(self._write, filename, data, unloaded, binary, compact, chunk_size, autosave)
+
+
+    def _write(self, filename, data, unloaded, binary, compact, chunk_size, autosave):
+        """ Runs on the worker thread """
+        try:
+            if (unloaded is not None):
+                data['nodes'] = itertools.chain(data['nodes'], unloaded.iterNodes())
+                data['edges'] = itertools.chain(data['edges'], unloaded.iterEdges())
+            writeSceneFile(filename, data, binary, compact, chunk_size)
+        except Exception as e:
+            self._finished.emit(filename, autosave, str(e) or e.__class__.__name__)
+            raise
+        finally:
+            if (unloaded is not None): unloaded.close()
+        self._finished.emit(filename, autosave, '')
+
+
+    def _onFinished(self, filename, autosave, error):
+        self._pending -= 1
+
+        if error:
+            print("Saving to", filename, "failed:", error)
+            if not autosave: self.scene.has_been_modified = True
+            self.saveFailed.emit(filename, autosave, error)
+            return
+
+        if DEBUG: print("SceneSaver::_onFinished ~ saved", filename)
+        if not autosave:
+            # The autosave is older than the file that was just saved
+            autosave_filename = self.autosaveFilename()
+            if (os.path.isfile(autosave_filename) and not self._autosave_timer.isActive() and self._pending == 0):
+                os.remove(autosave_filename)
+        self.saveFinished.emit(filename, autosave)
+
+
+    def wait(self):
+        """ Blocks until all the saves have been written. Used before the application quits. """
+        self._executor.submit(lambda: None).result()
@@ -0,0 +1,559 @@
+import os
+import time
+import heapq
+import inspect
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from PySide6.QtCore import QObject, Qt, Signal
+from node_scene_evaluator import EvaluationError, EvaluationCancelled
+from node_scene_async import SceneAsyncLoop
+from node_scene_shared import SHARED_PAYLOAD_MIN_SIZE, runInProcess, iterPayloads, resolvePayloads, materializePayloads
+from node_scene_distributed import SceneCoordinator
+
+
+DEBUG = False
+
+POOLS = ('thread', 'process', 'async', 'distributed', 'main')
+
+
+class SceneScheduler(QObject):
+    """
+    Evaluates the nodes of the scene in parallel. It works like SceneEvaluator.evaluate (only the dirty nodes that the
+    requested nodes depend on are evaluated), but instead of evaluating them one after another, every node whose inputs
+    are ready is dispatched at once to a pool, so independent branches of the graph run at the same time.
+    Each node type chooses its pool with Node.eval_pool, which can be overridden per type with setPool().
+    Threads suit nodes that release the GIL (I/O, native code), processes suit pure Python number crunching.
+    Nodes whose evalImplementation is a coroutine (async def) always run on the asyncio loop (see SceneAsyncLoop).
+    The 'distributed' pool sends nodes to worker processes connected over sockets (see SceneCoordinator).
+
+    Ready nodes wait in a queue until their pool has a free worker and the limits of their type allow it (see
+    setLimits), and the most urgent ones go first: by Node.eval_priority, and then critical path first, the nodes with
+    the longest chain of work after them (measured from how long each node type took before, or Node.eval_cost).
+    There is one queue per pool and limits, since the nodes in it can only start in the same order: only the first
+    node of each queue is looked at, so dispatching doesn't get slower with the number of ready nodes.
+    getMetrics() tells how long nodes waited in the queue and how busy the pools were.
+
+    Everything that touches the nodes (reading their inputs, storing their outputs) happens in the thread that called
+    evaluate() or start(), so the pools only run evalImplementation/evalStatic.
+    evaluate() blocks until the nodes are evaluated. start() returns right away, and the nodes are stored as they
+    finish by the Qt event loop, so the editor keeps responding while the graph runs.
+    """
+
+    nodeEvaluated = Signal(object)      # Node, each time a node finishes
+    evaluationFinished = Signal()       # The nodes passed to start() are up to date
+    evaluationFailed = Signal(str)      # A node failed (see last_error) or the evaluation was cancelled
+
+    # Futures finish in other threads, so the scheduler's thread receives them through this (queued) signal
+    _finished = Signal(object)          # Future
+
+    def __init__(self, scene, max_threads=None, max_processes=None, max_async=1000):
+        super().__init__()
+        self.scene = scene
+
+        # Sizes of the pools. By default, one process per core (and the default of ThreadPoolExecutor for threads).
+        self.max_threads = max_threads
+        self.max_processes = max_processes
+        # Outputs of nodes evaluated in processes from this size on are passed in shared memory (see SharedPayload)
+        self.shared_min_size = SHARED_PAYLOAD_MIN_SIZE
+        # Workers of the 'distributed' pool started on this machine (by default, one per core), and the address they
+        # connect to (by default, a free TCP port on localhost)
+        self.distributed_workers = None
+        self.distributed_address = None
+        self.coordinator = None     # SceneCoordinator, started the first time it's needed
+        self._graph_changes = None  # Scene.changes when the coordinator was last given the graph
+
+        # Order of the ready nodes: 'critical_path' (by priority, then the longest chain of work after them first) or
+        # 'fifo' (in the order they got ready)
+        self.ordering = 'critical_path'
+        self.memory_limit = None    # Estimated memory (Node.eval_memory) of all the nodes running at once
+        self.node_limits = {}       # Node type -> (max running, max memory), overriding Node.eval_max_running
+        self.durations = {}         # Node type -> average time its nodes took, for the critical path
+
+        self.node_pools = {}        # Node type -> pool, overriding Node.eval_pool
+        self.last_evaluated = []    # Nodes evaluated by the last evaluation, in the order they finished
+        self.last_error = None      # Exception that stopped the last evaluation (EvaluationError or EvaluationCancelled)
+
+        self.async_loop = SceneAsyncLoop(max_async)
+        self._thread_pool = None    # Pools are only started the first time they're needed
+        self._process_pool = None
+        self._cancelled = threading.Event()
+
+        # State of the evaluation in progress
+        self._nodes = None          # Nodes that were asked for, None if there's no evaluation in progress
+        self._to_evaluate = set()   # Dirty nodes they depend on
+        self._waiting = {}          # Node -> how many of its inputs are still to be evaluated
+        self._dependents = {}       # Node -> nodes that wait for it
+        self._ready = {}            # (pool,) + limits -> heap of (sort key, node) of the nodes whose inputs are ready
+        self._ready_count = 0
+        self._ranks = {}            # Node -> length of the longest chain of work from it to the end
+        self._sequence = itertools.count()
+        self._running = {}          # Future -> its node. Changed under _running_lock, since cancel() reads it from any thread.
+        self._running_lock = threading.Lock()
+        self._dispatched = {}       # Future -> (pool, limits key, memory, start time)
+        self._pool_running = {}     # Pool -> nodes running in it
+        self._type_running = {}     # Limits key -> [nodes running, their memory]
+        self._memory_running = 0
+        self._ready_times = {}      # Node -> when it got ready
+
+        # Metrics of the last evaluation
+        self._metrics_times = (0.0, 0.0)    # When it started and ended
+        self._metrics_waits = []            # Time each node waited in the queue
+        self._metrics_depths = []           # Length of the queue after each dispatch
+        self._metrics_busy = {}             # Pool -> time spent running nodes
+        self._keys = {}             # Future -> cache key of its node's result
+        self._inputs = {}           # Future -> input values of its node, to release their payloads when it's done
+
+        self._finished.connect(self._onFinished, Qt.QueuedConnection)
+
+
+    def setPool(self, node_type, pool):
+        """ Makes the nodes of the given type (and its subclasses) be evaluated in the given pool """
+        if pool not in POOLS: raise ValueError("Unknown pool %r, it must be one of %s" % (pool, ", ".join(POOLS)))
+        self.node_pools[node_type] = pool
+
+
+    def getPool(self, node):
+        if inspect.iscoroutinefunction(node.evalImplementation): return 'async'
+        for node_type in type(node).__mro__:
+            if node_type in self.node_pools: return self.node_pools[node_type]
+        return node.eval_pool
+
+
+    def setLimits(self, node_type, max_running=None, max_memory=None):
+        """
+        Limits how many nodes of the given type (and its subclasses) run at once, and their total estimated memory
+        (Node.eval_memory). For example, setLimits(HeavyNode, max_running=2).
+        """
+        self.node_limits[node_type] = (max_running, max_memory)
+
+
+    def getLimits(self, node):
+        """ Returns the type the node's limits are counted for, its maximum running nodes and maximum memory """
+        for node_type in type(node).__mro__:
+            if node_type in self.node_limits: return (node_type,) + self.node_limits[node_type]
+            if ('eval_max_running' in node_type.__dict__): return node_type, node_type.eval_max_running, None
+        return type(node), None, None
+
+
+    def getCapacity(self, pool):
+        """
+        Returns how many nodes the pool can run at once. For the 'distributed' pool, it's the workers of the
+        coordinator (see SceneCoordinator.getWorkerCount), which includes the ones that connected by themselves.
+        """
+        if (pool == 'thread'): return self.max_threads or min(32, (os.cpu_count() or 1) + 4)
+        if (pool == 'process'): return self.max_processes or os.cpu_count() or 1
+        if (pool == 'async'): return self.async_loop.max_concurrent
+        if (pool == 'distributed'):
+            return self.coordinator.getWorkerCount() if (self.coordinator is not None) else 0
+        return 1
+
+
+    def getCost(self, node):
+        """ Returns how long the node is expected to take: what nodes of its type took before, or its eval_cost """
+        return self.durations.get(type(node), node.eval_cost)
+
+
+    def getMetrics(self):
+        """
+        Returns the metrics of the last (or current) evaluation, as a dict: how long it took, how many nodes were
+        queued, how long they waited for a worker, and the utilization of each pool (the time its workers spent
+        running nodes, over the time they had).
+        """
+        started, ended = self._metrics_times
+        makespan = (ended if not self.isEvaluating() else time.monotonic()) - started
+        waits, depths = self._metrics_waits, self._metrics_depths
+        return OrderedDict([
+            ('makespan', makespan),
+            ('nodes', len(waits)),
+            ('queue_depth', self._ready_count),
+            ('max_queue_depth', max(depths, default=0)),
+            ('mean_queue_depth', sum(depths) / len(depths) if depths else 0.0),
+            ('mean_wait', sum(waits) / len(waits) if waits else 0.0),
+            ('max_wait', max(waits, default=0.0)),
+            ('running', len(self._running)),
+            ('utilization', OrderedDict((pool, busy / (self.getCapacity(pool) * makespan)
+                                         if (makespan > 0 and self.getCapacity(pool) > 0) else 0.0)
+                                        for pool, busy in self._metrics_busy.items())),
+        ])
+
+
+    def getExecutor(self, pool):
+        if (pool == 'thread'):
+            if (self._thread_pool is None):
+                self._thread_pool = ThreadPoolExecutor(self.max_threads, thread_name_prefix="SceneScheduler")
+            return self._thread_pool
+
+        if (pool == 'process'):
+            if (self._process_pool is None):
+                # Forking a process with a running Qt application (and its threads) isn't safe, so workers are spawned
+                self._process_pool = ProcessPoolExecutor(self.max_processes or os.cpu_count(),
+                                                         mp_context=multiprocessing.get_context('spawn'))
+            return self._process_pool
+
+        raise ValueError("Unknown pool %r, it must be one of %s" % (pool, ", ".join(POOLS)))
+
+
+    def getCoordinator(self):
+        if (self.coordinator is None):
+            self.coordinator = SceneCoordinator(self.distributed_workers, self.distributed_address)
+            self.coordinator.start()
+            self._graph_changes = None
+        return self.coordinator
+
+
+    def shutdown(self, wait=True):
+        """ Stops the pools and the asyncio loop. They're started again if the scheduler is used afterwards. """
+        self.cancel()
+        for executor in (self._thread_pool, self._process_pool):
+            if (executor is not None): executor.shutdown(wait=wait, cancel_futures=True)
+        self._thread_pool = None
+        self._process_pool = None
+        self.async_loop.stop()
+        if (self.coordinator is not None): self.coordinator.stop()
+        self.coordinator = None
+
+        for node in self.scene.iterNodes():
+            self.scene.evaluator.freeOutputValues(node)
+
+
+    def cancel(self):
+        """
+        Stops the evaluation in progress: no more nodes are dispatched, async nodes are cancelled, and the
+        evaluation fails with EvaluationCancelled once the nodes that are already running finish.
+        Can be called from any thread.
+        """
+        self._cancelled.set()
+        with self._running_lock:
+            futures = list(self._running)
+        for future in futures:
+            future.cancel()
+
+
+    def isCancelled(self):
+        """ Nodes that take long can check this from their evalImplementation to stop early """
+        return self._cancelled.is_set()
+
+
+    def isEvaluating(self):
+        return (self._nodes is not None)
+
+
+    def submit(self, node):
+        """
+        Starts evaluating a node in its pool, with the values of its inputs. Returns a Future with its output values,
+        which is already done if they're in the scene's cache.
+        """
+        pool = self.getPool(node)
+        input_values = self.scene.evaluator.getInputValues(node)
+
+        key, output_values = self.scene.cache.lookup(node, input_values)
+        if (output_values is not None):
+            future = Future()
+            future.set_result(output_values)
+        else:
+            if DEBUG: print("SceneScheduler::submit ~", node, "to", pool)
+            future = self._submit(node, pool, input_values)
+            self._keys[future] = key
+
+        self._inputs[future] = input_values
+        return future
+
+
+    def _submit(self, node, pool, input_values):
+        if (pool == 'process'):
+            # Payloads in shared memory are given to the worker as they are, it maps them itself
+            return self.getExecutor(pool).submit(runInProcess, type(node), input_values, node.getEvalParams(),
+                                                 self.shared_min_size)
+
+        if (pool == 'distributed'):
+            # Workers can be on other machines, so they get the data itself
+            return self.getCoordinator().submit(node, materializePayloads(input_values))
+
+        input_values = resolvePayloads(input_values)
+        if (pool == 'async'):
+            return self.async_loop.submit(node, input_values)
+
+        if (pool == 'main'):
+            future = Future()
+            try:
+                future.set_result(node.evalImplementation(input_values))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        return self.getExecutor(pool).submit(node.evalImplementation, input_values)
+
+
+    def _begin(self, nodes):
+        """ Finds the nodes to evaluate and the ones that are ready to start """
+        if self.isEvaluating(): raise RuntimeError("The scene is already being evaluated")
+
+        self._cancelled.clear()
+        self.last_evaluated = []
+        self.last_error = None
+
+        order = self.scene.evaluator.getEvaluationOrder(nodes)
+        self._to_evaluate = set(order)
+
+        self._waiting = {}
+        self._dependents = {}
+        for node in order:
+            input_nodes = set(input_node for input_node in node.getInputNodes() if input_node in self._to_evaluate)
+            self._waiting[node] = len(input_nodes)
+            for input_node in input_nodes:
+                self._dependents.setdefault(input_node, []).append(node)
+
+        # Distributed workers get the graph before they get its nodes, again only if it changed since
+        if (any(self.getPool(node) == 'distributed' for node in order) and
+            (self.coordinator is None or self._graph_changes != self.scene.changes)):
+            self.getCoordinator().setGraph(self.scene.serialize())
+            self._graph_changes = self.scene.changes
+
+        # Rank of each node: its cost plus the rank of the longest chain after it
+        self._ranks = {}
+        for node in reversed(order):
+            after = max((self._ranks[dependent] for dependent in self._dependents.get(node, ())), default=0)
+            self._ranks[node] = self.getCost(node) + after
+
+        self._nodes = nodes
+        self._ready = {}
+        self._ready_count = 0
+        with self._running_lock:
+            self._running = {}
+        self._dispatched = {}
+        self._pool_running = {}
+        self._type_running = {}
+        self._memory_running = 0
+        self._ready_times = {}
+
+        self._metrics_times = (time.monotonic(), 0.0)
+        self._metrics_waits = []
+        self._metrics_depths = []
+        self._metrics_busy = {}
+
+        for node in order:
+            if (self._waiting[node] == 0): self._pushReady(node)
+
+
+    def _pushReady(self, node):
+        if (self.ordering == 'fifo'):
+            sort_key = (next(self._sequence),)
+        else:
+            sort_key = (-node.eval_priority, -self._ranks[node], next(self._sequence))
+        queue_key = (self.getPool(node),) + self.getLimits(node)
+        heapq.heappush(self._ready.setdefault(queue_key, []), (sort_key, node))
+        self._ready_count += 1
+        self._ready_times[node] = time.monotonic()
+
+
+    def _canStart(self, node, pool, limits):
+        """ Returns True if the node's pool has a free worker, and the limits of its type and the memory limit allow it """
+        if (self._pool_running.get(pool, 0) >= self.getCapacity(pool)): return False
+
+        key, max_running, max_memory = limits
+        running, memory = self._type_running.get(key, (0, 0))
+        if (max_running is not None and running >= max_running): return False
+        # A node that needs more memory than the limit still runs, alone
+        if (max_memory is not None and running > 0 and memory + node.eval_memory > max_memory): return False
+        if (self.memory_limit is not None and self._running and
+            self._memory_running + node.eval_memory > self.memory_limit): return False
+        return True
+
+
+    def _dispatch(self):
+        """
+        Submits the most urgent nodes that are ready and can start, unless the evaluation is being stopped.
+        Returns the submitted futures.
+        """
+        futures = []
+        if (self.last_error is not None or self.isCancelled()):
+            self._ready = {}
+            self._ready_count = 0
+            return futures
+
+        # The first node of each queue, most urgent first. When one can't start, neither can the rest of its queue
+        # until a node of the same pool or limits finishes, so the queue is left for the next dispatch.
+        heads = [(queue[0][0], queue_key) for queue_key, queue in self._ready.items()]
+        heapq.heapify(heads)
+        while heads:
+            sort_key, queue_key = heapq.heappop(heads)
+            pool, limits = queue_key[0], queue_key[1:]
+            queue = self._ready[queue_key]
+            node = queue[0][1]
+            if not self._canStart(node, pool, limits): continue
+
+            heapq.heappop(queue)
+            self._ready_count -= 1
+            if queue:
+                heapq.heappush(heads, (queue[0][0], queue_key))
+            else:
+                del self._ready[queue_key]
+
+            now = time.monotonic()
+            self._metrics_waits.append(now - self._ready_times.pop(node))
+            self._pool_running[pool] = self._pool_running.get(pool, 0) + 1
+            type_running = self._type_running.setdefault(limits[0], [0, 0])
+            type_running[0] += 1
+            type_running[1] += node.eval_memory
+            self._memory_running += node.eval_memory
+
+            future = self.submit(node)
+            with self._running_lock:
+                self._running[future] = node
+            # cancel() sets the flag before it looks at the running nodes, so either it saw this one or this sees the flag
+            if self.isCancelled(): future.cancel()
+            self._dispatched[future] = (pool, limits[0], node.eval_memory, now)
+            futures.append(future)
+
+        self._metrics_depths.append(self._ready_count)
+        return futures
+
+
+    def _release(self, future, node):
+        """ Frees the place the node took in its pool and its type's limits, and measures how long it took """
+        pool, key, memory, started = self._dispatched.pop(future)
+        self._pool_running[pool] -= 1
+        self._type_running[key][0] -= 1
+        self._type_running[key][1] -= memory
+        self._memory_running -= memory
+
+        duration = time.monotonic() - started
+        self._metrics_busy[pool] = self._metrics_busy.get(pool, 0.0) + duration
+        if (future in self._keys and not future.cancelled() and future.exception() is None):
+            # Results taken from the cache don't say how long the node takes
+            previous = self.durations.get(type(node))
+            self.durations[type(node)] = duration if (previous is None) else 0.7 * previous + 0.3 * duration
+
+
+    def _store(self, future):
+        """ Stores the output values of a node that finished, and makes the nodes waiting for it ready if they can start """
+        with self._running_lock:
+            node = self._running.pop(future)
+        self._release(future, node)
+        key = self._keys.pop(future, None)
+        self.scene.evaluator.releaseInputValues(self._inputs.pop(future, ()))
+
+        output_values = None
+        try:
+            if future.cancelled(): raise EvaluationCancelled("Evaluation was cancelled")
+            output_values = future.result()
+            self.scene.evaluator.checkOutputValues(node, output_values)
+        except Exception as e:
+            if (self.last_error is None and not self.isCancelled()): self.last_error = EvaluationError(node, e)
+            for payload in iterPayloads(output_values or ()):
+                payload.free()
+            return
+
+        self.scene.cache.store(node, key, output_values)
+        self.scene.evaluator.setOutputValues(node, output_values, self._to_evaluate)
+        self.last_evaluated.append(node)
+        self.nodeEvaluated.emit(node)
+
+        for dependent in self._dependents.get(node, ()):
+            self._waiting[dependent] -= 1
+            if (self._waiting[dependent] == 0): self._pushReady(dependent)
+
+        if (self.last_error is not None or self.isCancelled()):
+            # The nodes that didn't start yet won't
+            for future in list(self._running):
+                future.cancel()
+
+
+    def _stalledError(self):
+        """
+        Returns the error of an evaluation that has ready nodes left when nothing is running (that would free a place
+        for them): the first of them can never start, because its pool has no workers or its type allows no running
+        node. Returns None if there are no nodes left.
+        """
+        for queue_key, queue in self._ready.items():
+            pool, node_type, max_running = queue_key[:3]
+            if (self.getCapacity(pool) <= 0):
+                reason = "the %r pool has no workers" % pool
+            else:
+                reason = "%s is limited to %s running nodes" % (node_type.__name__, max_running)
+            return EvaluationError(queue[0][1], RuntimeError("It can never start: %s" % reason))
+        return None
+
+
+    def _end(self):
+        """ Finishes the evaluation, returning the values of the nodes or raising the error that stopped it """
+        if (self.last_error is None and not self.isCancelled()): self.last_error = self._stalledError()
+        nodes = self._nodes
+        self._nodes = None
+        self._metrics_times = (self._metrics_times[0], time.monotonic())
+        self._ready = {}
+        self._ready_count = 0
+        with self._running_lock:
+            self._running = {}
+        self._dispatched = {}
+        self._keys = {}
+        self._inputs = {}
+        self._to_evaluate = set()
+
+        if (self.last_error is None and self.isCancelled()): self.last_error = EvaluationCancelled("Evaluation was cancelled")
+        if (self.last_error is not None):
+            raise self.last_error from getattr(self.last_error, 'error', None)
+
+        return [node.output_values for node in nodes]
+
+
+    def evaluate(self, nodes):
+        """
+        Makes sure the given nodes are up to date, evaluating the dirty ones and the dirty nodes they depend on.
+        Blocks until they're done, and returns the values of the outputs of each node, in a list.
+        If a node fails, no more nodes are dispatched, the ones already running are waited for (and kept if they
+        succeed), and EvaluationError is raised. The failed node and the ones depending on it stay dirty.
+        EvaluationError is also raised if a node can never start: its pool has no workers, or its type is limited to
+        no running node (see setLimits).
+        """
+        self._begin(list(nodes))
+        try:
+            while (self._ready_count or self._running):
+                self._dispatch()
+                if not self._running: break
+
+                done, not_done = wait(list(self._running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._store(future)
+        finally:
+            # Interrupted (KeyboardInterrupt...): don't leave anything queued in the pools
+            for future in self._running:
+                future.cancel()
+
+        return self._end()
+
+
+    def evaluateAll(self):
+        """ Evaluates every dirty node in the scene """
+        return self.evaluate(self.scene.iterNodes())
+
+
+    def start(self, nodes):
+        """
+        Starts evaluating the given nodes like evaluate(), but without blocking. It needs a running Qt event loop.
+        evaluationFinished is emitted once the nodes are up to date, or evaluationFailed if something stopped it.
+        """
+        self._begin(list(nodes))
+        self._startReady()
+
+
+    def _startReady(self):
+        for future in self._dispatch():
+            future.add_done_callback(self._finished.emit)
+
+        if not self._running:
+            try:
+                self._end()
+            except (EvaluationError, EvaluationCancelled) as e:
+                self.evaluationFailed.emit(str(e))
+            else:
+                self.evaluationFinished.emit()
+
+
+    def _onFinished(self, future):
+        if (future not in self._running): return    # Left over from an evaluation that was already ended
+        self._store(future)
+        self._startReady()
@@ -0,0 +1,189 @@
+from multiprocessing import shared_memory
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+DEBUG = False
+
+SHARED_PAYLOAD_MIN_SIZE = 64 * 1024     # Smaller values are cheaper to pickle than to put in shared memory
+
+
+class SharedPayload():
+    """
+    Handle to bytes, or a NumPy array, in a block of shared memory. Nodes evaluated in a process pool (see
+    SceneScheduler) give their large bytes and array outputs to the next nodes as payloads instead of pickling them:
+    only the handle (the block's name) goes from process to process, and each process maps the same memory.
+
+    The scene's process owns the payloads. They're reference counted: each node that reads one holds a reference
+    until it's evaluated, and the block is freed once every one of them finished. A payload that no node was going to
+    read is kept as the value of its node until the node is evaluated again (or removed).
+    """
+
+    def __init__(self, name, size, dtype=None, shape=None):
+        self.name = name
+        self.size = size            # In bytes
+        self.dtype = dtype          # Arrays only: dtype string and shape
+        self.shape = shape
+
+        self.refcount = 0
+        self.freed = False
+        self._shm = None            # The block, mapped in this process
+        self._view = None           # memoryview of its first size bytes
+
+
+    def __repr__(self):
+        return "<SharedPayload %s %d bytes%s>" % (self.name, self.size, "" if self.dtype is None else " " + self.dtype)
+
+
+    def __getstate__(self):
+        # Only the handle is sent to the other processes
+        return (self.name, self.size, self.dtype, self.shape)
+
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+    @classmethod
+    def allocate(cls, size, dtype=None, shape=None):
+        """ Creates a new block of shared memory. Nodes can fill view() directly to avoid copying their output. """
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        payload = cls(shm.name, size, dtype, shape)
+        payload._shm = shm
+        if DEBUG: print("SharedPayload::allocate ~", payload)
+        return payload
+
+
+    @classmethod
+    def fromValue(cls, value):
+        """ Copies bytes or an array to a new block of shared memory """
+        if (numpy is not None and isinstance(value, numpy.ndarray)):
+            payload = cls.allocate(value.nbytes, value.dtype.str, value.shape)
+            payload.view()[...] = value
+        else:
+            data = memoryview(value).cast('B')
+            payload = cls.allocate(data.nbytes)
+            payload.view()[:] = data
+        return payload
+
+
+    def view(self):
+        """ Returns the data, without copying it: a memoryview, or an array (read-write, shared by every reader) """
+        if self.freed: raise ValueError("%s was already freed" % self)
+        if (self._shm is None): self._shm = shared_memory.SharedMemory(self.name)
+        if (self._view is None): self._view = self._shm.buf[:self.size]
+
+        if (self.dtype is None): return self._view
+        if (numpy is None): raise ImportError("NumPy is needed to read the array in %s" % self)
+        return numpy.ndarray(self.shape, dtype=self.dtype, buffer=self._view)
+
+
+    def toValue(self):
+        """ Returns a copy of the data, that doesn't depend on the shared memory """
+        data = self.view()
+        return data.copy() if (self.dtype is not None) else bytes(data)
+
+
+    def detach(self):
+        """ Unmaps the block from this process. Views that are still in use keep it mapped until they're deleted. """
+        try:
+            if (self._view is not None): self._view.release()
+            self._view = None
+            if (self._shm is not None): self._shm.close()
+            self._shm = None
+        except BufferError:
+            pass
+
+
+    def acquire(self, count=1):
+        self.refcount += count
+
+
+    def release(self):
+        """ A node is done reading the payload. The block is freed when it was the last one. """
+        self.refcount -= 1
+        if (self.refcount <= 0): self.free()
+
+
+    def free(self):
+        """ Frees the block of shared memory. Processes that still have it mapped can keep reading it. """
+        if self.freed: return
+        if DEBUG: print("SharedPayload::free ~", self)
+        try:
+            if (self._shm is None): self._shm = shared_memory.SharedMemory(self.name)
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self.detach()
+        self.freed = True
+
+
+    def isSpent(self):
+        """ A freed payload can't be read anymore, so its node has to be evaluated again """
+        return self.freed
+
+
+
+def isSharable(value, min_size=SHARED_PAYLOAD_MIN_SIZE):
+    """ Returns True if the value is bytes or an array large enough to be worth putting in shared memory """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return (memoryview(value).nbytes >= min_size)
+    if (numpy is not None and isinstance(value, numpy.ndarray)):
+        return (value.dtype != object and value.nbytes >= min_size)
+    return False
+
+
+def iterPayloads(values):
+    """ Yields the payloads in a list of values (input values can be lists themselves) """
+    for value in values:
+        if isinstance(value, SharedPayload):
+            yield value
+        elif isinstance(value, list):
+            yield from iterPayloads(value)
+
+
+def resolvePayloads(values):
+    """ Returns the values with their payloads replaced by their data (see SharedPayload.view) """
+    return [value.view() if isinstance(value, SharedPayload) else
+            resolvePayloads(value) if isinstance(value, list) else value
+            for value in values]
+
+
+def materializePayloads(values):
+    """ Returns the values with their payloads replaced by copies of their data, to send them to other machines """
+    return [value.toValue() if isinstance(value, SharedPayload) else
+            materializePayloads(value) if isinstance(value, list) else value
+            for value in values]
+
+
+def runInProcess(node_type, input_values, params, min_size=SHARED_PAYLOAD_MIN_SIZE):
+    """
+    Evaluates a node with Node.evalStatic in a process pool worker. Its input payloads are mapped in the worker, and
+    its large outputs are put in shared memory, so that only their handles are sent back.
+    """
+    payloads = list(iterPayloads(input_values))
+    try:
+        output_values = node_type.evalStatic(resolvePayloads(input_values), params)
+        if (output_values is None): return output_values
+
+        shared_values = []
+        try:
+            for value in output_values:
+                if isinstance(value, SharedPayload):
+                    value.detach()
+                elif isSharable(value, min_size):
+                    value = SharedPayload.fromValue(value)
+                    value.detach()
+                shared_values.append(value)
+        except BaseException:
+            for payload in iterPayloads(shared_values):
+                payload.free()
+            raise
+        return shared_values
+    finally:
+        output_values = None
+        for payload in payloads:
+            payload.detach()
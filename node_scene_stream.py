@@ -0,0 +1,211 @@
+import asyncio
+import threading
+from collections import deque
+from collections.abc import Iterator, AsyncIterator
+
+
+DEBUG = False
+
+
+def isStreamValue(value):
+    """ Output values that are iterators (generators, files...) or async iterators are streamed to the next nodes """
+    return isinstance(value, (Iterator, AsyncIterator)) and not isinstance(value, NodeStream)
+
+
+async def _anext(source):
+    try:
+        return True, await source.__anext__()
+    except StopAsyncIteration:
+        return False, None
+
+
+class NodeStream():
+    """
+    Output value of a node that produces its items one by one (it returned an iterator or async iterator). The nodes
+    connected to it read it through their own StreamReader (see SceneEvaluator.getInputValues), so the next nodes
+    can start with the first items, and the whole output is never held in memory.
+
+    Items are pulled from the source only when a reader asks for them, and kept in a buffer shared by all the readers
+    (they're not copied for each one) until every reader is past them. A reader that gets buffer_size items ahead of
+    another one that is reading in another thread waits for it, so slow readers throttle the source.
+    Readers that don't read in parallel (like nodes evaluated one after another) make the buffer grow instead.
+
+    A stream is read once: readers are reserved for the nodes that were going to read it when it was produced, and
+    once items were dropped from the buffer, new readers can't be opened. The node has to produce it again.
+    """
+
+    def __init__(self, source, readers=1, buffer_size=64, loop=None):
+        self.source = source
+        self.buffer_size = buffer_size
+        self.loop = loop            # Loop of async sources (a SceneAsyncLoop), where their items are awaited
+
+        self._condition = threading.Condition()
+        self._buffer = deque()
+        self._start = 0             # Index of the first item in the buffer
+        self._readers = []          # Positions of the open readers (not the readers, so that they can be deleted)
+        self._reserved = readers    # Readers that can still be opened from the first item
+        self._pulling = False       # A reader is getting the next item from the source
+        self._done = False          # The source has no more items
+        self._error = None          # Exception raised by the source, raised again to every reader that gets there
+
+
+    def __repr__(self):
+        return "<NodeStream %s..%s>" % (hex(id(self))[2:5], hex(id(self))[-3:])
+
+
+    def isSpent(self):
+        """ Returns True if items were already dropped, so the stream can't be read again from its start """
+        return (self._start > 0)
+
+
+    def openReader(self):
+        """ Returns a new reader, starting at the first item """
+        with self._condition:
+            if (self._start > 0):
+                raise ValueError("%s was already read, its node has to be evaluated again" % self)
+            if (self._reserved > 0): self._reserved -= 1
+            reader = StreamReader(self)
+            self._readers.append(reader.position)
+            return reader
+
+
+    def _close(self, position):
+        with self._condition:
+            if position in self._readers:
+                self._readers.remove(position)
+                self._trim()
+                self._condition.notify_all()
+
+
+    def _trim(self):
+        """ Drops the items that every reader is past """
+        if (self._reserved > 0): return
+        lowest = min((position.cursor for position in self._readers), default=self._start + len(self._buffer))
+        while (self._start < lowest):
+            self._buffer.popleft()
+            self._start += 1
+
+
+    def _mustWait(self):
+        """ A reader that is too far ahead waits for the readers left behind, if they're reading in other threads """
+        if (len(self._buffer) < self.buffer_size): return False
+        current_thread = threading.get_ident()
+        for other in self._readers:
+            if (other.cursor == self._start and other.thread is not None and other.thread != current_thread):
+                return True
+        return False
+
+
+    def _read(self, position):
+        """ Returns (True, item) with the next item of a reader, or (False, None) at the end of the stream """
+        with self._condition:
+            while True:
+                if (position.cursor < self._start + len(self._buffer)):
+                    item = self._buffer[position.cursor - self._start]
+                    position.cursor += 1
+                    self._trim()
+                    self._condition.notify_all()
+                    return True, item
+
+                if self._done:
+                    if (self._error is not None): raise self._error
+                    return False, None
+
+                if (self._pulling or self._mustWait()):
+                    self._condition.wait()
+                    continue
+
+                # The source is read without holding the lock, so that readers can take buffered items meanwhile
+                self._pulling = True
+                self._condition.release()
+                try:
+                    has_item, item, error = self._pull()
+                finally:
+                    self._condition.acquire()
+                    self._pulling = False
+
+                if has_item:
+                    self._buffer.append(item)
+                else:
+                    self._done = True
+                    self._error = error
+                self._condition.notify_all()
+
+
+    def _pull(self):
+        try:
+            if isinstance(self.source, Iterator):
+                has_item, item = True, next(self.source)
+            else:
+                has_item, item = self.loop.runCoroutine(_anext(self.source))
+        except StopIteration:
+            return False, None, None
+        except Exception as e:
+            return False, None, e
+        return has_item, item, None
+
+
+
+class ReaderPosition():
+    """ Where a StreamReader is in its stream. The stream keeps these for its open readers. """
+    __slots__ = ('cursor', 'thread')
+
+    def __init__(self, cursor):
+        self.cursor = cursor    # Index of the next item to read
+        self.thread = None      # Thread that read the last item
+
+
+
+class StreamReader():
+    """
+    Iterates over the items of a NodeStream, from the first one. It can be used with for and async for.
+    Each reader is read by one node. Readers are closed when they get to the end, or when they're deleted.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.position = ReaderPosition(stream._start)
+        self.closed = False
+
+
+    def __repr__(self):
+        return "<StreamReader of %s at %d>" % (self.stream, self.position.cursor)
+
+
+    def __iter__(self):
+        return self
+
+
+    def __next__(self):
+        has_item, item = self._next()
+        if not has_item: raise StopIteration
+        return item
+
+
+    def __aiter__(self):
+        return self
+
+
+    async def __anext__(self):
+        # Waiting for the items (and for the other readers) would block the loop, so it's done in a thread
+        has_item, item = await asyncio.to_thread(self._next)
+        if not has_item: raise StopAsyncIteration
+        return item
+
+
+    def _next(self):
+        if self.closed: return False, None
+        self.position.thread = threading.get_ident()
+        has_item, item = self.stream._read(self.position)
+        if not has_item: self.close()
+        return has_item, item
+
+
+    def close(self):
+        if self.closed: return
+        self.closed = True
+        self.stream._close(self.position)
+
+
+    def __del__(self):
+        self.close()
@@ -7,5 +7,5 @@ class Serializable():
     def serialize(self):
         raise NotImplemented()
 
-    def deserialize(self, data, hashmap={}):
+    def deserialize(self, data, hashmap=None):
         raise NotImplemented()
@@ -23,12 +23,18 @@ class Socket(Serializable):
 
         if DEBUG: print("Socket -- creating with", self.index, self.position, "for node", self.node)
 
-        self.grSocket = QDMGraphicsSocket(self, self.socket_type)
-
-        self.grSocket.setPos(*self.node.getSocketPosition(index, position))
+        self.grSocket = None    # Only if the node has graphics (see initUI)
+        if (self.node.grNode is not None): self.initUI()
 
         self.edges = []
 
+        self.node.scene.addSocket(self)
+
+
+    def initUI(self):
+        self.grSocket = QDMGraphicsSocket(self, self.socket_type)
+        self.grSocket.setPos(*self.node.getSocketPosition(self.index, self.position))
+
 
     def __str__(self):
         return "<Socket %s %s..%s>" % ("ME" if self.is_multi_edges else "SE", hex(id(self))[2:5], hex(id(self))[-3:])
@@ -41,13 +47,32 @@ class Socket(Serializable):
         return res
 
 
+    def isInput(self):
+        return (self in self.node.inputs)
+
+
     def addEdge(self, edge):
         self.edges.append(edge)
+        edge.markInputDirty()   # The node of its input gets a new input value
     
 
     def removeEdge(self, edge):
         if edge in self.edges: self.edges.remove(edge)
         else: print("!W:", "Socket::removeEdge", "wanna remove edge", edge, "from self.edges but it's not in the list!")
+        edge.markInputDirty()
+
+
+    def getConnectedSockets(self):
+        """
+        Yields the sockets at the other end of this socket's edges: the outputs it reads from if it's an input, or the
+        inputs that read from it if it's an output. Edges can be dragged from an input to an output as well, so which
+        end is the edge's start doesn't matter. Edges being dragged, and edges between two inputs or two outputs,
+        don't connect anything.
+        """
+        is_input = self.isInput()
+        for edge in self.edges:
+            other = edge.end_socket if (edge.start_socket is self) else edge.start_socket
+            if (other is not None and other.isInput() != is_input): yield other
 
 
     def removeAllEdges(self):
@@ -67,9 +92,12 @@ class Socket(Serializable):
         ])
 
 
-    def deserialize(self, data, hashmap={}, restore_id=True):
+    def deserialize(self, data, hashmap=None, restore_id=True):
         """ Given json-serialized data about the socket, deserialize it and load it """        
         self.is_multi_edges = data['multi_edges']
-        if restore_id: self.id = data['id']
-        hashmap[data['id']] = self
+        if restore_id:
+            self.node.scene.removeSocket(self)
+            self.id = data['id']
+            self.node.scene.addSocket(self)
+        if hashmap is not None: hashmap[data['id']] = self
 
@@ -0,0 +1,55 @@
+import gc
+import os
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from PySide6.QtWidgets import QApplication
+from node_node import Node
+from node_edge import Edge
+from node_scene import Scene
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    """ The QApplication that scenes with graphics, widgets and queued signals need """
+    app = QApplication.instance() or QApplication([])
+    yield app
+
+
+@pytest.fixture
+def scene():
+    """ A headless scene, shut down after the test """
+    scene = Scene(headless=True)
+    yield scene
+    scene.scheduler.shutdown()
+
+
+@pytest.fixture
+def gui_scene(qapp):
+    """ A scene with graphics """
+    scene = Scene()
+    yield scene
+    scene.scheduler.shutdown()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    """
+    Collects the garbage of tests with graphics once pytest let go of their fixtures: the Qt objects of their scenes
+    are in reference cycles, and freeing them at a random point of a later test can crash
+    """
+    yield
+    if ('gui_scene' in item.fixturenames): gc.collect()
+
+
+def makeNode(scene, title="Node", inputs=(1,), outputs=(1,), node_type=Node, pos=(0, 0)):
+    node = node_type(scene, title, inputs=list(inputs), outputs=list(outputs))
+    node.setPos(*pos)
+    return node
+
+
+def connect(scene, node_from, node_to, output=0, input=0):
+    return Edge(scene, node_from.outputs[output], node_to.inputs[input])
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+import pytest
+from node_node import Node
+from node_scene_evaluator import EvaluationError, EvaluationCancelled
+from conftest import makeNode
+
+
+class WaitNode(Node):
+    """ Waits for content_data['wait'] seconds without blocking a thread, then outputs content_data['value'] """
+    eval_cacheable = False
+
+    async def evalImplementation(self, input_values):
+        await asyncio.sleep(self.content_data.get('wait', 0))
+        return [self.content_data.get('value', 1)]
+
+
+class LimitedWaitNode(WaitNode):
+    eval_concurrency = 2
+
+
+class SlowNode(Node):
+    eval_timeout = 0.05
+    eval_cacheable = False
+
+    async def evalImplementation(self, input_values):
+        await asyncio.sleep(10)
+        return [None]
+
+
+def waitNode(scene, title, wait=0.0, value=1, node_type=WaitNode):
+    node = makeNode(scene, title, node_type=node_type)
+    node.content_data.update(wait=wait, value=value)
+    return node
+
+
+def test_async_nodes_wait_together(scene):
+    nodes = [waitNode(scene, "n%d" % i, wait=0.2, value=i) for i in range(50)]
+
+    started = time.monotonic()
+    values = scene.scheduler.evaluate(nodes)
+    assert time.monotonic() - started < 1.0
+    assert values == [[i] for i in range(50)]
+
+
+def test_concurrency_of_a_type_is_limited(scene):
+    nodes = [waitNode(scene, "n%d" % i, wait=0.1, node_type=LimitedWaitNode) for i in range(4)]
+
+    started = time.monotonic()
+    scene.scheduler.evaluate(nodes)
+    assert time.monotonic() - started >= 0.2
+
+
+def test_timeout(scene):
+    node = makeNode(scene, "slow", node_type=SlowNode)
+    with pytest.raises(EvaluationError) as error:
+        scene.scheduler.evaluate([node])
+    assert isinstance(error.value.error, TimeoutError)
+    assert node.isDirty()
+
+
+def test_evaluator_runs_async_nodes_too(scene):
+    node = waitNode(scene, "n", value=7)
+    assert scene.evaluator.evaluate([node]) == [[7]]
+
+
+def test_cancel_from_another_thread(scene):
+    nodes = [waitNode(scene, "n%d" % i, wait=10) for i in range(20)]
+    threading.Timer(0.1, scene.scheduler.cancel).start()
+
+    started = time.monotonic()
+    with pytest.raises(EvaluationCancelled):
+        scene.scheduler.evaluate(nodes)
+    assert time.monotonic() - started < 5
+    assert all(node.isDirty() for node in nodes)
+    assert not scene.scheduler.isEvaluating()
+
+
+def test_cancel_while_dispatching(scene):
+    """ cancel() can be called while nodes are being dispatched and finishing, in the evaluating thread """
+    nodes = [waitNode(scene, "n%d" % i) for i in range(500)]
+    errors = []
+
+    def cancelRepeatedly():
+        try:
+            while not done.is_set():
+                scene.scheduler.cancel()
+        except Exception as e:
+            errors.append(e)
+
+    done = threading.Event()
+    thread = threading.Thread(target=cancelRepeatedly)
+    thread.start()
+    try:
+        with pytest.raises(EvaluationCancelled):
+            scene.scheduler.evaluate(nodes)
+    finally:
+        done.set()
+        thread.join()
+    assert errors == []
+
+
+def test_next_evaluation_after_cancel(scene):
+    node = waitNode(scene, "n", value=3)
+    scene.scheduler.cancel()
+    assert scene.scheduler.evaluate([node]) == [[3]]
@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from node_node import Node
+from node_edge import Edge
+from node_scene_evaluator import EvaluationError
+from conftest import makeNode, connect
+
+
+class ValueNode(Node):
+    eval_cacheable = False
+
+    def evalImplementation(self, input_values):
+        return [self.content_data.get('value', 0)]
+
+
+class AddNode(Node):
+    eval_cacheable = False
+
+    def evalImplementation(self, input_values):
+        if (input_values[0] == 'fail'): raise ValueError("bad row")
+        return [input_values[0] + input_values[1]]
+
+
+class VectorAddNode(AddNode):
+    eval_vectorized = True
+
+    def evalBatch(self, input_values, size):
+        self.scene.batch_inputs = input_values
+        return [[a + b for a, b in zip(*input_values)]]
+
+
+class AsyncAddNode(Node):
+    eval_cacheable = False
+
+    async def evalImplementation(self, input_values):
+        await asyncio.sleep(0.01)
+        return [input_values[0] + input_values[1]]
+
+
+@pytest.fixture
+def graph(scene):
+    """ column -> add <- offset """
+    column = makeNode(scene, "column", inputs=(), node_type=ValueNode)
+    offset = makeNode(scene, "offset", inputs=(), node_type=ValueNode)
+    offset.content_data['value'] = 10
+    return scene, column, offset
+
+
+def test_rows_are_evaluated_one_by_one(graph):
+    scene, column, offset = graph
+    add = makeNode(scene, "add", inputs=(1, 1), node_type=AddNode)
+    connect(scene, column, add, input=0)
+    connect(scene, offset, add, input=1)
+
+    assert scene.batch_evaluator.evaluate([add], {column: [1, 2, 3]}) == [[[11, 12, 13]]]
+    assert scene.batch_evaluator.last_evaluated == [add]
+    assert add.isDirty()
+
+
+def test_vectorized_nodes_get_scalar_inputs_as_columns(graph):
+    scene, column, offset = graph
+    add = makeNode(scene, "add", inputs=(1, 1), node_type=VectorAddNode)
+    connect(scene, column, add, input=0)
+    connect(scene, offset, add, input=1)
+
+    assert scene.batch_evaluator.evaluate([add], {column: [1, 2, 3]}) == [[[11, 12, 13]]]
+    assert scene.batch_inputs == [[1, 2, 3], [10, 10, 10]]
+
+
+def test_edges_drawn_from_the_input_are_followed(graph):
+    scene, column, offset = graph
+    add = makeNode(scene, "add", inputs=(1, 1), node_type=AddNode)
+    Edge(scene, add.inputs[0], column.outputs[0])
+    Edge(scene, add.inputs[1], offset.outputs[0])
+
+    assert scene.batch_evaluator.evaluate([add], {column.outputs[0]: [1, 2]}) == [[[11, 12]]]
+
+
+def test_async_rows(graph):
+    scene, column, offset = graph
+    add = makeNode(scene, "add", inputs=(1, 1), node_type=AsyncAddNode)
+    connect(scene, column, add, input=0)
+    connect(scene, offset, add, input=1)
+
+    assert scene.batch_evaluator.evaluate([add], {column: list(range(20))}) == [[[i + 10 for i in range(20)]]]
+
+
+def test_records_and_unbatched_nodes(graph):
+    scene, column, offset = graph
+    add = makeNode(scene, "add", inputs=(1, 1), node_type=AddNode)
+    connect(scene, column, add, input=0)
+    connect(scene, offset, add, input=1)
+
+    columns = scene.batch_evaluator.evaluate([add, offset], [{column: 1}, {column: 5}])
+    assert columns == [[[11, 15]], [[10, 10]]]
+
+
+def test_failed_row(graph):
+    scene, column, offset = graph
+    add = makeNode(scene, "add", inputs=(1, 1), node_type=AddNode)
+    connect(scene, column, add, input=0)
+    connect(scene, offset, add, input=1)
+
+    with pytest.raises(EvaluationError) as error:
+        scene.batch_evaluator.evaluate([add], {column: [1, 'fail', 3]})
+    assert error.value.node is add and error.value.row == 1
+    assert isinstance(error.value.__cause__, ValueError)
+
+
+def test_columns_of_different_sizes(graph):
+    scene, column, offset = graph
+    with pytest.raises(ValueError):
+        scene.batch_evaluator.evaluate([column], {column: [1, 2], offset: [1]})
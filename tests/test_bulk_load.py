@@ -0,0 +1,87 @@
+import pytest
+from PySide6.QtCore import QPointF
+from node_graphics_view import QDMGraphicsView
+from node_scene import BULK_LOAD_MIN_ITEMS
+from conftest import makeNode, connect
+
+
+@pytest.fixture
+def bulk_loads(gui_scene, monkeypatch):
+    """ Counts the bulk loads of the graphics scene """
+    calls = []
+    begin = gui_scene.grScene.beginBulkLoad
+    monkeypatch.setattr(gui_scene.grScene, 'beginBulkLoad', lambda: (calls.append(1), begin()))
+    return calls
+
+
+@pytest.fixture
+def view(gui_scene):
+    view = QDMGraphicsView(gui_scene.grScene)
+    view.last_scene_mouse_position = QPointF(0, 0)
+    yield view
+    view.deleteLater()
+
+
+def pasteData(count):
+    nodes = [nodeData(i) for i in range(count)]
+    return {'nodes': nodes, 'edges': []}
+
+
+def nodeData(i):
+    return {'id': 1000 + i, 'title': "Node %d" % i, 'pos_x': i * 10.0, 'pos_y': 0.0, 'inputs': [], 'outputs': [],
+            'content': {}}
+
+
+def test_small_undo_keeps_index(gui_scene, bulk_loads):
+    a = makeNode(gui_scene, "A")
+    gui_scene.history.storeHistory("Add node")
+    gui_scene.history.undo()
+    gui_scene.history.redo()
+
+    assert bulk_loads == []
+    assert gui_scene.grScene.bulk_loading == 0
+    assert gui_scene.getNodeById(a.id) is not None
+
+
+def test_large_undo_is_bulk(gui_scene, bulk_loads):
+    for i in range(BULK_LOAD_MIN_ITEMS):
+        makeNode(gui_scene, "N%d" % i, pos=(i * 10, 0))
+    gui_scene.history.storeHistory("Add nodes")
+    gui_scene.history.undo()
+
+    assert len(bulk_loads) == 1
+    assert gui_scene.grScene.bulk_loading == 0
+    assert gui_scene.nodes == []
+
+
+def test_small_paste_keeps_index(gui_scene, view, bulk_loads):
+    gui_scene.clipboard.deserializeFromClipboard(pasteData(2))
+
+    assert bulk_loads == []
+    assert len(gui_scene.nodes) == 2
+
+
+def test_large_paste_is_bulk(gui_scene, view, bulk_loads):
+    gui_scene.clipboard.deserializeFromClipboard(pasteData(BULK_LOAD_MIN_ITEMS))
+
+    assert len(bulk_loads) == 1
+    assert gui_scene.grScene.bulk_loading == 0
+    assert len(gui_scene.nodes) == BULK_LOAD_MIN_ITEMS
+
+
+def test_clear_of_small_scene_keeps_index(gui_scene, bulk_loads):
+    connect(gui_scene, makeNode(gui_scene, "A"), makeNode(gui_scene, "B"))
+    gui_scene.clear()
+
+    assert bulk_loads == []
+    assert gui_scene.nodes == [] and gui_scene.edges == []
+
+
+def test_nested_small_load_inside_bulk_load(gui_scene, bulk_loads):
+    gui_scene.beginBulkLoad()
+    gui_scene.beginBulkLoad(1)
+    gui_scene.endBulkLoad()
+    assert gui_scene.grScene.bulk_loading == 1
+    gui_scene.endBulkLoad()
+    assert gui_scene.grScene.bulk_loading == 0
+    assert len(bulk_loads) == 1
@@ -0,0 +1,113 @@
+import pickle
+import pytest
+from node_node import Node
+from node_scene_cache import SceneResultCache, estimateSize
+from conftest import makeNode, connect
+
+
+class CountNode(Node):
+    """ Outputs the sum of its inputs plus content_data['value'] on each of its outputs, counting its evaluations """
+    evaluations = 0
+
+    def evalImplementation(self, input_values):
+        CountNode.evaluations += 1
+        total = sum(value or 0 for value in input_values) + self.content_data.get('value', 0)
+        return [total] * len(self.outputs)
+
+
+@pytest.fixture(autouse=True)
+def resetCount():
+    CountNode.evaluations = 0
+
+
+def countNode(scene, title, value=0, inputs=(1,), outputs=(1,)):
+    node = makeNode(scene, title, inputs=inputs, outputs=outputs, node_type=CountNode)
+    node.content_data['value'] = value
+    return node
+
+
+def test_same_inputs_and_content_hit(scene):
+    a = countNode(scene, "a", value=1)
+    b = countNode(scene, "b", value=1)
+    assert scene.evaluator.evaluate([a, b]) == [[1], [1]]
+    assert CountNode.evaluations == 1
+    assert scene.cache.getStats()['hits'] == 1
+
+
+def test_different_content_misses(scene):
+    scene.evaluator.evaluate([countNode(scene, "a", value=1), countNode(scene, "b", value=2)])
+    assert CountNode.evaluations == 2
+
+
+def test_different_sockets_miss(scene):
+    """ Same type, content and inputs, but different outputs: the result of one doesn't fit the other """
+    one = countNode(scene, "one", inputs=(), outputs=(1,))
+    two = countNode(scene, "two", inputs=(), outputs=(1, 1))
+    assert scene.evaluator.evaluate([one, two]) == [[0], [0, 0]]
+    assert CountNode.evaluations == 2
+
+
+def test_cached_result_of_the_wrong_shape_is_dropped(scene):
+    node = countNode(scene, "n", inputs=(), outputs=(1, 1))
+    key = scene.cache.getKey(node, [])
+    scene.cache.store(node, key, [1])
+
+    assert scene.cache.lookup(node, [])[1] is None
+    assert scene.evaluator.evaluate([node]) == [[0, 0]]
+    assert CountNode.evaluations == 1
+
+
+def test_invalidate_downstream(scene):
+    a = countNode(scene, "a", value=1)
+    b = countNode(scene, "b")
+    connect(scene, a, b)
+    scene.evaluator.evaluate([b])
+
+    scene.cache.invalidate(a)
+    assert a.isDirty() and b.isDirty()
+    CountNode.evaluations = 0
+    scene.evaluator.evaluate([b])
+    assert CountNode.evaluations == 2
+
+
+def test_memory_budget_evicts_least_recently_used(scene):
+    cache = SceneResultCache(scene, memory_budget=estimateSize(["x" * 100]) * 5 // 2)
+    node = countNode(scene, "n")
+    for key in ("k1", "k2", "k3"):
+        cache.store(node, key, ["x" * 100])
+    assert cache.get("k1") is None
+    assert cache.get("k3") == ["x" * 100]
+    assert cache.evictions == 1
+
+
+def test_disk_tier_across_sessions(scene, tmp_path):
+    node = countNode(scene, "n")
+    first = SceneResultCache(scene, directory=str(tmp_path))
+    first.store(node, "abcd", [42])
+
+    second = SceneResultCache(scene, directory=str(tmp_path))
+    assert second.disk_size > 0
+    assert second.get("abcd") == [42]
+    assert second.disk_hits == 1
+
+
+def test_unpicklable_results_stay_in_memory(scene, tmp_path):
+    cache = SceneResultCache(scene, directory=str(tmp_path))
+    node = countNode(scene, "n")
+    value = lambda: None
+    cache.store(node, "abcd", [value])
+    assert cache.get("abcd")[0] is value
+    assert cache.disk_size == 0
+
+
+def test_size_is_estimated_without_pickling(monkeypatch):
+    values = [list(range(1000)), {"a": "b" * 100}, (1.5, None)]
+    monkeypatch.setattr(pickle, 'dumps', lambda *args, **kwargs: pytest.fail("pickled"))
+    size = estimateSize(values)
+    assert size > 1000 * 8
+
+
+def test_size_counts_buffers():
+    class Array:
+        nbytes = 10 ** 6
+    assert estimateSize([Array()]) > 10 ** 6
@@ -0,0 +1,50 @@
+from node_scene import Scene
+from conftest import makeNode, connect
+
+
+def test_same_scene_is_updated_in_place(scene):
+    a, b = makeNode(scene, "A"), makeNode(scene, "B")
+    connect(scene, a, b)
+    data = scene.serialize()
+
+    a.title = "Changed"
+    c = makeNode(scene, "C")
+    scene.deserialize(data)
+
+    assert scene.getNodeById(a.id) is a         # Same object, updated
+    assert a.title == "A"
+    assert scene.getNodeById(c.id) is None
+    assert len(scene.edges) == 1
+
+
+def test_other_scene_is_rebuilt(scene):
+    live = makeNode(scene, "Live")
+
+    other = Scene(headless=True)
+    makeNode(other, "From file")
+    data = other.serialize()
+    # Ids are memory addresses, so a node of the file can have the id of an unrelated live node
+    live_data = live.serialize()
+    data['nodes'][0].update(id=live.id, inputs=live_data['inputs'], outputs=live_data['outputs'])
+
+    scene.deserialize(data)
+
+    assert [node.title for node in scene.nodes] == ["From file"]
+    assert live.title == "Live"                 # The live node wasn't reused for the file's node
+    assert scene.getNodeById(live.id) is not live
+    assert scene.id == other.id
+
+
+def test_loading_twice_from_another_scene_keeps_one_copy(scene, tmp_path):
+    other = Scene(headless=True)
+    a, b = makeNode(other, "A"), makeNode(other, "B")
+    connect(other, a, b)
+    filename = str(tmp_path / "other.json")
+    other.saveToFile(filename)
+
+    makeNode(scene, "Live")
+    scene.loadFromFile(filename)
+    scene.loadFromFile(filename)
+
+    assert sorted(node.title for node in scene.nodes) == ["A", "B"]
+    assert len(scene.edges) == 1
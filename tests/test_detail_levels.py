@@ -0,0 +1,45 @@
+import pytest
+from node_graphics_view import QDMGraphicsView
+from node_graphics_scene import DETAIL_LOW, DETAIL_MEDIUM, DETAIL_HIGH
+from conftest import makeNode
+
+
+@pytest.fixture
+def view(gui_scene):
+    view = QDMGraphicsView(gui_scene.grScene)
+    yield view
+    view.deleteLater()
+
+
+def zoomTo(view, scale):
+    view.resetTransform()
+    view.scale(scale, scale)
+    view.updateDetailLevel()
+
+
+@pytest.mark.parametrize("scale, level", [(1.0, DETAIL_HIGH), (0.4, DETAIL_MEDIUM), (0.1, DETAIL_LOW)])
+def test_level_follows_the_zoom(view, scale, level):
+    zoomTo(view, scale)
+    assert view.grScene.detail_level == level
+
+
+def test_zoomed_out_nodes_hide_their_details(gui_scene, view):
+    node = makeNode(gui_scene, "A")
+    gui_scene.grScene.updateNodeContents()
+
+    zoomTo(view, 0.4)
+    assert node.grNode.title_item.isVisible()
+    assert node.inputs[0].grSocket.isVisible()
+
+    zoomTo(view, 0.1)
+    assert not node.grNode.title_item.isVisible()
+    assert not node.inputs[0].grSocket.isVisible()
+
+    # Nodes created while zoomed out start without details too
+    other = makeNode(gui_scene, "B")
+    assert not other.grNode.title_item.isVisible()
+    assert not other.outputs[0].grSocket.isVisible()
+
+    zoomTo(view, 1.0)
+    assert other.grNode.title_item.isVisible()
+    assert other.outputs[0].grSocket.isVisible()
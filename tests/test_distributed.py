@@ -0,0 +1,178 @@
+import os
+import signal
+import multiprocessing
+import time
+import pytest
+from node_node import Node
+from node_scene import Scene
+from node_scene_distributed import SceneCoordinator, WorkerError, runWorker
+from node_scene_evaluator import EvaluationError
+from conftest import makeNode, connect
+
+
+class ScaleNode(Node):
+    """ Multiplies its input (or 1) by content_data['factor'], in a worker process """
+    eval_pool = 'distributed'
+    eval_cacheable = False
+
+    @classmethod
+    def evalStatic(cls, input_values, params):
+        return [(1 if input_values[0] is None else input_values[0]) * params['factor']]
+
+
+class FirstWorkerHangsNode(Node):
+    """ Writes the pid of its worker to content_data['marker'] and hangs if it's the first, else outputs the pid """
+    eval_pool = 'distributed'
+
+    @classmethod
+    def evalStatic(cls, input_values, params):
+        if not os.path.exists(params['marker']):
+            with open(params['marker'], "w") as file:
+                file.write(str(os.getpid()))
+            time.sleep(60)
+        return [os.getpid()]
+
+
+class CrashNode(Node):
+    """ Kills the worker evaluating it """
+    eval_pool = 'distributed'
+
+    @classmethod
+    def evalStatic(cls, input_values, params):
+        os._exit(1)
+
+
+def submitAlone(coordinator, node_type, content=None):
+    """ Sends a graph with a single node of the type to the coordinator, and submits the node """
+    scene = Scene(headless=True)
+    node = makeNode(scene, "node", node_type=node_type)
+    node.content_data.update(content or {})
+    coordinator.setGraph(scene.serialize())
+    return coordinator.submit(node, [None])
+
+
+def scaleNode(scene, title, factor):
+    node = makeNode(scene, title, node_type=ScaleNode)
+    node.content_data['factor'] = factor
+    return node
+
+
+@pytest.fixture
+def distributed_scene(scene):
+    scene.scheduler.distributed_workers = 1
+    return scene
+
+
+def test_nodes_are_evaluated_by_workers(distributed_scene):
+    scene = distributed_scene
+    a = scaleNode(scene, "a", 3)
+    b = scaleNode(scene, "b", 5)
+    connect(scene, a, b)
+    assert scene.scheduler.evaluate([b]) == [[15]]
+
+
+def test_graph_is_only_sent_again_when_it_changed(distributed_scene, monkeypatch):
+    scene = distributed_scene
+    node = scaleNode(scene, "a", 2)
+    other = scaleNode(scene, "b", 3)
+    coordinator = scene.scheduler.getCoordinator()
+    graphs = []
+    set_graph = coordinator.setGraph
+    monkeypatch.setattr(coordinator, 'setGraph', lambda data: (graphs.append(data), set_graph(data)))
+
+    assert scene.scheduler.evaluate([node]) == [[2]]
+    assert scene.scheduler.evaluate([other]) == [[3]]
+    assert len(graphs) == 1
+
+    node.content_data['factor'] = 7
+    node.markDirty()
+    assert scene.scheduler.evaluate([node]) == [[7]]
+    assert len(graphs) == 2
+
+
+def test_workers_that_connect_by_themselves_count(scene):
+    scene.scheduler.distributed_workers = 0
+    node = scaleNode(scene, "a", 2)
+    coordinator = scene.scheduler.getCoordinator()
+    process = multiprocessing.get_context('spawn').Process(target=runWorker, args=(coordinator.address, coordinator.authkey), daemon=True)
+    process.start()
+
+    deadline = time.monotonic() + 30
+    while (coordinator.getWorkerCount() == 0 and time.monotonic() < deadline):
+        time.sleep(0.05)
+    assert scene.scheduler.getCapacity('distributed') == 1
+    assert scene.scheduler.evaluate([node]) == [[2]]
+    scene.scheduler.shutdown()
+    process.join(10)
+
+
+def test_no_workers_fails(scene):
+    scene.scheduler.distributed_workers = 0
+    node = scaleNode(scene, "a", 2)
+    with pytest.raises(EvaluationError, match="'distributed' pool has no workers"):
+        scene.scheduler.evaluate([node])
+    assert node.isDirty()
+
+
+def test_stop_before_the_workers_connect():
+    """ Workers that are still starting when the coordinator stops exit quietly """
+    coordinator = SceneCoordinator(workers=2)
+    coordinator.start()
+    processes = list(coordinator._processes.values())
+    coordinator.stop()
+
+    for process in processes:
+        process.join(10)
+        assert process.exitcode == 0
+
+
+def test_stop_waits_for_the_workers_together(monkeypatch):
+    """ Workers that don't stop are given heartbeat_timeout seconds in all, not each """
+    coordinator = SceneCoordinator(workers=3, heartbeat_timeout=0.5)
+
+    def spawnStuckWorker():
+        process = multiprocessing.get_context('spawn').Process(target=time.sleep, args=(60,), daemon=True)
+        process.start()
+        coordinator._processes[process.pid] = process
+
+    monkeypatch.setattr(coordinator, 'spawnWorker', spawnStuckWorker)
+    coordinator.start()
+    processes = list(coordinator._processes.values())
+
+    started = time.monotonic()
+    coordinator.stop()
+    assert time.monotonic() - started < 1.2
+    for process in processes:
+        process.join(5)
+        assert not process.is_alive()
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason="needs SIGKILL")
+def test_task_of_a_killed_worker_is_retried(tmp_path):
+    marker = tmp_path / "first_worker"
+    coordinator = SceneCoordinator(workers=1)
+    coordinator.start()
+    try:
+        future = submitAlone(coordinator, FirstWorkerHangsNode, {'marker': str(marker)})
+        deadline = time.monotonic() + 30
+        while not (marker.exists() and marker.read_text()):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        first_pid = int(marker.read_text())
+        os.kill(first_pid, signal.SIGKILL)
+
+        pid, = future.result(timeout=30)
+        assert pid != first_pid
+    finally:
+        coordinator.stop()
+
+
+def test_task_fails_once_its_workers_died_too_often():
+    coordinator = SceneCoordinator(workers=1, max_retries=1)
+    coordinator.start()
+    try:
+        future = submitAlone(coordinator, CrashNode)
+        with pytest.raises(WorkerError, match="died 2 times"):
+            future.result(timeout=60)
+    finally:
+        coordinator.stop()
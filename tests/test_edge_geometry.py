@@ -0,0 +1,32 @@
+from node_edge import EDGE_TYPE_BEZIER
+from node_graphics_edge import QDMGraphicsEdgeBezier
+from conftest import makeNode, connect
+
+
+def test_path_is_only_computed_again_after_a_change(gui_scene, monkeypatch):
+    a, b = makeNode(gui_scene, "A"), makeNode(gui_scene, "B", pos=(300, 100))
+    edge = connect(gui_scene, a, b)
+    edge.edge_type = EDGE_TYPE_BEZIER
+    gui_scene.grScene.updateDirtyEdges()
+    grEdge = edge.grEdge
+
+    calls = []
+    original = QDMGraphicsEdgeBezier.calcPath
+    monkeypatch.setattr(QDMGraphicsEdgeBezier, 'calcPath', lambda self: calls.append(self) or original(self))
+
+    path = grEdge.getPath()
+    for i in range(5):
+        grEdge.boundingRect()
+        grEdge.shape()
+    assert len(calls) <= 1
+
+    calls.clear()
+    grEdge.setSource(*grEdge.posSource)     # Same point, nothing changes
+    assert grEdge.getPath() is grEdge.getPath()
+    assert calls == []
+
+    grEdge.setDestination(500, 500)
+    new_path = grEdge.getPath()
+    assert len(calls) == 1
+    assert new_path is not path
+    assert grEdge.boundingRect().bottom() >= 500 - 1
@@ -0,0 +1,55 @@
+from PySide6.QtCore import QRectF
+from node_scene_edge_index import SceneEdgeIndex
+from conftest import makeNode, connect
+
+
+class FakeEdge():
+    pass
+
+
+def test_finds_only_overlapping_boxes(scene):
+    index = SceneEdgeIndex(scene, cell_size=100)
+    near, far, long = FakeEdge(), FakeEdge(), FakeEdge()
+    index.updateEdge(near, QRectF(10, 10, 20, 20))
+    index.updateEdge(far, QRectF(1000, 1000, 20, 20))
+    index.updateEdge(long, QRectF(-500, 50, 1000, 5))
+
+    assert set(index.edgesInRect(0, 0, 50, 60)) == {near, long}
+    assert set(index.edgesInRect(990, 990, 1010, 1010)) == {far}
+    assert index.edgesInRect(300, 300, 400, 400) == []
+    # Reversed corners, as a cutline segment drawn right to left gives
+    assert set(index.edgesInRect(50, 60, 0, 0)) == {near, long}
+
+
+def test_moved_edge_leaves_its_old_cells(scene):
+    index = SceneEdgeIndex(scene, cell_size=100)
+    edge = FakeEdge()
+    index.updateEdge(edge, QRectF(10, 10, 20, 20))
+    index.updateEdge(edge, QRectF(510, 510, 20, 20))
+
+    assert index.edgesInRect(0, 0, 50, 50) == []
+    assert index.edgesInRect(500, 500, 550, 550) == [edge]
+    assert all(edge not in index.cells[cell] for cell in index.cells if cell[0] < 5)
+
+    index.removeEdge(edge)
+    assert index.cells == {}
+    assert index.edgesInRect(500, 500, 550, 550) == []
+
+
+def test_scene_edges_follow_their_nodes(gui_scene):
+    a = makeNode(gui_scene, "A", pos=(0, 0))
+    b = makeNode(gui_scene, "B", pos=(400, 0))
+    edge = connect(gui_scene, a, b)
+    gui_scene.grScene.updateDirtyEdges()
+    assert edge in gui_scene.edge_index.edgesInRect(150, -100, 350, 200)
+
+    a.setPos(0, 3000)
+    b.setPos(400, 3000)
+    a.updateConnectedEdges()
+    b.updateConnectedEdges()
+    gui_scene.grScene.updateDirtyEdges()
+    assert edge not in gui_scene.edge_index.edgesInRect(150, -100, 350, 200)
+    assert edge in gui_scene.edge_index.edgesInRect(150, 2900, 350, 3200)
+
+    edge.remove()
+    assert gui_scene.edge_index.edgesInRect(-10000, -10000, 10000, 10000) == []
@@ -0,0 +1,48 @@
+from node_edge import Edge
+from conftest import makeNode, connect
+
+
+def countUpdates(monkeypatch):
+    counts = {}
+    original = Edge.updatePositions
+    def updatePositions(edge):
+        counts[edge] = counts.get(edge, 0) + 1
+        original(edge)
+    monkeypatch.setattr(Edge, 'updatePositions', updatePositions)
+    return counts
+
+
+def test_moves_are_coalesced_into_one_update(gui_scene, monkeypatch):
+    a, b = makeNode(gui_scene, "A"), makeNode(gui_scene, "B", pos=(300, 0))
+    edge = connect(gui_scene, a, b)
+    gui_scene.grScene.updateDirtyEdges()
+    counts = countUpdates(monkeypatch)
+
+    for x in range(0, 200, 10):
+        a.setPos(x, x)
+        b.setPos(300 + x, x)
+    assert counts == {}
+
+    gui_scene.grScene.updateDirtyEdges()
+    assert counts == {edge: 1}
+    assert edge.grEdge.posSource[1] > 100
+
+
+def test_bulk_load_positions_edges_once_at_the_end(gui_scene, monkeypatch):
+    counts = countUpdates(monkeypatch)
+    gui_scene.beginBulkLoad()
+    nodes = [makeNode(gui_scene, "N%d" % i, pos=(i * 250, 0)) for i in range(5)]
+    edges = [connect(gui_scene, a, b) for a, b in zip(nodes, nodes[1:])]
+    assert counts == {}
+    gui_scene.endBulkLoad()
+    assert counts == {edge: 1 for edge in edges}
+
+
+def test_removed_edge_is_not_updated(gui_scene, monkeypatch):
+    a, b = makeNode(gui_scene, "A"), makeNode(gui_scene, "B", pos=(300, 0))
+    edge = connect(gui_scene, a, b)
+    a.setPos(50, 50)
+    edge.remove()
+    counts = countUpdates(monkeypatch)
+    gui_scene.grScene.updateDirtyEdges()
+    assert counts == {}
@@ -0,0 +1,112 @@
+import pytest
+from node_node import Node
+from node_edge import Edge
+from conftest import makeNode, connect
+
+
+class ValueNode(Node):
+    eval_cacheable = False
+
+    def evalImplementation(self, input_values):
+        self.scene.evaluated.append(self.title)
+        return [self.content_data.get('value', 0)]
+
+
+class AddNode(Node):
+    eval_cacheable = False
+
+    def evalImplementation(self, input_values):
+        self.scene.evaluated.append(self.title)
+        return [sum(value or 0 for value in input_values)]
+
+
+@pytest.fixture
+def graph(scene):
+    """ a -> add <- b """
+    scene.evaluated = []
+    a = makeNode(scene, "a", inputs=(), node_type=ValueNode)
+    b = makeNode(scene, "b", inputs=(), node_type=ValueNode)
+    add = makeNode(scene, "add", inputs=(1, 1), node_type=AddNode)
+    a.content_data['value'], b.content_data['value'] = 2, 3
+    return scene, a, b, add
+
+
+def test_evaluates_dependencies_first(graph):
+    scene, a, b, add = graph
+    connect(scene, a, add, input=0)
+    connect(scene, b, add, input=1)
+
+    assert scene.evaluator.getOutputValue(add.outputs[0]) == 5
+    assert scene.evaluated[-1] == "add" and sorted(scene.evaluated[:2]) == ["a", "b"]
+
+
+def test_clean_nodes_are_not_evaluated_again(graph):
+    scene, a, b, add = graph
+    connect(scene, a, add, input=0)
+    connect(scene, b, add, input=1)
+    scene.evaluator.evaluate([add])
+    scene.evaluated = []
+
+    a.content_data['value'] = 10
+    a.markDirty()
+    assert scene.evaluator.getOutputValue(add.outputs[0]) == 13
+    assert scene.evaluated == ["a", "add"]
+
+
+def test_edges_from_an_input_to_an_output(graph):
+    """ Edges dragged from an input socket to an output socket start at the input """
+    scene, a, b, add = graph
+    Edge(scene, add.inputs[0], a.outputs[0])
+    Edge(scene, add.inputs[1], b.outputs[0])
+
+    assert list(add.getInputNodes()) == [a, b]
+    assert list(a.getOutputNodes()) == [add]
+    assert scene.evaluator.getOutputValue(add.outputs[0]) == 5
+
+    # Changing a makes the node after it dirty, whichever way the edge was drawn
+    a.markDirty()
+    assert add.isDirty()
+
+
+def test_connecting_a_reversed_edge_marks_the_input_dirty(graph):
+    scene, a, b, add = graph
+    scene.evaluator.evaluate([add])
+    assert not add.isDirty()
+
+    edge = Edge(scene, add.inputs[0], a.outputs[0])
+    assert add.isDirty()
+    scene.evaluator.evaluate([add])
+
+    edge.remove()
+    assert add.isDirty()
+
+
+def test_dragged_edge_does_not_mark_dirty(graph):
+    """ The temporary edge of a drag only has a start socket """
+    scene, a, b, add = graph
+    scene.evaluator.evaluate([add])
+
+    drag_edge = Edge(scene, add.inputs[0], None)
+    assert not add.isDirty()
+    assert list(add.getInputNodes()) == []
+    drag_edge.remove()
+    assert not add.isDirty()
+
+
+def test_edges_between_two_inputs_connect_nothing(graph):
+    scene, a, b, add = graph
+    other = makeNode(scene, "other", node_type=AddNode)
+    Edge(scene, other.inputs[0], add.inputs[0])
+
+    assert list(add.getInputNodes()) == []
+    assert list(other.getInputNodes()) == []
+
+
+def test_cycles_are_refused(graph):
+    scene, a, b, add = graph
+    other = makeNode(scene, "other", node_type=AddNode)
+    connect(scene, add, other)
+    connect(scene, other, add)
+
+    with pytest.raises(ValueError):
+        scene.evaluator.evaluate([add])
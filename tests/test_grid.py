@@ -0,0 +1,36 @@
+from PySide6.QtCore import QRectF
+from PySide6.QtGui import QImage, QPainter, QColor
+
+
+def test_one_brush_per_zoom_level(gui_scene):
+    grScene = gui_scene.grScene
+    brush = grScene.getGridBrush(1.0)
+    assert brush is not None
+    assert grScene.getGridBrush(1.0) is brush
+    assert grScene.getGridBrush(1.00001) is brush       # Same zoom, once rounded
+    assert grScene.getGridBrush(2.0) is not brush
+    assert brush.texture().width() == grScene.gridSize * grScene.gridSquares
+
+
+def test_grid_is_hidden_when_lines_are_too_close(gui_scene):
+    grScene = gui_scene.grScene
+    far = grScene.gridMinSpacing / (grScene.gridSize * grScene.gridSquares) / 2
+    assert grScene.getGridBrush(far) is None
+
+
+def test_background_draws_the_grid_lines(gui_scene):
+    grScene = gui_scene.grScene
+    tile = grScene.gridSize * grScene.gridSquares
+    image = QImage(tile * 2, tile * 2, QImage.Format_ARGB32)
+    image.fill(0)
+    painter = QPainter(image)
+    grScene.render(painter, QRectF(image.rect()), QRectF(0, 0, tile * 2, tile * 2))
+    painter.end()
+
+    background = QColor("#393939").rgb()
+    dark_line = image.pixelColor(tile, tile // 2 + 3).rgb()
+    light_line = image.pixelColor(grScene.gridSize, grScene.gridSize // 2).rgb()
+    inside = image.pixelColor(grScene.gridSize // 2, grScene.gridSize // 2).rgb()
+    assert inside == background
+    assert dark_line != background
+    assert light_line not in (background, dark_line)
@@ -0,0 +1,97 @@
+import os
+import json
+import subprocess
+import sys
+from node_scene_binary import convertSceneFile
+from conftest import makeNode, connect
+
+
+def test_headless_scene_needs_no_qapplication(tmp_path):
+    """ Loads, edits and saves a scene in a fresh process, which never creates a QApplication """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    filename = str(tmp_path / "scene.json")
+    code = (
+        "from PySide6.QtCore import QCoreApplication\n"
+        "from node_scene import Scene\n"
+        "from node_node import Node\n"
+        "from node_edge import Edge\n"
+        "scene = Scene(headless=True)\n"
+        "a = Node(scene, 'A', inputs=[1], outputs=[1])\n"
+        "b = Node(scene, 'B', inputs=[1], outputs=[1])\n"
+        "Edge(scene, a.outputs[0], b.inputs[0])\n"
+        "scene.saveToFile(%r)\n"
+        "loaded = Scene(headless=True)\n"
+        "loaded.loadFromFile(%r)\n"
+        "assert sorted(n.title for n in loaded.nodes) == ['A', 'B'] and len(loaded.edges) == 1\n"
+        "assert QCoreApplication.instance() is None\n"
+        "loaded.scheduler.shutdown(); scene.scheduler.shutdown()\n"
+    ) % (filename, filename)
+    env = dict(os.environ)
+    env.pop("QT_QPA_PLATFORM", None)
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+
+def test_headless_scene_has_no_graphics(scene):
+    a = makeNode(scene, "A", pos=(10, 20))
+    edge = connect(scene, a, makeNode(scene, "B"))
+
+    assert scene.isHeadless() and scene.saver is None
+    assert a.grNode is None and edge.grEdge is None
+    assert all(socket.grSocket is None for socket in a.inputs + a.outputs)
+    assert (a.pos.x(), a.pos.y()) == (10, 20)
+
+
+def test_headless_edits_can_be_undone(scene):
+    a = makeNode(scene, "A")
+    scene.history.storeHistory("Add A")
+    a.setPos(50, 60)
+    a.title = "Renamed"
+    scene.history.storeHistory("Edit A")
+
+    scene.history.undo()
+    assert (a.pos.x(), a.pos.y(), a.title) == (0, 0, "A")
+    scene.history.undo()
+    assert scene.nodes == []
+    scene.history.redo()
+    scene.history.redo()
+    node = scene.nodes[0]
+    assert (node.pos.x(), node.pos.y(), node.title) == (50, 60, "Renamed")
+
+
+def test_init_ui_later_builds_the_graphics(qapp, scene):
+    a = makeNode(scene, "A", pos=(100, 50))
+    b = makeNode(scene, "B", pos=(400, 50))
+    edge = connect(scene, a, b)
+
+    scene.initUI()
+
+    assert not scene.isHeadless() and scene.saver is not None
+    assert a.grNode.scene() is scene.grScene and b.grNode.scene() is scene.grScene
+    assert (a.grNode.pos().x(), a.grNode.pos().y()) == (100, 50)
+    assert edge.grEdge.scene() is scene.grScene
+    assert scene.grScene.bulk_loading == 0
+    # The edge was positioned at the end of the bulk load
+    start = a.outputs[0].getSocketPosition()
+    assert (edge.grEdge.posSource[0], edge.grEdge.posSource[1]) == (100 + start[0], 50 + start[1])
+
+
+def test_headless_serialization_matches_gui(qapp, scene):
+    a = makeNode(scene, "A", pos=(100, 50))
+    connect(scene, a, makeNode(scene, "B", pos=(400, 50)))
+    data = scene.serialize()
+
+    scene.initUI()
+    assert json.dumps(scene.serialize()) == json.dumps(data)
+
+
+def test_headless_file_round_trips_through_binary(scene, tmp_path):
+    a = makeNode(scene, "A", pos=(10, 20))
+    connect(scene, a, makeNode(scene, "B", pos=(300, 20)))
+    json_file, binary_file, back_file = (str(tmp_path / name) for name in ("scene.json", "scene.qdmg", "back.json"))
+    scene.saveToFile(json_file)
+
+    convertSceneFile(json_file, binary_file)
+    convertSceneFile(binary_file, back_file)
+    with open(json_file) as file, open(back_file) as back:
+        assert back.read() == file.read()
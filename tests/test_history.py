@@ -0,0 +1,105 @@
+from conftest import makeNode, connect
+
+
+def test_step_only_stores_what_changed(scene):
+    for i in range(20):
+        makeNode(scene, "Node %d" % i)
+    scene.history.storeHistory("Add nodes")
+
+    makeNode(scene, "One more")
+    scene.history.storeHistory("Add one node")
+
+    operations = scene.history.history_stack[-1]['operations']
+    assert [op[0] for op in operations] == ['add_node']
+    assert operations[0][1]['title'] == "One more"
+
+
+def test_empty_step_is_not_stored(scene):
+    makeNode(scene)
+    scene.history.storeHistory("Add node")
+    scene.history.storeHistory("Nothing")
+    assert len(scene.history.history_stack) == 1
+
+
+def test_undo_redo_add_node_keeps_id(scene):
+    scene.history.storeHistory("Start")
+    node = makeNode(scene, "A", pos=(10, 20))
+    node_id = node.id
+    scene.history.storeHistory("Add node")
+
+    scene.history.undo()
+    assert scene.getNodeById(node_id) is None
+    assert scene.nodes == []
+
+    scene.history.redo()
+    restored = scene.getNodeById(node_id)
+    assert restored is not None
+    assert restored.title == "A"
+    assert (restored.pos.x(), restored.pos.y()) == (10, 20)
+
+
+def test_undo_redo_move_and_title(scene):
+    node = makeNode(scene, "A", pos=(0, 0))
+    scene.history.storeHistory("Add node")
+
+    node.setPos(50, 60)
+    node.setPos(70, 80)
+    node.title = "B"
+    scene.history.storeHistory("Edit node")
+    assert [op[0] for op in scene.history.history_stack[-1]['operations']] == ['move', 'title']
+
+    scene.history.undo()
+    assert (node.pos.x(), node.pos.y()) == (0, 0)
+    assert node.title == "A"
+
+    scene.history.redo()
+    assert (node.pos.x(), node.pos.y()) == (70, 80)
+    assert node.title == "B"
+
+
+def test_undo_remove_node_restores_its_edges(scene):
+    a, b, c = makeNode(scene, "A"), makeNode(scene, "B"), makeNode(scene, "C")
+    connect(scene, a, b)
+    connect(scene, a, c)
+    scene.history.storeHistory("Build")
+
+    a.remove()
+    assert scene.edges == []
+    scene.history.storeHistory("Remove A")
+
+    scene.history.undo()
+    a = scene.getNodeById(a.id)
+    assert len(scene.edges) == 2
+    assert sorted(edge.end_socket.node.title for edge in a.outputs[0].edges) == ["B", "C"]
+
+    scene.history.redo()
+    assert scene.edges == []
+    assert sorted(node.title for node in scene.nodes) == ["B", "C"]
+
+
+def test_remove_node_removes_every_edge_of_a_socket(scene):
+    source = makeNode(scene, "Source")
+    targets = [makeNode(scene, "Target %d" % i) for i in range(5)]
+    for target in targets:
+        connect(scene, source, target)
+
+    source.remove()
+    assert scene.edges == []
+    assert all(target.inputs[0].edges == [] for target in targets)
+
+
+def test_added_then_removed_cancels_out(scene):
+    scene.history.storeHistory("Start")
+    node = makeNode(scene)
+    node.remove()
+    scene.history.storeHistory("Nothing in the end")
+    assert len(scene.history.history_stack) == 0
+
+
+def test_unstored_changes_are_undone_first(scene):
+    node = makeNode(scene, "A")
+    scene.history.storeHistory("Add node")
+    node.title = "B"
+
+    scene.history.undo()
+    assert node.title == "A"
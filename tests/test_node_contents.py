@@ -0,0 +1,53 @@
+import pytest
+from node_graphics_view import QDMGraphicsView
+from conftest import makeNode
+
+
+@pytest.fixture
+def view(gui_scene):
+    view = QDMGraphicsView(gui_scene.grScene)
+    view.resize(800, 600)
+    view.show()
+    yield view
+    view.close()
+    view.deleteLater()
+
+
+def test_only_nodes_in_view_get_a_content_widget(gui_scene, view):
+    near = makeNode(gui_scene, "Near", pos=(0, 0))
+    far = makeNode(gui_scene, "Far", pos=(7000, 7000))
+    view.centerOn(90, 120)
+    gui_scene.grScene.updateNodeContents()
+
+    assert near.content is not None
+    assert far.content is None
+    assert far.grNode.grContent is None
+
+
+def test_released_widgets_are_reused_and_keep_node_state(gui_scene, view):
+    a = makeNode(gui_scene, "A", pos=(0, 0))
+    b = makeNode(gui_scene, "B", pos=(7000, 7000))
+    b.content_data = {'text': "state of B"}
+
+    view.centerOn(90, 120)
+    gui_scene.grScene.updateNodeContents()
+    a.content.wdg_text.setPlainText("edited A")
+    widget = a.grNode.grContent
+
+    view.centerOn(7090, 7120)
+    gui_scene.grScene.updateNodeContents()
+
+    assert a.content is None
+    assert a.content_data['text'] == "edited A"
+    assert b.grNode.grContent is widget                 # Reused from the pool
+    assert b.content.wdg_text.toPlainText() == "state of B"
+
+    view.centerOn(90, 120)
+    gui_scene.grScene.updateNodeContents()
+    assert a.content.wdg_text.toPlainText() == "edited A"
+
+
+def test_serialize_uses_the_stored_state(gui_scene, view):
+    node = makeNode(gui_scene, "A", pos=(7000, 7000))
+    node.content_data = {'text': "hidden"}
+    assert node.serialize()['content'] == {'text': "hidden"}
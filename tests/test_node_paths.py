@@ -0,0 +1,35 @@
+from PySide6.QtGui import QImage, QPainter
+from node_graphics_node import QDMGraphicsNode
+from conftest import makeNode
+
+
+def test_nodes_of_the_same_size_share_their_paths(gui_scene):
+    a, b = makeNode(gui_scene, "A"), makeNode(gui_scene, "B", pos=(300, 0))
+    paths = a.grNode.getChromePaths()
+    assert b.grNode.getChromePaths() is paths
+    assert len(paths) == 3
+
+    title, content, outline = paths
+    assert title.boundingRect().height() == a.grNode.title_height
+    assert outline.boundingRect().width() == a.grNode.width
+    assert outline.boundingRect().height() == a.grNode.height
+
+
+def test_other_sizes_get_their_own_paths(gui_scene):
+    node = makeNode(gui_scene, "A")
+    paths = node.grNode.getChromePaths()
+    node.grNode.height = 120
+    other = node.grNode.getChromePaths()
+    assert other is not paths
+    assert other[2].boundingRect().height() == 120
+    assert (node.grNode.width, 120, node.grNode.title_height, node.grNode.edge_size) in QDMGraphicsNode._chrome_paths_cache
+
+
+def test_node_is_painted_with_the_cached_paths(gui_scene):
+    node = makeNode(gui_scene, "A")
+    image = QImage(200, 260, QImage.Format_ARGB32)
+    image.fill(0)
+    painter = QPainter(image)
+    gui_scene.grScene.render(painter, image.rect(), node.grNode.sceneBoundingRect().toRect())
+    painter.end()
+    assert image.pixelColor(90, 10).rgb() == node.grNode._brush_title.color().rgb()
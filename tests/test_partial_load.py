@@ -0,0 +1,149 @@
+import threading
+import pytest
+from PySide6.QtCore import QRectF
+from node_scene import Scene
+from node_scene_binary import SceneChunkedFile
+from node_graphics_node import QDMGraphicsNode
+from conftest import makeNode, connect
+
+
+CHUNK_SIZE = 1000
+
+
+@pytest.fixture
+def chunked_file(scene, tmp_path):
+    """ A chunked file with a row of 10 chunks, two connected nodes in each one, and edges between the chunks """
+    previous = None
+    for i in range(10):
+        a = makeNode(scene, "A%d" % i, pos=(i * CHUNK_SIZE + 100, 100))
+        b = makeNode(scene, "B%d" % i, pos=(i * CHUNK_SIZE + 500, 100))
+        connect(scene, a, b)
+        if previous is not None: connect(scene, previous, a)
+        previous = b
+    filename = str(tmp_path / "scene.scb")
+    scene.saveToFile(filename, binary=True, chunk_size=CHUNK_SIZE)
+    return filename, scene.serialize()
+
+
+def titles(scene):
+    return sorted(node.title for node in scene.iterNodes())
+
+
+def test_only_the_chunks_in_rect_are_loaded(gui_scene, chunked_file):
+    filename, data = chunked_file
+    gui_scene.loadFromFile(filename)
+    loader = gui_scene.partial_loader
+    assert loader is not None and gui_scene.nodes == []
+
+    # No node is at a position in the rect, but B2 (at x = 2500) covers it
+    assert not loader.loadRect(QRectF(2500 + QDMGraphicsNode.width / 2, 200, 10, 10))
+    assert titles(gui_scene) == ["A2", "B2"]
+    assert len(gui_scene.edges) == 1
+
+    loader.loadRect(QRectF(3100, 0, 500, 500))
+    assert titles(gui_scene) == ["A2", "A3", "B2", "B3"]
+    assert len(gui_scene.edges) == 3
+
+
+def test_margin_is_the_node_size(gui_scene, chunked_file):
+    gui_scene.loadFromFile(chunked_file[0])
+    loader = gui_scene.partial_loader
+    left, top, right, bottom = loader.chunkArea(0)
+    assert (right, bottom) == (500 + QDMGraphicsNode.width, 100 + QDMGraphicsNode.height)
+
+
+def test_rect_only_checks_nearby_chunks(gui_scene, chunked_file, monkeypatch):
+    gui_scene.loadFromFile(chunked_file[0])
+    loader = gui_scene.partial_loader
+    checked = []
+    area = loader.chunkArea
+    monkeypatch.setattr(loader, 'chunkArea', lambda i: (checked.append(i), area(i))[1])
+
+    assert loader.unloadedChunksInRect(5100, 0, 5200, 100) == [5]
+    assert set(checked) <= {4, 5}
+
+    bounds = list(loader.unloadedChunksBounds(QRectF(5100, 0, 100, 100)))
+    assert bounds == [area(5)]
+
+
+def test_loaded_chunks_leave_the_index(gui_scene, chunked_file):
+    gui_scene.loadFromFile(chunked_file[0])
+    loader = gui_scene.partial_loader
+    loader.loadChunk(5)
+    assert loader.unloadedChunksInRect(5100, 0, 5200, 100) == []
+    assert all(5 not in chunks for chunks in loader.cells.values())
+
+
+def test_deserialize_closes_the_partial_load(gui_scene, chunked_file):
+    filename, data = chunked_file
+    gui_scene.loadFromFile(filename)
+    loader = gui_scene.partial_loader
+    loader.loadChunk(0)
+
+    # Same scene, so it's patched by id rather than rebuilt
+    gui_scene.loadFromFile(filename, partial=False)
+    assert gui_scene.partial_loader is None
+    assert loader.file.closed
+    assert len(gui_scene.nodes) == 20
+    serialized = gui_scene.serialize()
+    assert len(serialized['nodes']) == 20
+    assert len(serialized['edges']) == len(data['edges'])
+
+
+def test_clear_closes_the_partial_load(gui_scene, chunked_file):
+    gui_scene.loadFromFile(chunked_file[0])
+    loader = gui_scene.partial_loader
+    gui_scene.clear()
+    assert gui_scene.partial_loader is None and loader.file.closed
+    assert gui_scene.serialize()['nodes'] == []
+
+
+def test_save_reads_the_unloaded_chunks_on_the_worker_thread(gui_scene, chunked_file, monkeypatch, qapp):
+    filename, data = chunked_file
+    gui_scene.loadFromFile(filename)
+    gui_scene.partial_loader.loadChunk(0)
+
+    threads = []
+    read_chunk = SceneChunkedFile.readChunk
+    monkeypatch.setattr(SceneChunkedFile, 'readChunk', lambda self, i: (threads.append(threading.current_thread()), read_chunk(self, i))[1])
+    gui_scene.saver.save(filename).result()
+    qapp.processEvents()
+    assert len(threads) == 9
+    assert threading.main_thread() not in threads
+
+    loaded = Scene(headless=True)
+    loaded.loadFromFile(filename)
+    assert titles(loaded) == sorted(node['title'] for node in data['nodes'])
+    assert len(loaded.edges) == len(data['edges'])
+
+
+def test_saves_over_its_own_file_keep_reading_the_file_it_was_loaded_from(gui_scene, chunked_file, qapp):
+    filename, data = chunked_file
+    gui_scene.loadFromFile(filename)
+    gui_scene.partial_loader.loadChunk(0)
+    gui_scene.saver.save(filename).result()
+
+    # The save replaced the file with one whose chunks are laid out differently
+    gui_scene.partial_loader.loadChunk(5)
+    gui_scene.saver.save(filename).result()
+    qapp.processEvents()
+
+    loaded = Scene(headless=True)
+    loaded.loadFromFile(filename)
+    assert titles(loaded) == sorted(node['title'] for node in data['nodes'])
+    assert len(loaded.edges) == len(data['edges'])
+
+
+def test_snapshot_is_not_changed_by_later_loads(gui_scene, chunked_file):
+    gui_scene.loadFromFile(chunked_file[0])
+    loader = gui_scene.partial_loader
+    snapshot = loader.snapshot()
+    loader.loadChunk(3)
+    gui_scene.nodes[0].remove()
+
+    try:
+        assert len(list(snapshot.iterNodes())) == 20
+        assert len(list(snapshot.iterEdges())) == 19
+    finally:
+        snapshot.close()
+    assert not loader.file.closed
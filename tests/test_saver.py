@@ -0,0 +1,123 @@
+import os
+import stat
+import pytest
+from PySide6.QtWidgets import QMessageBox, QFileDialog
+from node_scene_saver import writeSceneFile
+from conftest import makeNode
+
+
+def mode(filename):
+    return stat.S_IMODE(os.stat(filename).st_mode)
+
+
+def test_new_file_gets_the_usual_permissions(scene, tmp_path):
+    filename = str(tmp_path / "scene.json")
+    writeSceneFile(filename, scene.serialize())
+    usual = tmp_path / "usual.json"
+    usual.write_text("")
+    assert mode(filename) == mode(usual)
+
+
+def test_new_file_follows_the_current_umask(scene, tmp_path):
+    filename = str(tmp_path / "scene.json")
+    umask = os.umask(0o077)
+    try:
+        writeSceneFile(filename, scene.serialize())
+    finally:
+        os.umask(umask)
+    assert mode(filename) == 0o600
+
+
+def test_existing_file_keeps_its_permissions(scene, tmp_path):
+    filename = str(tmp_path / "scene.json")
+    writeSceneFile(filename, scene.serialize())
+    os.chmod(filename, 0o640)
+    writeSceneFile(filename, scene.serialize())
+    assert mode(filename) == 0o640
+
+
+def test_failed_write_leaves_the_file_as_it_was(scene, tmp_path):
+    filename = str(tmp_path / "scene.json")
+    makeNode(scene, "A")
+    writeSceneFile(filename, scene.serialize())
+    with open(filename) as file:
+        before = file.read()
+
+    def failingNodes():
+        yield from scene.serialize()['nodes']
+        raise RuntimeError("disk full")
+
+    with pytest.raises(RuntimeError):
+        writeSceneFile(filename, dict(scene.serialize(), nodes=failingNodes()))
+    with open(filename) as file:
+        assert file.read() == before
+    assert os.listdir(str(tmp_path)) == ["scene.json"]
+
+
+def test_background_save(gui_scene, qapp, tmp_path):
+    makeNode(gui_scene, "A")
+    filename = str(tmp_path / "scene.json")
+    future = gui_scene.saver.save(filename)
+    future.result()
+    qapp.processEvents()
+    assert not gui_scene.saver.isSaving()
+    assert os.path.isfile(filename)
+
+
+def test_snapshot_keeps_the_content_as_it_was(scene):
+    node = makeNode(scene, "A")
+    node.content_data['items'] = [1, 2]
+    data = scene.serialize()
+    node.content_data['items'].append(3)
+    node.content_data['other'] = True
+
+    assert data['nodes'][0]['content'] == {'items': [1, 2]}
+
+
+def test_untitled_autosaves_are_per_process(gui_scene):
+    assert str(os.getpid()) in os.path.basename(gui_scene.saver.autosaveFilename())
+    gui_scene.saver.filename = "/somewhere/graph.json"
+    assert gui_scene.saver.autosaveFilename() == "/somewhere/graph.autosave.json"
+
+
+@pytest.fixture
+def window(qapp, monkeypatch):
+    from node_editor_window import NodeEditorWindow
+    window = NodeEditorWindow()
+    monkeypatch.setattr(window, 'isModified', lambda: True)
+    monkeypatch.setattr(QMessageBox, 'warning', lambda *args: QMessageBox.Save)
+    yield window
+    monkeypatch.setattr(window, 'isModified', lambda: False)
+    window.close()
+    window.deleteLater()
+
+
+def test_window_stays_open_when_saving_on_close_fails(window, monkeypatch, tmp_path):
+    errors = []
+    monkeypatch.setattr(QMessageBox, 'critical', lambda *args: errors.append(args))
+    window.filename = str(tmp_path / "missing folder" / "scene.json")
+
+    window.close()
+    assert window.isVisible()
+    assert len(errors) == 1
+
+
+def test_window_closes_once_saved(window, tmp_path):
+    window.filename = str(tmp_path / "scene.json")
+    window.close()
+    assert not window.isVisible()
+    assert os.path.isfile(window.filename)
+
+
+def test_window_reports_a_file_that_cannot_be_opened(window, monkeypatch, tmp_path):
+    errors = []
+    monkeypatch.setattr(QMessageBox, 'critical', lambda *args: errors.append(args))
+    broken = tmp_path / "broken.json"
+    broken.write_text('{"id": 1, "nodes": [{"id": 1')
+    monkeypatch.setattr(QFileDialog, 'getOpenFileName', lambda *args: (str(broken), ''))
+    window.filename = str(tmp_path / "scene.json")
+
+    window.onFileOpen()
+    assert len(errors) == 1
+    assert window.filename is None
+    assert window.centralWidget().scene.saver.filename is None
@@ -0,0 +1,89 @@
+import io
+import json
+import pytest
+from node_scene import Scene
+from node_scene_binary import (writeSceneBinary, readSceneBinary, SceneChunkedFile, convertSceneFile,
+                               isSceneBinaryFile, isSceneChunkedFile)
+from conftest import makeNode, connect
+
+
+def buildScene(scene, n=12):
+    nodes = [makeNode(scene, "Node %d" % i, inputs=(1, 2), outputs=(3,), pos=(i * 300.0, (i % 3) * 250.5)) for i in range(n)]
+    for i, node in enumerate(nodes):
+        node.content_data = {'text': "content %d ✓" % (i % 4)}
+    for a, b in zip(nodes, nodes[1:]):
+        connect(scene, a, b, input=1)
+    return nodes
+
+
+def plain(data):
+    """ The data with its generators read, as plain JSON values """
+    return json.loads(json.dumps(dict(data, nodes=list(data['nodes']), edges=list(data['edges']))))
+
+
+@pytest.mark.parametrize("chunk_size", [None, 500.0])
+def test_binary_round_trip_keeps_everything(scene, chunk_size):
+    buildScene(scene)
+    file = io.BytesIO()
+    writeSceneBinary(file, scene.serialize(lazy=True), chunk_size)
+    file.seek(0)
+    assert plain(readSceneBinary(file)) == plain(scene.serialize())
+
+
+def test_empty_scene(scene):
+    file = io.BytesIO()
+    writeSceneBinary(file, scene.serialize())
+    file.seek(0)
+    assert plain(readSceneBinary(file)) == plain(scene.serialize())
+
+
+def test_chunks_hold_the_nodes_in_their_area(scene):
+    nodes = buildScene(scene)
+    file = io.BytesIO()
+    writeSceneBinary(file, scene.serialize(), chunk_size=1000.0)
+    file.seek(0)
+    chunked = SceneChunkedFile(file)
+
+    assert chunked.n_chunks > 1
+    seen = []
+    for i in range(chunked.n_chunks):
+        left, top, right, bottom = chunked.chunkBounds(i)
+        for node_data in chunked.readChunk(i):
+            assert left <= node_data['pos_x'] <= right and top <= node_data['pos_y'] <= bottom
+            assert chunked.chunkOfId(node_data['id']) == i
+            seen.append(node_data['id'])
+    assert sorted(seen) == sorted(node.id for node in nodes)
+    assert chunked.chunkOfId(12345) is None
+
+
+def test_files_convert_both_ways_without_losing_anything(scene, tmp_path):
+    buildScene(scene)
+    json_file, binary_file, chunked_file, back = (str(tmp_path / name) for name in ("a.json", "a.qdmg", "c.qdmg", "b.json"))
+    scene.saveToFile(json_file)
+
+    convertSceneFile(json_file, binary_file)
+    convertSceneFile(json_file, chunked_file, chunk_size=800.0)
+    convertSceneFile(chunked_file, back)
+
+    assert isSceneBinaryFile(binary_file) and not isSceneChunkedFile(binary_file)
+    assert isSceneChunkedFile(chunked_file)
+    assert not isSceneBinaryFile(back)
+
+    def load(filename):
+        loaded = Scene(headless=True)
+        loaded.loadFromFile(filename)
+        return plain(loaded.serialize())
+
+    expected = plain(scene.serialize())
+    expected_nodes = sorted(expected['nodes'], key=lambda node: node['id'])
+    for filename in (binary_file, chunked_file, back):
+        data = load(filename)
+        assert sorted(data['nodes'], key=lambda node: node['id']) == expected_nodes
+        assert sorted(data['edges'], key=lambda edge: edge['id']) == sorted(expected['edges'], key=lambda edge: edge['id'])
+
+
+def test_binary_is_smaller_than_json(scene, tmp_path):
+    buildScene(scene, 200)
+    scene.saveToFile(str(tmp_path / "a.json"), compact=True)
+    scene.saveToFile(str(tmp_path / "a.qdmg"))
+    assert (tmp_path / "a.qdmg").stat().st_size < (tmp_path / "a.json").stat().st_size / 2
@@ -0,0 +1,56 @@
+from node_node import Node
+from node_edge import Edge
+from conftest import makeNode, connect
+
+
+def test_objects_are_found_by_id(scene):
+    a, b = makeNode(scene, "A"), makeNode(scene, "B")
+    edge = connect(scene, a, b)
+
+    assert scene.getNodeById(a.id) is a
+    assert scene.getSocketById(b.inputs[0].id) is b.inputs[0]
+    assert scene.getEdgeById(edge.id) is edge
+
+    b.remove()
+    assert scene.getNodeById(b.id) is None
+    assert scene.getSocketById(b.inputs[0].id) is None
+    assert scene.getEdgeById(edge.id) is None
+
+
+def test_restored_id_never_replaces_a_live_object(scene):
+    a = makeNode(scene, "A")
+    data = makeNode(scene, "B").serialize()
+    data['id'] = a.id
+    data['outputs'][0]['id'] = a.outputs[0].id
+
+    restored = Node(scene)
+    restored.deserialize(data, restore_id=True)
+
+    assert restored.id != a.id
+    assert restored.outputs[0].id != a.outputs[0].id
+    assert scene.getNodeById(a.id) is a
+    assert scene.getNodeById(restored.id) is restored
+    assert scene.getSocketById(a.outputs[0].id) is a.outputs[0]
+
+
+def test_new_edge_with_a_taken_id_gets_a_new_one(scene):
+    a, b = makeNode(scene, "A"), makeNode(scene, "B")
+    first = connect(scene, a, b)
+    second = Edge(scene)
+    second.id = first.id
+    scene.addEdge(second)
+
+    assert second.id != first.id
+    assert scene.getEdgeById(first.id) is first
+    assert scene.getEdgeById(second.id) is second
+
+
+def test_views_are_not_copies(scene):
+    a = makeNode(scene, "A")
+    nodes = scene.iterNodes()
+    b = makeNode(scene, "B")
+    assert list(nodes) == [a, b]
+    assert scene.nodes is not scene.nodes       # Copies, safe to remove nodes while iterating
+    for node in scene.nodes:
+        node.remove()
+    assert list(nodes) == []
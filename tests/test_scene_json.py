@@ -0,0 +1,95 @@
+import io
+import json
+import pytest
+from collections import OrderedDict
+from node_scene import Scene
+from node_scene_json import writeSceneJson, SceneJsonReader
+from conftest import makeNode, connect
+
+
+def sampleData(n=20):
+    return OrderedDict([
+        ('id', 123),
+        ('scene_width', 16000),
+        ('scene_height', 16000),
+        ('nodes', [{'id': i, 'title': "Node %d é" % i, 'pos_x': i * 1.5, 'content': {'text': "x" * i}} for i in range(n)]),
+        ('edges', [{'id': 1000 + i, 'start': i, 'end': i + 1} for i in range(n - 1)]),
+    ])
+
+
+@pytest.mark.parametrize("indent", [4, None])
+def test_output_is_the_same_as_json_dumps(indent):
+    data = sampleData()
+    file = io.StringIO()
+    writeSceneJson(file, dict(data, nodes=iter(data['nodes']), edges=(e for e in data['edges'])), indent=indent)
+    separators = (',', ':') if indent is None else (',', ': ')
+    assert file.getvalue() == json.dumps(data, indent=indent, separators=separators)
+
+
+def test_empty_lists():
+    data = OrderedDict([('id', 1), ('nodes', []), ('edges', [])])
+    file = io.StringIO()
+    writeSceneJson(file, data)
+    assert file.getvalue() == json.dumps(data, indent=4)
+    assert json.loads(file.getvalue()) == data
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 65536])
+def test_reader_streams_records_in_small_chunks(chunk_size):
+    data = sampleData()
+    text = json.dumps(data, indent=4)
+    data_read = SceneJsonReader(io.StringIO(text), chunk_size=chunk_size).read()
+
+    assert data_read['id'] == 123
+    assert not isinstance(data_read['nodes'], list)     # A generator, read one record at a time
+    assert list(data_read['nodes']) == data['nodes']
+    assert list(data_read['edges']) == data['edges']
+
+
+def test_reader_reads_members_after_the_records():
+    text = '{"nodes": [{"id": 1}], "edges": [], "id": 5, "scene_width": 10}'
+    data = SceneJsonReader(io.StringIO(text), chunk_size=4).read()
+    assert list(data['nodes']) == [{'id': 1}]
+    assert list(data['edges']) == []
+    assert data['id'] == 5
+    assert data['scene_width'] == 10
+
+
+def test_invalid_file_raises():
+    data = SceneJsonReader(io.StringIO('{"id": 1, "nodes": [{"id": 1} {"id": 2}]}')).read()
+    with pytest.raises(ValueError):
+        list(data['nodes'])
+
+
+def test_scene_round_trip(scene, tmp_path):
+    a, b = makeNode(scene, "A", pos=(1, 2)), makeNode(scene, "B", outputs=(1, 2))
+    connect(scene, a, b)
+    filename = str(tmp_path / "scene.json")
+    scene.saveToFile(filename)
+
+    loaded = Scene(headless=True)
+    loaded.loadFromFile(filename)
+    assert json.loads(json.dumps(loaded.serialize())) == json.loads(json.dumps(scene.serialize()))
+
+
+def test_invalid_file_leaves_an_empty_scene(scene, tmp_path):
+    for i in range(3):
+        makeNode(scene, "Node %d" % i)
+    other = Scene(headless=True)
+    nodes = [makeNode(other, "Other %d" % i) for i in range(2)]
+    connect(other, nodes[0], nodes[1])
+    filename = tmp_path / "broken.json"
+    other.saveToFile(str(filename))
+    text = filename.read_text()
+    filename.write_text(text[:text.index('"edges"') + 20])     # Cut in the middle of the edges
+
+    with pytest.raises(ValueError):
+        scene.loadFromFile(str(filename))
+    assert scene.nodes == [] and scene.edges == []
+
+    # Later changes can be undone
+    assert scene.history.recording
+    makeNode(scene, "New")
+    scene.history.storeHistory("Add node")
+    scene.history.undo()
+    assert scene.nodes == []
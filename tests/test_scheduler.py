@@ -0,0 +1,254 @@
+import threading
+import time
+import pytest
+from PySide6.QtCore import QEventLoop, QTimer
+from node_node import Node
+from node_scene_evaluator import EvaluationError
+from conftest import makeNode, connect
+
+
+class SleepNode(Node):
+    """ Sleeps for content_data['sleep'] seconds, then outputs the sum of its inputs plus content_data['value'] """
+    eval_cacheable = False
+
+    def evalImplementation(self, input_values):
+        time.sleep(self.content_data.get('sleep', 0))
+        self.threads.append(threading.current_thread())
+        return [sum(value or 0 for value in input_values) + self.content_data.get('value', 1)]
+
+
+class FailNode(Node):
+    eval_cacheable = False
+
+    def evalImplementation(self, input_values):
+        raise RuntimeError("broken")
+
+
+class DoubleNode(Node):
+    """ Evaluated in a process pool """
+    eval_pool = 'process'
+    eval_cacheable = False
+
+    @classmethod
+    def evalStatic(cls, input_values, params):
+        return [(input_values[0] or 0) * 2]
+
+
+def sleepNode(scene, title, sleep=0.0, value=1, inputs=(1,)):
+    node = makeNode(scene, title, inputs=inputs, node_type=SleepNode)
+    node.content_data.update(sleep=sleep, value=value)
+    node.threads = []
+    return node
+
+
+def test_independent_nodes_run_at_once(scene):
+    scene.scheduler.max_threads = 4
+    nodes = [sleepNode(scene, "n%d" % i, sleep=0.2) for i in range(4)]
+
+    started = time.monotonic()
+    values = scene.scheduler.evaluate(nodes)
+    assert time.monotonic() - started < 0.6
+    assert values == [[1]] * 4
+    assert not any(node.isDirty() for node in nodes)
+
+
+def test_dependencies_are_evaluated_first(scene):
+    a = sleepNode(scene, "a", value=2)
+    b = sleepNode(scene, "b", value=3)
+    total = sleepNode(scene, "total", value=0, inputs=(1, 1))
+    connect(scene, a, total, input=0)
+    connect(scene, b, total, input=1)
+
+    assert scene.scheduler.evaluate([total]) == [[5]]
+    assert scene.scheduler.last_evaluated[-1] is total
+    assert set(scene.scheduler.last_evaluated) == {a, b, total}
+
+    # Nothing is dirty anymore
+    scene.scheduler.evaluate([total])
+    assert scene.scheduler.last_evaluated == []
+
+
+def test_main_pool_runs_in_the_calling_thread(scene):
+    node = sleepNode(scene, "main")
+    scene.scheduler.setPool(SleepNode, 'main')
+    scene.scheduler.evaluate([node])
+    assert node.threads == [threading.current_thread()]
+
+
+def test_unknown_pool_is_refused(scene):
+    with pytest.raises(ValueError):
+        scene.scheduler.setPool(SleepNode, 'gpu')
+
+
+def test_failure_stops_the_nodes_after_it(scene):
+    ok = sleepNode(scene, "ok")
+    broken = makeNode(scene, "broken", node_type=FailNode)
+    after = sleepNode(scene, "after")
+    connect(scene, broken, after)
+
+    with pytest.raises(EvaluationError) as error:
+        scene.scheduler.evaluate([ok, after])
+    assert error.value.node is broken
+    assert isinstance(error.value.__cause__, RuntimeError)
+    assert broken.isDirty() and after.isDirty()
+    assert after.threads == []
+    assert not scene.scheduler.isEvaluating()
+
+
+def test_process_pool(scene):
+    scene.scheduler.max_processes = 1
+    source = sleepNode(scene, "source", value=21)
+    double = makeNode(scene, "double", node_type=DoubleNode)
+    connect(scene, source, double)
+
+    assert scene.scheduler.evaluate([double]) == [[42]]
+
+
+def test_start_does_not_block(qapp, scene):
+    a = sleepNode(scene, "a", sleep=0.1)
+    b = sleepNode(scene, "b")
+    connect(scene, a, b)
+    evaluated = []
+    scene.scheduler.nodeEvaluated.connect(evaluated.append)
+
+    loop = QEventLoop()
+    scene.scheduler.evaluationFinished.connect(loop.quit)
+    QTimer.singleShot(5000, loop.quit)
+    scene.scheduler.start([b])
+    assert scene.scheduler.isEvaluating()
+    loop.exec()
+
+    assert not scene.scheduler.isEvaluating()
+    assert evaluated == [a, b]
+    assert b.output_values == [2]
+
+
+def test_metrics(scene):
+    scene.scheduler.max_threads = 2
+    nodes = [sleepNode(scene, "n%d" % i, sleep=0.05) for i in range(4)]
+    scene.scheduler.evaluate(nodes)
+
+    metrics = scene.scheduler.getMetrics()
+    assert metrics['nodes'] == 4
+    assert metrics['running'] == 0
+    assert metrics['makespan'] >= 0.1
+    assert 0 < metrics['utilization']['thread'] <= 1
+
+
+class OrderNode(Node):
+    """ Records the order the nodes start in, and how many of them run at once """
+    eval_cacheable = False
+    log = []
+    running = 0
+    max_seen = 0
+    lock = threading.Lock()
+
+    def evalImplementation(self, input_values):
+        with OrderNode.lock:
+            OrderNode.log.append(self.title)
+            OrderNode.running += 1
+            OrderNode.max_seen = max(OrderNode.max_seen, OrderNode.running)
+        time.sleep(self.content_data.get('sleep', 0))
+        with OrderNode.lock:
+            OrderNode.running -= 1
+        return [None]
+
+
+class HeavyNode(OrderNode):
+    eval_max_running = 1
+
+
+@pytest.fixture
+def order_log():
+    OrderNode.log, OrderNode.running, OrderNode.max_seen = [], 0, 0
+    return OrderNode.log
+
+
+def chain(scene, count, node_type=OrderNode, title="chain"):
+    nodes = [makeNode(scene, "%s%d" % (title, i), node_type=node_type) for i in range(count)]
+    for a, b in zip(nodes, nodes[1:]):
+        connect(scene, a, b)
+    return nodes
+
+
+@pytest.mark.parametrize("ordering, first", [('critical_path', "chain0"), ('fifo', "short")])
+def test_critical_path_starts_first(scene, order_log, ordering, first):
+    scene.scheduler.max_threads = 1
+    scene.scheduler.ordering = ordering
+    shorts = [makeNode(scene, "short", node_type=OrderNode) for i in range(3)]
+    nodes = chain(scene, 3)
+
+    scene.scheduler.evaluate(shorts + nodes)
+    assert order_log[0] == first
+
+
+def test_priority_goes_before_critical_path(scene, order_log):
+    scene.scheduler.max_threads = 1
+    urgent = makeNode(scene, "urgent", node_type=OrderNode)
+    urgent.eval_priority = 1
+    nodes = chain(scene, 3)
+
+    scene.scheduler.evaluate(nodes + [urgent])
+    assert order_log[0] == "urgent"
+
+
+def test_max_running_of_a_type(scene, order_log):
+    scene.scheduler.max_threads = 4
+    heavy = [makeNode(scene, "heavy", node_type=HeavyNode) for i in range(3)]
+    for node in heavy: node.content_data['sleep'] = 0.05
+    light = [makeNode(scene, "light", node_type=OrderNode) for i in range(3)]
+
+    scene.scheduler.evaluate(heavy + light)
+    # The light nodes weren't held back by the heavy ones waiting for their turn
+    assert order_log.index("light") < 3
+    assert len(order_log) == 6
+
+
+def test_set_limits_and_memory(scene, order_log):
+    scene.scheduler.max_threads = 4
+    scene.scheduler.setLimits(OrderNode, max_memory=100)
+    nodes = [makeNode(scene, "n%d" % i, node_type=OrderNode) for i in range(4)]
+    for node in nodes:
+        node.eval_memory = 60
+        node.content_data['sleep'] = 0.02
+
+    scene.scheduler.evaluate(nodes)
+    assert OrderNode.max_seen == 1
+    assert len(order_log) == 4
+
+
+def test_dispatch_is_linear_in_ready_nodes(scene):
+    """ Each dispatch only looks at the first node of each queue, not at every ready node """
+    scene.scheduler.max_threads = 4
+    nodes = [makeNode(scene, "n", node_type=SleepNode) for i in range(2000)]
+    for node in nodes: node.threads = []
+
+    started = time.monotonic()
+    scene.scheduler.evaluate(nodes)
+    assert time.monotonic() - started < 3
+    metrics = scene.scheduler.getMetrics()
+    assert metrics['nodes'] == 2000 and metrics['queue_depth'] == 0
+
+
+def test_node_that_can_never_start_fails(scene):
+    scene.scheduler.setLimits(SleepNode, max_running=0)
+    node = sleepNode(scene, "n")
+
+    with pytest.raises(EvaluationError, match="limited to 0 running nodes") as error:
+        scene.scheduler.evaluate([node])
+    assert error.value.node is node
+    assert scene.scheduler.last_error is error.value
+    assert node.isDirty()
+
+
+def test_start_reports_a_node_that_can_never_start(qapp, scene):
+    scene.scheduler.setLimits(SleepNode, max_running=0)
+    node = sleepNode(scene, "n")
+    finished, failed = [], []
+    scene.scheduler.evaluationFinished.connect(lambda: finished.append(True))
+    scene.scheduler.evaluationFailed.connect(failed.append)
+
+    scene.scheduler.start([node])
+    qapp.processEvents()
+    assert finished == [] and len(failed) == 1
+    assert not scene.scheduler.isEvaluating()
@@ -0,0 +1,88 @@
+import pytest
+from node_node import Node
+from node_scene_shared import SharedPayload, isSharable, runInProcess, resolvePayloads, SHARED_PAYLOAD_MIN_SIZE
+from conftest import makeNode, connect
+
+
+class BytesNode(Node):
+    """ Outputs content_data['size'] bytes, in a process pool """
+    eval_pool = 'process'
+
+    @classmethod
+    def evalStatic(cls, input_values, params):
+        return [b"x" * params['size']]
+
+
+class LengthNode(Node):
+    eval_cacheable = False
+
+    def evalImplementation(self, input_values):
+        return [len(input_values[0])]
+
+
+@pytest.fixture
+def payload():
+    payload = SharedPayload.fromValue(b"abc" * 1000)
+    yield payload
+    payload.free()
+
+
+def test_payload_round_trip(payload):
+    assert bytes(payload.view()) == b"abc" * 1000
+    assert payload.toValue() == b"abc" * 1000
+
+
+def test_payload_is_freed_by_its_last_reader(payload):
+    payload.acquire(2)
+    payload.release()
+    assert not payload.isSpent()
+    payload.release()
+    assert payload.isSpent()
+    with pytest.raises(ValueError):
+        payload.view()
+
+
+def test_only_large_values_are_shared():
+    assert isSharable(b"x" * SHARED_PAYLOAD_MIN_SIZE)
+    assert not isSharable(b"x" * (SHARED_PAYLOAD_MIN_SIZE - 1))
+    assert not isSharable([1, 2, 3])
+
+
+def test_run_in_process_shares_large_outputs():
+    output_values = runInProcess(BytesNode, [], {'size': SHARED_PAYLOAD_MIN_SIZE})
+    try:
+        assert isinstance(output_values[0], SharedPayload)
+        assert bytes(resolvePayloads(output_values)[0]) == b"x" * SHARED_PAYLOAD_MIN_SIZE
+    finally:
+        output_values[0].free()
+
+    assert runInProcess(BytesNode, [], {'size': 10}) == [b"x" * 10]
+
+
+def test_cache_copies_small_payloads(scene, payload):
+    node = makeNode(scene, "n", node_type=BytesNode)
+    scene.cache.store(node, "key", [payload])
+    payload.free()
+    assert scene.cache.get("key") == [b"abc" * 1000]
+
+
+def test_cache_skips_large_payloads(scene, payload):
+    node = makeNode(scene, "n", node_type=BytesNode)
+    scene.cache.max_payload_size = payload.size - 1
+    scene.cache.store(node, "key", [payload])
+    assert scene.cache.get("key") is None
+    assert scene.cache.memory_size == 0
+
+
+def test_process_outputs_in_shared_memory(scene):
+    scene.scheduler.max_processes = 1
+    source = makeNode(scene, "bytes", inputs=(), node_type=BytesNode)
+    source.content_data['size'] = SHARED_PAYLOAD_MIN_SIZE * 2
+    lengths = [makeNode(scene, "len%d" % i, node_type=LengthNode) for i in range(2)]
+    for length in lengths:
+        connect(scene, source, length)
+
+    assert scene.scheduler.evaluate(lengths) == [[SHARED_PAYLOAD_MIN_SIZE * 2]] * 2
+    # Both readers are done, so the block was freed, and the source has to be evaluated again to be read
+    assert isinstance(source.output_values[0], SharedPayload)
+    assert source.output_values[0].isSpent() and source.isDirty()
@@ -0,0 +1,133 @@
+import threading
+import pytest
+from node_node import Node
+from node_scene_stream import NodeStream
+from conftest import makeNode, connect
+
+
+class RangeNode(Node):
+    """ Streams the numbers from 0 to content_data['count'], counting the items pulled from it """
+    eval_cacheable = False
+    eval_stream_buffer = 4
+
+    def evalImplementation(self, input_values):
+        def items():
+            for i in range(self.content_data.get('count', 10)):
+                self.pulled += 1
+                yield i
+        self.pulled = 0
+        return [items()]
+
+
+class SumNode(Node):
+    eval_cacheable = False
+
+    def evalImplementation(self, input_values):
+        return [sum(input_values[0])]
+
+
+def test_items_are_pulled_as_they_are_read():
+    pulled = []
+    def source():
+        for i in range(5):
+            pulled.append(i)
+            yield i
+
+    stream = NodeStream(source())
+    reader = stream.openReader()
+    assert next(reader) == 0
+    assert pulled == [0]
+    assert list(reader) == [1, 2, 3, 4]
+
+
+def test_readers_share_the_buffer():
+    stream = NodeStream(iter(range(10)), readers=2)
+    first, second = stream.openReader(), stream.openReader()
+    assert list(first) == list(range(10))
+    # The second reader hasn't read anything, so nothing was dropped
+    assert len(stream._buffer) == 10 and not stream.isSpent()
+    assert list(second) == list(range(10))
+    assert len(stream._buffer) == 0 and stream.isSpent()
+
+
+def test_spent_stream_cannot_be_read_again():
+    stream = NodeStream(iter(range(3)))
+    assert list(stream.openReader()) == [0, 1, 2]
+    with pytest.raises(ValueError):
+        stream.openReader()
+
+
+def test_fast_reader_waits_for_slow_reader_in_another_thread():
+    stream = NodeStream(iter(range(100)), readers=2, buffer_size=4)
+    fast, slow = stream.openReader(), stream.openReader()
+    slow_ready, go = threading.Event(), threading.Event()
+    results = {}
+
+    def readSlowly():
+        results['slow'] = [next(slow)]
+        slow_ready.set()
+        go.wait()
+        results['slow'].extend(slow)
+
+    def readFast():
+        results['fast'] = list(fast)
+
+    slow_thread = threading.Thread(target=readSlowly)
+    slow_thread.start()
+    slow_ready.wait()
+    fast_thread = threading.Thread(target=readFast)
+    fast_thread.start()
+
+    # The fast reader can't get more than buffer_size items ahead
+    fast_thread.join(0.2)
+    assert fast_thread.is_alive()
+    assert len(stream._buffer) <= 5
+
+    go.set()
+    slow_thread.join()
+    fast_thread.join()
+    assert results['fast'] == results['slow'] == list(range(100))
+
+
+def test_source_errors_reach_every_reader():
+    def source():
+        yield 1
+        raise RuntimeError("broken")
+
+    stream = NodeStream(source(), readers=2)
+    first, second = stream.openReader(), stream.openReader()
+    for reader in (first, second):
+        assert next(reader) == 1
+        with pytest.raises(RuntimeError):
+            next(reader)
+
+
+def test_deleted_reader_releases_the_buffer():
+    stream = NodeStream(iter(range(10)), readers=2)
+    first, second = stream.openReader(), stream.openReader()
+    del second
+    assert list(first) == list(range(10))
+    assert len(stream._buffer) == 0
+
+
+def test_stream_between_nodes(scene):
+    source = makeNode(scene, "range", inputs=(), node_type=RangeNode)
+    source.content_data['count'] = 100
+    total = makeNode(scene, "sum", node_type=SumNode)
+    connect(scene, source, total)
+
+    assert scene.evaluator.evaluate([total]) == [[sum(range(100))]]
+    assert isinstance(source.output_values[0], NodeStream)
+    # The stream was read, so the source has to produce it again for the next reader
+    assert source.isDirty()
+
+
+def test_stream_with_the_scheduler(scene):
+    source = makeNode(scene, "range", inputs=(), node_type=RangeNode)
+    source.content_data['count'] = 1000
+    totals = [makeNode(scene, "sum%d" % i, node_type=SumNode) for i in range(2)]
+    for total in totals:
+        connect(scene, source, total)
+
+    assert scene.scheduler.evaluate(totals) == [[sum(range(1000))]] * 2
+    assert source.pulled == 1000